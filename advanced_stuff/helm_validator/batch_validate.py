@@ -0,0 +1,342 @@
+"""Validação em lote (sem interface) de charts Helm com o HelmValidationSystem.
+
+Aceita diretórios de chart (ou o próprio diretório `templates/`), charts
+empacotados (`.tgz`) e árvores com vários charts. Cada template é validado
+em um pool de processos, com um limite global de chamadas simultâneas ao
+Ollama, e o resultado é emitido em JSON e/ou SARIF.
+
+Exemplos:
+    python batch_validate.py templates/ --json relatorio.json
+    python batch_validate.py charts/ meu-chart-0.1.0.tgz --workers 4 --max-llm-calls 2 --sarif relatorio.sarif
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from helm_validator import VALIDATION_DEADLINE_SECONDS, VALIDATION_PROMPTS, HelmValidationSystem
+from scheduler import LLMScheduler
+from validation_cache import ValidationCache
+
+logger = logging.getLogger(__name__)
+
+CHART_FILE_NAMES = ("Chart.yaml", "chart.yaml")
+TEMPLATE_EXTENSIONS = (".yaml", ".yml")
+PACKAGE_EXTENSIONS = (".tgz", ".tar.gz")
+
+# Instância do sistema de validação de cada processo do pool
+_worker_system = None
+_worker_fast_mode = False
+
+
+# --- Descoberta de Charts e Templates ---
+def find_chart_root(directory):
+    """Retorna a raiz do chart que contém `directory` (ele próprio ou o pai de `templates/`)."""
+    candidates = [directory]
+    if os.path.basename(os.path.normpath(directory)) == "templates":
+        candidates.append(os.path.dirname(os.path.normpath(directory)))
+    for candidate in candidates:
+        if any(os.path.isfile(os.path.join(candidate, name)) for name in CHART_FILE_NAMES):
+            return candidate
+    return None
+
+
+def extract_package(package_path, extract_dir):
+    """Extrai um chart empacotado (.tgz) e retorna o diretório de destino."""
+    target = os.path.join(extract_dir, os.path.basename(package_path))
+    os.makedirs(target, exist_ok=True)
+    with tarfile.open(package_path, "r:gz") as archive:
+        # O filtro "data" (Python 3.12+) bloqueia caminhos absolutos e links perigosos
+        if hasattr(tarfile, "data_filter"):
+            archive.extractall(target, filter="data")
+        else:
+            archive.extractall(target)
+    logger.info(f"Pacote {package_path} extraído em {target}")
+    return target
+
+
+def discover_charts(path, extract_dir):
+    """Lista (raiz_do_chart, rótulo) para um caminho de chart, pacote ou árvore de charts."""
+    if os.path.isfile(path) and path.endswith(PACKAGE_EXTENSIONS):
+        extracted = extract_package(path, extract_dir)
+        for chart_root, label in discover_charts(extracted, extract_dir):
+            yield chart_root, os.path.join(os.path.basename(path), os.path.relpath(chart_root, extracted))
+        return
+    if not os.path.isdir(path):
+        logger.warning(f"Caminho ignorado (não é diretório nem pacote .tgz): {path}")
+        return
+
+    chart_root = find_chart_root(path)
+    if chart_root:
+        yield chart_root, os.path.relpath(chart_root)
+        return
+
+    found = False
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        if any(name in filenames for name in CHART_FILE_NAMES):
+            found = True
+            yield dirpath, os.path.relpath(dirpath)
+            # Subcharts em charts/ são descobertos pelo próprio walk; templates/ não contém charts
+            dirnames[:] = [d for d in dirnames if d != "templates"]
+        for filename in sorted(filenames):
+            if filename.endswith(PACKAGE_EXTENSIONS):
+                found = True
+                yield from discover_charts(os.path.join(dirpath, filename), extract_dir)
+    if not found:
+        # Diretório solto de templates, sem Chart.yaml: valida cada arquivo com o scaffold mínimo
+        yield path, os.path.relpath(path)
+
+
+def load_chart_context(chart_root):
+    """Lê os arquivos de contexto do chart (Chart.yaml, values.yaml e helpers) para o scaffold."""
+    chart_files = {}
+    for name in CHART_FILE_NAMES:
+        chart_path = os.path.join(chart_root, name)
+        if os.path.isfile(chart_path):
+            with open(chart_path) as f:
+                chart_files["Chart.yaml"] = f.read()
+            break
+    values_path = os.path.join(chart_root, "values.yaml")
+    if os.path.isfile(values_path):
+        with open(values_path) as f:
+            chart_files["values.yaml"] = f.read()
+    templates_dir = os.path.join(chart_root, "templates")
+    if os.path.isdir(templates_dir):
+        for filename in sorted(os.listdir(templates_dir)):
+            if filename.startswith("_") and filename.endswith(".tpl"):
+                with open(os.path.join(templates_dir, filename)) as f:
+                    chart_files[os.path.join("templates", filename)] = f.read()
+    return chart_files
+
+
+def collect_jobs(chart_root, label):
+    """Gera um job de validação para cada template renderizável do chart."""
+    chart_files = load_chart_context(chart_root)
+    templates_dir = os.path.join(chart_root, "templates")
+    if not os.path.isdir(templates_dir):
+        templates_dir = chart_root
+    for filename in sorted(os.listdir(templates_dir)):
+        # Helpers (_*.tpl) entram como contexto; NOTES.txt e afins não são manifestos
+        if filename.startswith("_") or not filename.endswith(TEMPLATE_EXTENSIONS):
+            continue
+        template_path = os.path.join(templates_dir, filename)
+        if not os.path.isfile(template_path) or filename in CHART_FILE_NAMES or filename == "values.yaml":
+            continue
+        with open(template_path) as f:
+            content = f.read()
+        yield {
+            "chart": label,
+            "template": os.path.join(label, os.path.relpath(template_path, chart_root)),
+            "content": content,
+            "chart_files": chart_files,
+        }
+
+
+# --- Execução no Pool de Processos ---
+def _init_worker(ollama_url, ollama_model, llm_semaphore, max_llm_calls, use_cache, fast_mode, deadline_seconds, log_level):
+    """Inicializa o HelmValidationSystem uma única vez por processo do pool."""
+    global _worker_system, _worker_fast_mode
+    _worker_fast_mode = fast_mode
+    logging.getLogger().setLevel(log_level)
+    cache = ValidationCache() if use_cache else None
+    # O semáforo limita o lote inteiro; o escalonador local não deve ser mais restritivo que ele
+    _worker_system = HelmValidationSystem(
+        ollama_url, ollama_model, cache=cache, llm_gate=llm_semaphore,
+        scheduler=LLMScheduler(max_concurrent=max_llm_calls, max_queue=1024),
+        deadline_seconds=deadline_seconds
+    )
+
+
+def report_entry(job, results, duration):
+    """Registro de um template no relatório: apenas o resultado da validação, sem o estado interno.
+
+    Réplicas por mensagem, manifesto renderizado, fila, prazos e tempos por
+    estágio ficam de fora, para que o formato do relatório não dependa deles.
+    """
+    return {
+        "chart": job["chart"],
+        "template": job["template"],
+        "duration_seconds": round(duration, 3),
+        "technical_validations": results.get("technical_validations", {}),
+        "llm_validations": results.get("llm_validations", {}),
+        "summary": results.get("summary", ""),
+        "findings": results.get("rule_findings", []),
+        "incomplete_stages": sorted(results.get("deadline", {}).get("timed_out", [])) + sorted(results.get("stage_errors", {})),
+    }
+
+
+def _validate_job(job):
+    """Valida um template no processo do pool e devolve o registro para o relatório."""
+    start = time.perf_counter()
+    results = _worker_system.validate_template_content(
+        job["content"], chart_files=job["chart_files"], fast_mode=_worker_fast_mode
+    )
+    return report_entry(job, results, time.perf_counter() - start)
+
+
+def run_batch(paths, ollama_url, ollama_model, workers=None, max_llm_calls=4, use_cache=True, fast_mode=False,
+              deadline_seconds=VALIDATION_DEADLINE_SECONDS):
+    """Valida todos os templates encontrados em `paths` e retorna a lista de registros."""
+    entries = []
+    with tempfile.TemporaryDirectory(prefix="helm_batch_") as extract_dir:
+        jobs = []
+        for path in paths:
+            for chart_root, label in discover_charts(path, extract_dir):
+                jobs.extend(collect_jobs(chart_root, label))
+        logger.info(f"{len(jobs)} templates encontrados para validação.")
+        if not jobs:
+            return entries
+
+        context = multiprocessing.get_context()
+        # Semáforo global: limita as chamadas simultâneas ao Ollama somando todos os processos
+        llm_semaphore = context.BoundedSemaphore(max_llm_calls)
+        workers = workers or min(len(jobs), os.cpu_count() or 1)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(ollama_url, ollama_model, llm_semaphore, max_llm_calls, use_cache, fast_mode, deadline_seconds,
+                      logger.getEffectiveLevel()),
+        ) as executor:
+            future_to_job = {executor.submit(_validate_job, job): job for job in jobs}
+            for done, future in enumerate(as_completed(future_to_job), start=1):
+                job = future_to_job[future]
+                try:
+                    entry = future.result()
+                except Exception as exc:
+                    logger.exception(f"Falha ao validar {job['template']}: {exc}")
+                    entry = {"chart": job["chart"], "template": job["template"], "error": str(exc)}
+                entries.append(entry)
+                logger.info(f"[{done}/{len(jobs)}] {job['template']} concluído.")
+    entries.sort(key=lambda entry: entry["template"])
+    return entries
+
+
+# --- Relatórios ---
+def cli_level(output):
+    """Converte a saída de uma ferramenta CLI em nível SARIF (ou None se passou)."""
+    if not isinstance(output, str):
+        return "error"
+    if output.startswith("ERRO") or output.startswith("Erro inesperado"):
+        return "error"
+    if output.startswith("AVISO"):
+        return "warning"
+    return None
+
+
+RULE_SEVERITY_LEVELS = {"Crítico": "error", "Alto": "error", "Médio": "warning", "Baixo": "note"}
+
+
+def agent_level(analysis):
+    """Nível SARIF heurístico para a análise textual de um agente."""
+    if not isinstance(analysis, str) or analysis.startswith("ERRO"):
+        return "error"
+    if "Crítico" in analysis or "Alto" in analysis:
+        return "warning"
+    return "note"
+
+
+def build_json_report(entries, ollama_model, elapsed):
+    """Monta o relatório JSON consolidado do lote."""
+    failed = [entry for entry in entries if "error" in entry or any(
+        cli_level(output) == "error" for output in entry.get("technical_validations", {}).values()
+    )]
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "model": ollama_model,
+        "elapsed_seconds": round(elapsed, 3),
+        "templates": len(entries),
+        "templates_with_errors": len(failed),
+        "throughput_per_hour": round(len(entries) / elapsed * 3600, 1) if elapsed else None,
+        "entries": entries,
+    }
+
+
+def build_sarif_report(entries):
+    """Monta um relatório SARIF 2.1.0 com um resultado por ferramenta/agente e template."""
+    rules = [{"id": tool, "shortDescription": {"text": f"Validação técnica: {tool}"}} for tool in ("helm_lint", "schema")]
+    rules += [{"id": agent_type, "shortDescription": {"text": f"Análise LLM: {agent_type}"}} for agent_type in VALIDATION_PROMPTS]
+    rules.append({"id": "batch_error", "shortDescription": {"text": "Falha na execução da validação"}})
+    rule_ids = sorted({f["rule"] for entry in entries for f in entry.get("findings", [])})
+    rules += [{"id": rule_id, "shortDescription": {"text": f"Regra determinística {rule_id}"}} for rule_id in rule_ids]
+
+    sarif_results = []
+    for entry in entries:
+        location = [{"physicalLocation": {"artifactLocation": {"uri": entry["template"].replace(os.sep, "/")}}}]
+        if "error" in entry:
+            sarif_results.append({"ruleId": "batch_error", "level": "error", "message": {"text": entry["error"]}, "locations": location})
+            continue
+        for tool, output in entry.get("technical_validations", {}).items():
+            level = cli_level(output)
+            if level:
+                sarif_results.append({"ruleId": tool, "level": level, "message": {"text": output}, "locations": location})
+        for finding in entry.get("findings", []):
+            sarif_results.append({
+                "ruleId": finding["rule"],
+                "level": RULE_SEVERITY_LEVELS.get(finding["severity"], "warning"),
+                "message": {"text": f"{finding['resource']} ({finding['location']}): {finding['problem']}. Correção: {finding['fix']}"},
+                "locations": location,
+            })
+        for agent_type, analysis in entry.get("llm_validations", {}).items():
+            sarif_results.append({
+                "ruleId": agent_type,
+                "level": agent_level(analysis),
+                "message": {"text": analysis if isinstance(analysis, str) else str(analysis)},
+                "locations": location,
+            })
+    return {
+        "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {"name": "helm-validator", "informationUri": "https://github.com/manthysbr/llm_apps", "rules": rules}},
+            "results": sarif_results,
+        }],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validação em lote de charts Helm com agentes LLM e ferramentas CLI.")
+    parser.add_argument("paths", nargs="+", help="Diretórios de chart, diretórios templates/, pacotes .tgz ou árvores de charts")
+    parser.add_argument("--ollama-url", default="http://localhost:11434", help="URL do Ollama")
+    parser.add_argument("--model", default="codellama", help="Modelo LLM do Ollama")
+    parser.add_argument("--workers", type=int, default=None, help="Processos no pool (padrão: nº de CPUs)")
+    parser.add_argument("--max-llm-calls", type=int, default=4, help="Máximo global de chamadas simultâneas ao Ollama")
+    parser.add_argument("--json", dest="json_path", help="Arquivo de saída do relatório JSON ('-' para stdout)")
+    parser.add_argument("--sarif", dest="sarif_path", help="Arquivo de saída do relatório SARIF")
+    parser.add_argument("--no-cache", action="store_true", help="Não usa o cache persistente de resultados")
+    parser.add_argument("--fast", action="store_true", help="Segurança e Recursos apenas pelo motor de regras (sem LLM)")
+    parser.add_argument("--deadline", type=int, default=VALIDATION_DEADLINE_SECONDS,
+                        help="Prazo de cada template, em segundos (etapas atrasadas são marcadas como incompletas)")
+    parser.add_argument("--fail-on-error", action="store_true", help="Sai com código 1 se alguma validação técnica falhar")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    entries = run_batch(args.paths, args.ollama_url, args.model, workers=args.workers,
+                        max_llm_calls=args.max_llm_calls, use_cache=not args.no_cache, fast_mode=args.fast,
+                        deadline_seconds=args.deadline)
+    report = build_json_report(entries, args.model, time.perf_counter() - start)
+
+    if args.json_path == "-":
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    elif args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.sarif_path:
+        with open(args.sarif_path, "w") as f:
+            json.dump(build_sarif_report(entries), f, indent=2, ensure_ascii=False)
+
+    logger.info(f"{report['templates']} templates validados em {report['elapsed_seconds']}s "
+                f"({report['templates_with_errors']} com erros).")
+    return 1 if args.fail_on_error and report["templates_with_errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
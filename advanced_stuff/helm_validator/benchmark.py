@@ -0,0 +1,230 @@
+"""Benchmark offline do validador com um endpoint Ollama simulado.
+
+Sobe um servidor HTTP local que imita `/api/chat` do Ollama em streaming
+(o único modo que o validador usa), com latência e vazão de tokens configuráveis, e executa o
+validador sobre `deployment-teste.yaml`, `helm_test_template.yaml` e o chart
+de exemplo deste diretório. Reporta latência p50/p95, vazão e o tempo médio
+de cada estágio, para que regressões fiquem visíveis sem depender de um LLM.
+
+Exemplos:
+    python benchmark.py
+    python benchmark.py --latency 0.5 --tokens-per-second 30 --iterations 5 --stream --json bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_validate import collect_jobs
+from helm_validator import HelmValidationSystem
+from scheduler import LLMScheduler
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SINGLE_TEMPLATES = ("deployment-teste.yaml", "helm_test_template.yaml")
+FAKE_REPLY_WORDS = ("| Recurso | Problema | Severidade | Correção |", "- Verificação", "concluída:", "sem", "problemas", "críticos.")
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Responde a `/api/chat` como o Ollama, esperando `latency` e gerando `reply_tokens` a `tokens_per_second`."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("fake-ollama: " + format, *args)
+
+    def do_GET(self):
+        # `/api/tags` e afins: apenas o suficiente para verificações de disponibilidade
+        self._send_json({"models": [{"name": "fake"}]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        settings = self.server.settings
+        tokens = [FAKE_REPLY_WORDS[i % len(FAKE_REPLY_WORDS)] + " " for i in range(settings["reply_tokens"])]
+        interval = 1 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0
+        start = time.perf_counter()
+        time.sleep(settings["latency"])
+
+        # O validador sempre chama com `stream: true` (OllamaStreamClient)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(interval)
+            self._write_chunk({"model": request.get("model"), "message": {"role": "assistant", "content": token}, "done": False})
+        self._write_chunk(self._final_event(request, "", len(tokens), start))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _final_event(self, request, content, eval_count, start):
+        elapsed_ns = int((time.perf_counter() - start) * 1e9)
+        return {
+            "model": request.get("model"),
+            "created_at": datetime.now().isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed_ns,
+            "prompt_eval_count": sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", [])),
+            "eval_count": eval_count,
+            "eval_duration": max(elapsed_ns - int(self.server.settings["latency"] * 1e9), 1),
+        }
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_fake_ollama(latency, tokens_per_second, reply_tokens, port=0):
+    """Inicia o servidor simulado em uma thread e retorna (servidor, url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.settings = {"latency": latency, "tokens_per_second": tokens_per_second, "reply_tokens": reply_tokens}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def load_workloads():
+    """Templates avulsos do diretório e os templates do chart de exemplo (com seu contexto)."""
+    workloads = []
+    for filename in SINGLE_TEMPLATES:
+        with open(os.path.join(BASE_DIR, filename)) as f:
+            workloads.append({"template": filename, "content": f.read(), "chart_files": None})
+    for job in collect_jobs(BASE_DIR, "chart"):
+        workloads.append({"template": job["template"], "content": job["content"], "chart_files": job["chart_files"]})
+    return workloads
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        "runs": len(latencies),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "mean_s": round(statistics.fmean(latencies), 3),
+    }
+
+
+def run_benchmark(latency=0.2, tokens_per_second=50.0, reply_tokens=120, iterations=3, concurrency=1,
+                  max_llm_calls=2, stream=False, fast_mode=False):
+    """Executa o benchmark e retorna o relatório (latências, vazão e tempo médio por estágio)."""
+    server, url = start_fake_ollama(latency, tokens_per_second, reply_tokens)
+    try:
+        system = HelmValidationSystem(url, "fake-model", cache=None, scheduler=LLMScheduler(max_concurrent=max_llm_calls))
+        workloads = load_workloads()
+        on_token = (lambda key, token: None) if stream else None
+        runs = [workload for _ in range(iterations) for workload in workloads]
+        samples = []
+
+        def validate(workload):
+            start = time.perf_counter()
+            results = system.validate_template_content(
+                workload["content"], use_cache=False, chart_files=workload["chart_files"], fast_mode=fast_mode,
+                on_token=on_token, session_id=f"bench-{threading.get_ident()}"
+            )
+            return workload["template"], time.perf_counter() - start, results
+
+        wall_start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                samples = list(executor.map(validate, runs))
+        else:
+            for done, workload in enumerate(runs, start=1):
+                samples.append(validate(workload))
+                logger.info(f"[{done}/{len(runs)}] {workload['template']}: {samples[-1][1]:.2f}s")
+        elapsed = time.perf_counter() - wall_start
+    finally:
+        server.shutdown()
+
+    stage_samples = {}
+    for _, _, results in samples:
+        for stage, seconds in results.get("timings", {}).items():
+            stage_samples.setdefault(stage, []).append(seconds)
+    by_template = {}
+    for template, seconds, _ in samples:
+        by_template.setdefault(template, []).append(seconds)
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "settings": {
+            "latency_s": latency, "tokens_per_second": tokens_per_second, "reply_tokens": reply_tokens,
+            "iterations": iterations, "concurrency": concurrency, "max_llm_calls": max_llm_calls,
+            "stream": stream, "fast_mode": fast_mode, "helm": bool(system.helm_path),
+        },
+        "overall": summarize([seconds for _, seconds, _ in samples]),
+        "throughput_per_minute": round(len(samples) / elapsed * 60, 2) if elapsed else None,
+        "elapsed_s": round(elapsed, 3),
+        "templates": {template: summarize(values) for template, values in by_template.items()},
+        "stages_mean_s": {stage: round(statistics.fmean(values), 4) for stage, values in sorted(stage_samples.items())},
+    }
+
+
+def format_report(report):
+    """Formata o relatório do benchmark como texto para o terminal."""
+    overall = report["overall"]
+    lines = [
+        f"Validações: {overall['runs']} em {report['elapsed_s']}s | "
+        f"p50 {overall['p50_s']}s | p95 {overall['p95_s']}s | {report['throughput_per_minute']} validações/min",
+        "",
+        f"{'Template':<45} {'p50 (s)':>8} {'p95 (s)':>8}",
+    ]
+    for template, stats in report["templates"].items():
+        lines.append(f"{template:<45} {stats['p50_s']:>8} {stats['p95_s']:>8}")
+    lines += ["", f"{'Estágio':<30} {'média (s)':>10}"]
+    for stage, seconds in sorted(report["stages_mean_s"].items(), key=lambda item: -item[1]):
+        lines.append(f"{stage:<30} {seconds:>10}")
+    if not report["settings"]["helm"]:
+        lines += ["", "Aviso: 'helm' não encontrado; renderização e lint falham rapidamente e os agentes recebem o template bruto."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do validador Helm com um Ollama simulado.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Latência até o primeiro token, em segundos")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Vazão de geração simulada")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Tokens em cada resposta simulada")
+    parser.add_argument("--iterations", type=int, default=3, help="Repetições de cada template")
+    parser.add_argument("--concurrency", type=int, default=1, help="Validações simultâneas (simula várias sessões)")
+    parser.add_argument("--max-llm-calls", type=int, default=2, help="Chamadas LLM simultâneas admitidas pelo escalonador")
+    parser.add_argument("--stream", action="store_true", help="Passa um callback `on_token` (mede o custo de entregar cada token, como a interface faz)")
+    parser.add_argument("--fast", action="store_true", help="Modo rápido (Segurança e Recursos apenas pelo motor de regras)")
+    parser.add_argument("--json", dest="json_path", help="Arquivo de saída do relatório JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, reply_tokens=args.reply_tokens,
+        iterations=args.iterations, concurrency=args.concurrency, max_llm_calls=args.max_llm_calls,
+        stream=args.stream, fast_mode=args.fast,
+    )
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
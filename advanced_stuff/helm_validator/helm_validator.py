@@ -2,14 +2,28 @@ import streamlit as st
 import yaml
 import json
 import os
-import tempfile
 import subprocess
 import re
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
 from autogen.agentchat.assistant_agent import AssistantAgent
 from autogen.agentchat.user_proxy_agent import UserProxyAgent
+from validation_cache import ValidationCache, content_hash
+from token_budget import TokenCounter, condense_sections
+from pipeline import StageGraph
+from ollama_stream import OllamaStreamClient
+from rule_engine import LLM_REMAINING_SCOPE, RULE_COVERAGE, format_findings, resource_key, run_rules
+from routing import merge_shard_replies, reshard_documents, route_documents, shard_documents
+from schema_validator import COMMON_KINDS, SchemaValidator, format_schema_report
+from workspace_pool import WorkspacePool
+from scheduler import PRIORITY_AGENT, PRIORITY_COORDINATOR, LLMScheduler, QueueFullError
+from values_matrix import SharedReplies, build_matrix, group_by_manifest, helm_values_args, lint_summary, parse_override_axis
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,45 +34,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def chunk_message(message, max_tokens=1500):
-    """Divide uma mensagem longa em partes menores para evitar truncamento."""
-    if len(message) <= max_tokens:
-        return message
-    
-    # Dividir preservando parágrafos
-    chunks = []
-    paragraphs = message.split('\n\n')
-    current_chunk = ""
-    
-    for para in paragraphs:
-        if len(current_chunk) + len(para) + 2 <= max_tokens:
-            if current_chunk:
-                current_chunk += "\n\n" + para
-            else:
-                current_chunk = para
-        else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            if len(para) > max_tokens:
-                # Caso um parágrafo seja muito longo, divida-o
-                words = para.split()
-                current_chunk = ""
-                for word in words:
-                    if len(current_chunk) + len(word) + 1 <= max_tokens:
-                        if current_chunk:
-                            current_chunk += " " + word
-                        else:
-                            current_chunk = word
-                    else:
-                        chunks.append(current_chunk)
-                        current_chunk = word
-            else:
-                current_chunk = para
-    
-    if current_chunk:
-        chunks.append(current_chunk)
-    
-    return chunks[0] + "\n\n[Mensagem truncada devido ao tamanho]"
+# --- Orçamento de Contexto ---
+CONTEXT_WINDOW = 8192          # num_ctx solicitado ao Ollama
+RESERVED_OUTPUT_TOKENS = 1536  # espaço reservado para a resposta do coordenador
+CONDENSE_CHUNK_TOKENS = 2048   # tamanho de cada trecho enviado ao condensador
+
+# --- Prazos ---
+VALIDATION_DEADLINE_SECONDS = 300  # orçamento de latência de uma validação completa
+COORDINATOR_RESERVE_SECONDS = 60   # parte do orçamento reservada ao coordenador (os agentes param antes)
+CLI_TIMEOUT_SECONDS = 60           # prazo de cada comando helm/kubeval
+TIMEOUT_PREFIX = "ERRO: Tempo esgotado"
+
+CONDENSER_PROMPT = """
+Você condensa análises de validação de templates Helm/Kubernetes.
+Reescreva o texto recebido de forma compacta, PRESERVANDO TODOS os problemas encontrados,
+com severidade, recurso/campo afetado e correção sugerida. Remova apenas explicações
+repetidas, exemplos longos e texto introdutório. Responda somente com o texto condensado.
+"""
+
+def compact_cli_output(output):
+    """Compacta a saída de uma ferramenta CLI sem LLM: remove linhas de sucesso e duplicadas."""
+    if not isinstance(output, str):
+        return str(output)
+    lines, seen = [], set()
+    for line in output.splitlines():
+        stripped = line.strip()
+        # Linhas "PASS - ..." do kubeval e da validação de schema não trazem informação para o relatório
+        if not stripped or stripped.startswith("PASS") or stripped in seen:
+            continue
+        seen.add(stripped)
+        lines.append(line)
+    return "\n".join(lines) if lines else output.strip()
 
 def extract_llm_content(response):
     """
@@ -99,18 +105,46 @@ def extract_llm_content(response):
     except:
         return f"Não foi possível extrair conteúdo: {str(response)[:100]}..."
 
-# --- Configurações Streamlit ---
-st.set_page_config(page_title="Validador AG2 de Templates Helm", layout="wide")
-
-# --- Configuração do Ollama ---
-st.sidebar.header("Configuração do Ollama")
-ollama_url = st.sidebar.text_input("URL do Ollama", value="http://localhost:11434")
-ollama_model = st.sidebar.selectbox(
-    "Modelo LLM",
-    ["codellama", "llama3.2", "mistral", "deepseek-coder-v2:latest", "gemma"],
-    index=0,
-    help="Modelos como CodeLlama ou Llama 3.2 são recomendados para análise de código."
-)
+def is_cacheable_result(value):
+    """Indica se o resultado de um estágio pode ser armazenado no cache.
+
+    Falhas de ambiente ou de execução ("ERRO: ...", "Erro inesperado...") não são
+    cacheadas; já erros determinísticos das ferramentas ("ERRO (Código 1)...",
+    "ERRO (schema)...") fazem parte do resultado da validação e podem ser.
+    """
+    if isinstance(value, dict):
+        return True
+    if not isinstance(value, str):
+        return False
+    return not (value.startswith("ERRO:") or value.startswith("Erro inesperado"))
+
+def is_timed_out(value):
+    """Indica se o resultado de um estágio foi substituído por falta de tempo."""
+    return isinstance(value, str) and value.startswith(TIMEOUT_PREFIX)
+
+def diff_resources(previous_hashes, current_hashes):
+    """Compara os recursos de duas validações ({recurso: hash}) e lista os adicionados, alterados, removidos e inalterados."""
+    return {
+        "added": sorted(set(current_hashes) - set(previous_hashes)),
+        "removed": sorted(set(previous_hashes) - set(current_hashes)),
+        "changed": sorted(key for key in current_hashes if key in previous_hashes and previous_hashes[key] != current_hashes[key]),
+        "unchanged": sorted(key for key in current_hashes if previous_hashes.get(key) == current_hashes[key]),
+    }
+
+def parse_manifests(manifest):
+    """Converte o stream de manifestos renderizados em uma lista de documentos (ignora documentos vazios)."""
+    try:
+        return [doc for doc in yaml.safe_load_all(manifest) if isinstance(doc, dict)]
+    except yaml.YAMLError as e:
+        logger.warning(f"Não foi possível interpretar os manifestos: {e}")
+        return []
+
+def describe_resources(documents):
+    """Lista os recursos renderizados no formato 'Kind/nome'."""
+    return [resource_key(doc) for doc in documents]
+
+# Contexto de sistema enviado junto ao prompt do coordenador
+COORDINATOR_CONTEXT = "Você é um especialista em avaliação de templates Helm."
 
 # --- Prompts Refinados para Agentes Especializados ---
 VALIDATION_PROMPTS = {
@@ -194,17 +228,41 @@ VALIDATION_PROMPTS = {
     """
 }
 
+# Agentes que analisam o template bruto (a sintaxe Go template só existe antes da renderização).
+# Os demais recebem os manifestos já renderizados, menores e sem ruído de template.
+RAW_TEMPLATE_AGENTS = ("sintaxe",)
+
 # --- Classe Principal do Sistema de Validação ---
 class HelmValidationSystem:
     """Sistema para validar templates Helm usando LLMs e ferramentas CLI."""
 
-    def __init__(self, ollama_url, ollama_model):
+    def __init__(self, ollama_url, ollama_model, cache=None, llm_gate=None, context_window=CONTEXT_WINDOW, tokenizer=None,
+                 schema_validator=None, workspace_pool=None, scheduler=None, cli_timeout=CLI_TIMEOUT_SECONDS,
+                 deadline_seconds=VALIDATION_DEADLINE_SECONDS):
         self.ollama_url = ollama_url
         self.ollama_model = ollama_model
+        self.context_window = context_window
+        self.cli_timeout = cli_timeout
+        self.deadline_seconds = deadline_seconds
+        # Usa o tokenizer do modelo se fornecido; caso contrário, uma aproximação rápida
+        self.token_counter = TokenCounter(tokenizer)
         self.helm_path = self._find_executable("helm")
         self.kubeval_path = self._find_executable("kubeval")
+        # Validação de schema em processo; o kubeval só é usado se não houver schemas locais
+        self.schema_validator = schema_validator or SchemaValidator()
+        # Scaffolds de chart reutilizados entre validações (em vez de um diretório temporário por chamada)
+        self.workspace_pool = workspace_pool or WorkspacePool()
+        self.cache = cache
+        # Limite opcional de chamadas LLM simultâneas (ex: semáforo compartilhado entre processos)
+        self.llm_gate = llm_gate
+        # Fila de admissão compartilhada: limita as chamadas simultâneas ao Ollama deste processo
+        self.scheduler = scheduler or LLMScheduler()
+        self._results_lock = threading.Lock()
         self.initialize_agents()
-        logger.info(f"HelmValidationSystem inicializado com model={ollama_model}, helm={self.helm_path}, kubeval={self.kubeval_path}")
+        self.stream_client = OllamaStreamClient(
+            ollama_url, ollama_model, options={"temperature": 0.1, "num_ctx": self.context_window}
+        )
+        logger.info(f"HelmValidationSystem inicializado com model={ollama_model}, helm={self.helm_path}, kubeval={self.kubeval_path}, schemas={self.schema_validator.available}")
 
     def _find_executable(self, name):
         """Encontra o caminho de um executável no PATH."""
@@ -224,6 +282,7 @@ class HelmValidationSystem:
                 "base_url": self.ollama_url,
                 "api_type": "ollama",
                 "temperature": 0.1, # Temperatura baixa para respostas mais determinísticas
+                "num_ctx": self.context_window,
             }]
         }
         for agent_type, prompt in VALIDATION_PROMPTS.items():
@@ -247,7 +306,12 @@ class HelmValidationSystem:
             """,
             llm_config=llm_config
         )
-        logger.info(f"Agentes LLM inicializados: {list(self.agents.keys())}, Coordinator")
+        self.condenser_agent = AssistantAgent(
+            name="FindingsCondenser",
+            system_message=CONDENSER_PROMPT,
+            llm_config=llm_config
+        )
+        logger.info(f"Agentes LLM inicializados: {list(self.agents.keys())}, Coordinator, Condenser")
 
     def _run_command(self, command, cwd=None):
         """Executa um comando de shell e retorna stdout ou erro."""
@@ -258,7 +322,8 @@ class HelmValidationSystem:
                 capture_output=True,
                 text=True,
                 check=False, # Não lança exceção em caso de erro, tratamos pelo returncode
-                cwd=cwd
+                cwd=cwd,
+                timeout=self.cli_timeout
             )
             if result.returncode == 0:
                 logger.debug(f"Comando bem-sucedido. Output: {result.stdout[:100]}...")
@@ -267,6 +332,9 @@ class HelmValidationSystem:
             else:
                 logger.warning(f"Comando falhou (código {result.returncode}). Erro: {result.stderr}")
                 return f"ERRO (Código {result.returncode}): {result.stderr}"
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Comando excedeu {self.cli_timeout}s e foi encerrado: {command}")
+            return f"{TIMEOUT_PREFIX}: '{' '.join(command[:2])}' não terminou em {self.cli_timeout}s e foi encerrado."
         except FileNotFoundError:
             logger.error(f"Erro: Comando '{command[0]}' não encontrado.")
             return f"ERRO: Comando '{command[0]}' não encontrado. Verifique a instalação e o PATH."
@@ -274,42 +342,70 @@ class HelmValidationSystem:
             logger.exception(f"Erro inesperado ao executar comando: {command}")
             return f"Erro inesperado ao executar comando: {str(e)}"
 
-    def helm_lint(self, chart_dir):
-        """Executa 'helm lint --strict' no diretório do chart."""
+    def helm_lint(self, chart_dir, values=None):
+        """Executa 'helm lint --strict' no diretório do chart (com os values da combinação, se houver)."""
         if not self.helm_path:
             return "ERRO: Executável 'helm' não encontrado."
         # Verifica se Chart.yaml existe, senão o lint falha
         if not os.path.exists(os.path.join(chart_dir, "Chart.yaml")):
              logger.warning(f"Arquivo Chart.yaml não encontrado em {chart_dir}. 'helm lint' pode falhar.")
              # Poderia criar um dummy Chart.yaml aqui se necessário
-        return self._run_command([self.helm_path, "lint", "--strict", chart_dir], cwd=chart_dir)
+        return self._run_command([self.helm_path, "lint", "--strict", chart_dir] + helm_values_args(values), cwd=chart_dir)
+
+    def render_chart(self, chart_dir, values=None):
+        """Executa 'helm template' uma única vez e retorna {"manifest": str, "error": str ou None}.
 
-    def helm_template_validate(self, chart_dir):
-        """Executa 'helm template' e valida com 'kubeval'."""
+        `values` ({files, set}) adiciona os argumentos `-f`/`--set` de uma combinação da matriz de values.
+        """
         if not self.helm_path:
-            return "ERRO: Executável 'helm' não encontrado."
-        if not self.kubeval_path:
-            return "ERRO: Executável 'kubeval' não encontrado. Instale-o para validação de schema."
+            return {"manifest": "", "error": "ERRO: Executável 'helm' não encontrado."}
 
-        logger.info(f"Executando helm template | kubeval em {chart_dir}")
+        logger.info(f"Executando helm template em {chart_dir}")
         try:
-            # Executa helm template
             template_process = subprocess.Popen(
-                [self.helm_path, "template", chart_dir],
+                [self.helm_path, "template", chart_dir] + helm_values_args(values),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
                 cwd=chart_dir
             )
-            template_stdout, template_stderr = template_process.communicate()
+            try:
+                template_stdout, template_stderr = template_process.communicate(timeout=self.cli_timeout)
+            except subprocess.TimeoutExpired:
+                template_process.kill()
+                template_process.communicate()
+                logger.warning(f"helm template excedeu {self.cli_timeout}s e foi encerrado.")
+                return {"manifest": "", "error": f"{TIMEOUT_PREFIX}: 'helm template' não terminou em {self.cli_timeout}s."}
 
             if template_process.returncode != 0:
                 logger.warning(f"helm template falhou: {template_stderr}")
-                return f"ERRO (helm template): {template_stderr}"
+                return {"manifest": "", "error": f"ERRO (helm template): {template_stderr}"}
             if not template_stdout.strip():
-                 logger.warning(f"helm template não gerou output para {chart_dir}")
-                 return "AVISO: 'helm template' não gerou nenhum manifesto YAML."
+                logger.warning(f"helm template não gerou output para {chart_dir}")
+                return {"manifest": "", "error": "AVISO: 'helm template' não gerou nenhum manifesto YAML."}
+            return {"manifest": template_stdout, "error": None}
 
+        except FileNotFoundError as e:
+            logger.error(f"Erro: Comando '{e.filename}' não encontrado.")
+            return {"manifest": "", "error": f"ERRO: Comando '{e.filename}' não encontrado. Verifique a instalação e o PATH."}
+        except Exception as e:
+            logger.exception("Erro inesperado durante helm template")
+            return {"manifest": "", "error": f"Erro inesperado durante helm template: {str(e)}"}
+
+    def helm_template_validate(self, chart_dir, rendered=None):
+        """Valida com 'kubeval' os manifestos de 'helm template' (reaproveita `rendered` se fornecido)."""
+        if not self.helm_path:
+            return "ERRO: Executável 'helm' não encontrado."
+        if not self.kubeval_path:
+            return "ERRO: Executável 'kubeval' não encontrado. Instale-o para validação de schema."
+
+        if rendered is None:
+            rendered = self.render_chart(chart_dir)
+        if rendered["error"]:
+            return rendered["error"]
+
+        logger.info("Executando kubeval sobre os manifestos renderizados")
+        try:
             # Executa kubeval com o output do helm template
             kubeval_process = subprocess.Popen(
                 [self.kubeval_path, "--strict", "-"], # Lê do stdin
@@ -318,7 +414,13 @@ class HelmValidationSystem:
                 stderr=subprocess.PIPE,
                 text=True
             )
-            kubeval_stdout, kubeval_stderr = kubeval_process.communicate(input=template_stdout)
+            try:
+                kubeval_stdout, kubeval_stderr = kubeval_process.communicate(input=rendered["manifest"], timeout=self.cli_timeout)
+            except subprocess.TimeoutExpired:
+                kubeval_process.kill()
+                kubeval_process.communicate()
+                logger.warning(f"kubeval excedeu {self.cli_timeout}s e foi encerrado.")
+                return f"{TIMEOUT_PREFIX}: 'kubeval' não terminou em {self.cli_timeout}s."
 
             if kubeval_process.returncode == 0:
                 logger.info("kubeval passou.")
@@ -333,9 +435,21 @@ class HelmValidationSystem:
              logger.error(f"Erro: Comando '{e.filename}' não encontrado.")
              return f"ERRO: Comando '{e.filename}' não encontrado. Verifique a instalação e o PATH."
         except Exception as e:
-            logger.exception("Erro inesperado durante helm template | kubeval")
+            logger.exception("Erro inesperado durante kubeval")
             return f"Erro inesperado durante validação com Kubeval: {str(e)}"
 
+    def schema_validate(self, chart_dir, rendered):
+        """Valida os manifestos renderizados contra os schemas locais, sem subprocesso; sem schemas, usa o kubeval."""
+        if not self.schema_validator.available:
+            return self.helm_template_validate(chart_dir, rendered=rendered)
+        if rendered["error"]:
+            return rendered["error"]
+        start = time.perf_counter()
+        report = self.schema_validator.validate_documents(rendered["documents"])
+        elapsed = time.perf_counter() - start
+        logger.info(f"Validação de schema: {len(report)} documento(s) em {elapsed * 1000:.2f} ms.")
+        return format_schema_report(report)
+
     def check_dependencies(self, chart_dir):
         """Executa 'helm dependency build' se Chart.yaml existir."""
         if not self.helm_path:
@@ -357,285 +471,1122 @@ class HelmValidationSystem:
         else:
             return "Arquivo Chart.yaml não encontrado, impossível verificar dependências."
 
-    def validate_template_content(self, template_content):
-        """Executa a validação completa do conteúdo do template YAML."""
+    def _call_deadline(self, results, priority):
+        """Instante (time.time) limite de uma chamada LLM: agentes param antes do coordenador."""
+        deadline = results["deadline"]
+        if priority == PRIORITY_AGENT:
+            return deadline["expires_at"] - deadline["budget_s"] + deadline["agents_budget_s"]
+        return deadline["expires_at"]
+
+    @contextmanager
+    def _llm_slot(self, results, priority=PRIORITY_AGENT):
+        """Reserva a vez de uma chamada LLM no escalonador (e no limite entre processos, se houver).
+
+        Acumula em `results["queue"]` o tempo de espera na fila e o tempo de atendimento.
+        """
+        queue_info = results["queue"]
+        remaining = self._call_deadline(results, priority) - time.time()
+        if remaining <= 0:
+            raise TimeoutError("prazo da validação esgotado antes da chamada ao LLM")
+        timing = {}
+        try:
+            with self.scheduler.slot(queue_info["session"], priority, timeout=remaining) as timing:
+                with self.llm_gate if self.llm_gate is not None else nullcontext():
+                    yield
+        finally:
+            if timing:
+                with self._results_lock:
+                    queue_info["calls"] += 1
+                    queue_info["wait_s"] += timing["wait_s"]
+                    queue_info["service_s"] += timing["service_s"]
+
+    # --- Cache de Resultados ---
+    def _stage_key(self, stage, template_content, chart_files=None, values=None):
+        """Calcula a chave de cache de um estágio individual da validação."""
+        if stage in ("helm_lint", "render"):
+            return content_hash(stage, template_content, chart_files or {}, values or {}, self.helm_path)
+        if stage == "schema":
+            validator = self.schema_validator.fingerprint if self.schema_validator.available else self.kubeval_path
+            return content_hash(stage, template_content, chart_files or {}, values or {}, self.helm_path, validator)
+        # Agentes LLM: dependem da entrada enviada, do modelo, do endpoint e do próprio prompt
+        return content_hash(stage, template_content, self.ollama_model, self.ollama_url, VALIDATION_PROMPTS[stage])
+
+    def _validation_key(self, template_content, chart_files=None, fast_mode=False, values=None):
+        """Calcula a chave de cache do resultado completo (conteúdo, modelo, URL e todos os prompts)."""
+        return content_hash(
+            "validation", template_content, chart_files or {}, values or {}, fast_mode, self.ollama_model, self.ollama_url,
+            sorted(VALIDATION_PROMPTS.items()), self.coordinator_agent.system_message,
+            self.helm_path, self.kubeval_path, self.schema_validator.fingerprint
+        )
+
+    def _cache_get(self, stage, key, results):
+        """Consulta o cache (se habilitado) e registra hit/miss no dicionário de resultados."""
+        if self.cache is None:
+            return None
+        value = self.cache.get(stage, key)
+        results["cache"]["hits" if value is not None else "misses"].append(stage)
+        return value
+
+    def _cache_put(self, stage, key, value):
+        """Armazena o resultado de um estágio no cache, se for cacheável."""
+        if self.cache is not None and is_cacheable_result(value):
+            self.cache.put(stage, key, value)
+
+    # --- Estágios do Pipeline ---
+    def _run_cli_stage(self, tool, check, chart_dir, template_content, chart_files, results, cache_enabled, values=None):
+        """Executa uma validação técnica (helm lint/schema), consultando o cache antes."""
+        stage_key = self._stage_key(tool, template_content, chart_files, values)
+        output = self._cache_get(tool, stage_key, results) if cache_enabled else None
+        if output is None:
+            output = check(chart_dir)
+            if cache_enabled:
+                self._cache_put(tool, stage_key, output)
+        return output
+
+    def _run_render_stage(self, chart_dir, template_content, chart_files, results, cache_enabled, values=None, rendered=None):
+        """Renderiza o chart uma única vez e interpreta os documentos para os estágios seguintes.
+
+        `rendered` (já renderizado pela matriz de values) dispensa o cache e o 'helm template'.
+        """
+        stage_key = self._stage_key("render", template_content, chart_files, values)
+        if rendered is None and cache_enabled:
+            rendered = self._cache_get("render", stage_key, results)
+        if rendered is None:
+            rendered = self.render_chart(chart_dir, values)
+            if cache_enabled and is_cacheable_result(rendered["error"] or ""):
+                self._cache_put("render", stage_key, rendered)
+        if rendered["manifest"]:
+            documents = parse_manifests(rendered["manifest"])
+        else:
+            # Sem helm (ou falha na renderização): YAML puro ainda pode ser analisado pelas regras
+            documents = parse_manifests(template_content)
+        return {**rendered, "documents": documents}
+
+    def _agent_message(self, agent_type, yaml_text, rendered, findings=None):
+        """Monta a mensagem de um agente para um trecho YAML (manifestos renderizados ou template bruto)."""
+        if rendered:
+            message = (
+                "Analise os seguintes manifestos Kubernetes, renderizados a partir de um template Helm:"
+                f"\n\n```yaml\n{yaml_text}\n```\n\nForneça sua análise de acordo com seu CONTEXTO e TAREFA."
+            )
+        else:
+            message = f"Analise o seguinte template Helm Kubernetes:\n\n```yaml\n{yaml_text}\n```\n\nForneça sua análise de acordo com seu CONTEXTO e TAREFA."
+        if findings is not None and agent_type in RULE_COVERAGE:
+            # As regras já decidiram a parte mecânica; o agente só responde o que elas não cobrem
+            message += (
+                "\n\nACHADOS DETERMINÍSTICOS (já verificados por regras, NÃO repita nem reavalie):\n"
+                f"{format_findings(findings, agent_type)}\n\n"
+                f"Concentre-se apenas em: {LLM_REMAINING_SCOPE[agent_type]}."
+            )
+        return message
+
+    def _run_routed_agent_stage(self, agent_type, template_content, render, findings, fast_mode, results, cache_enabled,
+                                on_token=None, previous=None, shared=None):
+        """Executa um agente apenas sobre os recursos roteados para ele, em shards paralelos.
+
+        Para os agentes cobertos pelo motor de regras, os achados determinísticos
+        vêm antes da análise complementar (ou sozinhos, no modo rápido).
+        Com `previous` (resultado da validação anterior), os shards da execução
+        anterior são mantidos e as respostas de shards inalterados são reaproveitadas.
+        """
+        reuse = (previous or {}).get("agent_replies")
+        documents = render["documents"]
+        is_rendered = bool(render["manifest"])
+        covered = agent_type in RULE_COVERAGE
+        rules_report = f"#### Achados das Regras Determinísticas\n{format_findings(findings, agent_type)}" if covered else ""
+        if covered and fast_mode:
+            # O modo rápido nunca chama o LLM para agentes cobertos pelas regras, nem sem manifestos
+            note = "_Modo rápido: análise complementar por LLM não executada._"
+            if not documents:
+                note = "_Modo rápido: sem manifestos para analisar; análise por LLM não executada._"
+            return f"{rules_report}\n\n{note}"
+
+        if agent_type in RAW_TEMPLATE_AGENTS or not documents:
+            # Template bruto (sintaxe Go template) ou nada interpretável para rotear
+            if is_rendered and agent_type not in RAW_TEMPLATE_AGENTS:
+                message = self._agent_message(agent_type, render["manifest"], rendered=True)
+            else:
+                message = self._agent_message(agent_type, template_content, rendered=False)
+            return self._run_agent_stage(agent_type, message, results, cache_enabled, on_token, reuse=reuse, shared=shared)
+
+        routed = route_documents(documents, [agent_type]).get(agent_type, documents)
+        if not routed:
+            kinds = ", ".join(sorted({str(doc.get("kind")) for doc in documents}))
+            note = f"Nenhum recurso relevante para esta análise (recursos presentes: {kinds}). Agente não executado."
+            results["routing"][agent_type] = {"resources": [], "shards": 0}
+            return f"{rules_report}\n\n{note}" if covered else note
+
+        previous_groups = ((previous or {}).get("routing", {}).get(agent_type) or {}).get("groups")
+        shards = reshard_documents(routed, previous_groups) if previous_groups else shard_documents(routed)
+        results["routing"][agent_type] = {
+            "resources": describe_resources(routed),
+            "shards": len(shards),
+            "groups": [[resource for resource, _ in shard] for shard in shards],
+        }
+        all_resources = set(describe_resources(documents))
+        messages = []
+        for shard in shards:
+            shard_resources = {resource for resource, _ in shard}
+            # Cada shard recebe apenas os achados dos seus recursos (e os achados sem recurso específico)
+            shard_findings = [f for f in findings if f["resource"] in shard_resources or f["resource"] not in all_resources]
+            shard_yaml = "---\n".join(text for _, text in shard)
+            messages.append(self._agent_message(agent_type, shard_yaml, is_rendered, shard_findings if covered else None))
+
+        if len(messages) == 1:
+            replies = [self._run_agent_stage(agent_type, messages[0], results, cache_enabled, on_token, reuse=reuse, shared=shared)]
+        else:
+            logger.info(f"Agente {agent_type}: {len(routed)} recursos divididos em {len(shards)} shards paralelos.")
+            with ThreadPoolExecutor(max_workers=len(messages)) as executor:
+                # Cada shard transmite sob sua própria chave ("recursos#2") para não intercalar tokens
+                replies = list(executor.map(
+                    lambda indexed: self._run_agent_stage(
+                        agent_type, indexed[1], results, cache_enabled, on_token,
+                        stream_key=f"{agent_type}#{indexed[0]}", reuse=reuse, shared=shared
+                    ),
+                    enumerate(messages, start=1)
+                ))
+        reply = merge_shard_replies(shards, replies)
+        if not covered:
+            return reply
+        if all(r.startswith("ERRO") for r in replies):
+            return f"{rules_report}\n\n{reply}"
+        return f"{rules_report}\n\n#### Análise Complementar (LLM)\n{reply}"
+
+    def _generate(self, agent, messages, stream_key, results, on_token=None, priority=PRIORITY_AGENT):
+        """Gera a resposta de um agente; com `on_token`, transmite os tokens e registra TTFT e tokens/s.
+
+        Toda chamada passa pelo cliente de streaming com o prazo do estágio: uma
+        chamada abandonada pelo StageGraph é encerrada e libera a vaga no escalonador.
+        """
+        with self._llm_slot(results, priority):
+            content, metrics = self.stream_client.chat(
+                [{"role": "system", "content": agent.system_message}] + messages,
+                on_token=(lambda token: on_token(stream_key, token)) if on_token is not None else None,
+                deadline=self._call_deadline(results, priority)
+            )
+        results["llm_metrics"][stream_key] = metrics
+        return content
+
+    def _record_reply(self, stage, key, reply, results, reused=False):
+        """Guarda a resposta (por chave de mensagem) para que a próxima revalidação possa reaproveitá-la."""
+        if not is_cacheable_result(reply):
+            return
+        with self._results_lock:
+            results["agent_replies"][key] = reply
+            if reused:
+                results["incremental"]["reused"].append(stage)
+
+    def _run_agent_stage(self, agent_type, message, results, cache_enabled, on_token=None, stream_key=None, reuse=None,
+                         shared=None):
+        """Executa um agente LLM especializado, reaproveitando a validação anterior ou o cache antes.
+
+        Com `shared` (`SharedReplies` da matriz de values), a mesma mensagem é
+        enviada ao LLM uma única vez entre os grupos validados em paralelo.
+        """
+        stage_key = self._stage_key(agent_type, message)
+        if shared is not None:
+            reply, reused = shared.get_or_run(stage_key, lambda: self._run_agent_stage(
+                agent_type, message, results, cache_enabled, on_token, stream_key, reuse
+            ))
+            if reused:
+                self._record_reply(agent_type, stage_key, reply, results, reused=True)
+            return reply
+        if reuse and stage_key in reuse:
+            # Mesma mensagem (mesmos recursos e achados) da validação anterior: nada mudou para este agente
+            self._record_reply(agent_type, stage_key, reuse[stage_key], results, reused=True)
+            return reuse[stage_key]
+        cached_reply = self._cache_get(agent_type, stage_key, results) if cache_enabled else None
+        if cached_reply is not None:
+            self._record_reply(agent_type, stage_key, cached_reply, results)
+            return cached_reply
+        try:
+            content = self._generate(
+                self.agents[agent_type], [{"role": "user", "content": message}],
+                stream_key or agent_type, results, on_token
+            )
+            if cache_enabled:
+                self._cache_put(agent_type, stage_key, content)
+            self._record_reply(agent_type, stage_key, content, results)
+            logger.debug(f"Agente {agent_type} concluiu.")
+            return content
+        except TimeoutError as exc:
+            logger.warning(f"Agente {agent_type} interrompido pelo prazo: {exc}")
+            return self._timeout_message(agent_type)
+        except Exception as exc:
+            logger.exception(f"Agente {agent_type} gerou uma exceção: {exc}")
+            return f"ERRO: Falha ao executar agente {agent_type}: {exc}"
+
+    def _timeout_message(self, stage):
+        """Texto que substitui o resultado de um estágio que não terminou dentro do prazo."""
+        return f"{TIMEOUT_PREFIX}: a etapa '{stage}' não terminou dentro do prazo da validação e foi interrompida. Seção INCOMPLETA."
+
+    def _stage_failure_message(self, stage, exc):
+        """Texto que substitui o resultado de um estágio abandonado pelo prazo ou que levantou uma exceção."""
+        if isinstance(exc, TimeoutError):
+            return self._timeout_message(stage)
+        return f"ERRO: a etapa '{stage}' falhou ({type(exc).__name__}: {exc}). Seção INCOMPLETA."
+
+    def _condense(self, text, target_tokens, results, cache_enabled=True):
+        """Condensa um trecho com o LLM preservando os achados (passo 'map' da condensação)."""
+        stage_key = content_hash("condense", text, target_tokens, self.ollama_model, self.ollama_url, CONDENSER_PROMPT)
+        if cache_enabled and self.cache is not None:
+            cached = self.cache.get("condense", stage_key)
+            if cached is not None:
+                return cached
+        message = f"Condense o texto abaixo para no máximo ~{target_tokens} tokens:\n\n{text}"
+        try:
+            condensed = self._generate(
+                self.condenser_agent, [{"role": "user", "content": message}],
+                f"condense#{stage_key[:8]}", results, priority=PRIORITY_COORDINATOR
+            )
+        except Exception as e:
+            logger.exception(f"Falha ao condensar trecho: {e}")
+            return text
+        if cache_enabled:
+            self._cache_put("condense", stage_key, condensed)
+        return condensed
+
+    def _summary_sections(self, llm_validations, technical_validations):
+        """Monta as seções (agentes e ferramentas CLI) que compõem o prompt do coordenador."""
+        sections = {}
+        for val_type, result in llm_validations.items():
+            sections[f"### Análise de {val_type.capitalize()}"] = result if isinstance(result, str) else "Erro ao obter resultado"
+        for tool, output in technical_validations.items():
+            tool_name = tool.replace('_', ' ').title()
+            sections[f"### {tool_name}"] = f"```\n{compact_cli_output(output)}\n```"
+        return sections
+
+    def _build_summary_message(self, sections, resources):
+        """Monta o prompt do coordenador a partir das seções (já dentro do orçamento)."""
+        summary_message = "Resultados das validações do template Helm:\n\n"
+        if resources:
+            summary_message += "## Recursos Renderizados\n" + "\n".join(f"- {resource}" for resource in resources) + "\n\n"
+
+        cli_started = False
+        for title, text in sections.items():
+            if title.startswith("### Análise de"):
+                summary_message += f"{title}\n{text}\n\n"
+                continue
+            if not cli_started:
+                summary_message += "## Validações Técnicas (CLI)\n"
+                cli_started = True
+            summary_message += f"{title}\n{text}\n\n"
+
+        incomplete = [title for title, text in sections.items() if is_timed_out(text)]
+        if incomplete:
+            summary_message += (
+                "\nATENÇÃO: as seções a seguir não terminaram dentro do prazo; marque-as explicitamente como "
+                "INCOMPLETAS no relatório e não invente resultados para elas: " + ", ".join(incomplete) + "\n"
+            )
+        summary_message += "\n---\nTAREFA: Com base nos resultados acima, produza um relatório consolidado em Markdown, priorizando os problemas críticos."
+        return summary_message
+
+    def _fit_summary_to_budget(self, llm_validations, technical_validations, resources, results, cache_enabled):
+        """Garante que o prompt do coordenador caiba na janela de contexto, condensando seções se preciso."""
+        sections = self._summary_sections(llm_validations, technical_validations)
+        counter = self.token_counter
+        # Tokens fixos: prompts de sistema, cabeçalhos e lista de recursos
+        fixed_tokens = (
+            counter.count(self.coordinator_agent.system_message)
+            + counter.count(COORDINATOR_CONTEXT)
+            + counter.count(self._build_summary_message({title: "" for title in sections}, resources))
+        )
+        budget = self.context_window - RESERVED_OUTPUT_TOKENS - fixed_tokens
+        sections_tokens = sum(counter.count(text) for text in sections.values())
+        condense_start = time.perf_counter()
+        condensed, report = condense_sections(
+            sections, max(budget, 256),
+            lambda text, target: self._condense(text, target, results, cache_enabled),
+            counter, chunk_tokens=CONDENSE_CHUNK_TOKENS
+        )
+        results["timings"]["condense"] = time.perf_counter() - condense_start
+        summary_message = self._build_summary_message(condensed, resources)
+        results["budget"] = {
+            "context_window": self.context_window,
+            "sections_budget": budget,
+            "sections_tokens_before": sections_tokens,
+            "prompt_tokens": fixed_tokens + sum(counter.count(text) for text in condensed.values()),
+            "condensed_sections": {title: {"before": before, "after": after} for title, (before, after) in report.items()},
+        }
+        if report:
+            logger.info(f"Seções condensadas para caber no contexto: {list(report)}")
+        return summary_message
+
+    def _run_coordinator_stage(self, llm_validations, technical_validations, resources, results, cache_enabled, on_token=None,
+                               reuse=None):
+        """Gera o relatório consolidado. Retorna (sumário, sucesso)."""
+        logger.info("Gerando relatório consolidado com o Coordinator Agent...")
+        summary_message = self._fit_summary_to_budget(llm_validations, technical_validations, resources, results, cache_enabled)
+
+        summary_key = content_hash("coordinator", summary_message, self.ollama_model, self.ollama_url, self.coordinator_agent.system_message)
+        if reuse and summary_key in reuse:
+            self._record_reply("coordinator", summary_key, reuse[summary_key], results, reused=True)
+            return reuse[summary_key], True
+        cached_summary = self._cache_get("coordinator", summary_key, results) if cache_enabled else None
+        if cached_summary is not None:
+            self._record_reply("coordinator", summary_key, cached_summary, results)
+            return cached_summary, True
+        try:
+            logger.info("Tamanho do prompt final: ~%d tokens", results["budget"]["prompt_tokens"])
+
+            # Evite tokens duplos BOS adicionando contexto específico
+            formatted_message = [{"role": "system", "content": COORDINATOR_CONTEXT},
+                                 {"role": "user", "content": summary_message}]
+
+            summary = self._generate(
+                self.coordinator_agent, formatted_message, "coordinator", results, on_token, priority=PRIORITY_COORDINATOR
+            )
+            if cache_enabled:
+                self._cache_put("coordinator", summary_key, summary)
+            self._record_reply("coordinator", summary_key, summary, results)
+            logger.info("Relatório consolidado gerado.")
+            return summary, True
+        except TimeoutError as e:
+            logger.warning(f"Coordenador interrompido pelo prazo: {e}")
+            return self._fallback_summary(llm_validations, technical_validations, reason="tempo esgotado"), False
+        except Exception as e:
+            logger.exception(f"Erro ao gerar relatório consolidado pelo Coordinator Agent: {e}")
+            return self._fallback_summary(llm_validations, technical_validations), False
+
+    def _fallback_summary(self, llm_validations, technical_validations, reason="limitações do modelo"):
+        """Relatório simplificado, sem LLM, a partir do que terminou; seções fora do prazo são marcadas."""
+        summary = f"## Resumo da Análise\n\nNão foi possível gerar um relatório completo devido a {reason}.\n\n### Principais Pontos:\n\n"
+        for val_type, result in list(llm_validations.items()) + list(technical_validations.items()):
+            if is_timed_out(result):
+                summary += f"- **{val_type.capitalize()}**: ⏱ INCOMPLETO (tempo esgotado)\n"
+            elif isinstance(result, str) and len(result) > 10:
+                summary += f"- **{val_type.capitalize()}**: {result[:100]}...\n"
+        return summary
+
+    def validate_template_content(self, template_content, use_cache=True, on_stage_done=None, chart_files=None, fast_mode=False,
+                                  on_token=None, on_tick=None, session_id="default", previous=None, deadline_seconds=None,
+                                  values=None, rendered=None, lint=None, shared=None):
+        """Executa a validação completa do conteúdo do template YAML.
+
+        As validações CLI e os agentes LLM são iniciados ao mesmo tempo em um
+        grafo de estágios; o coordenador começa assim que todos terminam.
+        `on_stage_done(estágio, resultado)` é chamado a cada estágio concluído.
+        `chart_files` ({caminho relativo: conteúdo}) permite validar o template no
+        contexto do chart original (Chart.yaml, values.yaml, _helpers.tpl).
+        Com `fast_mode`, os agentes cobertos pelo motor de regras não chamam o LLM.
+        Com `on_token(chave, token)`, as respostas são transmitidas em streaming
+        (chamado nas threads de trabalho); `on_tick()` é chamado periodicamente
+        na thread chamadora para que a interface drene esses tokens.
+        As chamadas LLM passam pelo escalonador compartilhado identificadas por
+        `session_id`; com a fila cheia, levanta `QueueFullError` antes de começar.
+        Com `previous` (resultado da validação anterior do mesmo usuário), os
+        recursos são comparados um a um e só os agentes e shards afetados pelas
+        mudanças chamam o LLM; as demais respostas são reaproveitadas.
+        `deadline_seconds` (padrão: `self.deadline_seconds`) limita a latência:
+        comandos, agentes e coordenador têm prazos próprios dentro desse orçamento,
+        estágios atrasados são abandonados e o relatório é gerado com o que terminou,
+        marcando as seções incompletas.
+        `values` ({files, set}) valida o chart com uma combinação da matriz de
+        values; `rendered` e `lint` reaproveitam a renderização e o 'helm lint' já
+        feitos pela matriz, e `shared` (`SharedReplies`) divide as respostas dos
+        agentes entre os grupos da matriz.
+        """
+        budget = deadline_seconds or self.deadline_seconds
         results = {
             "timestamp": datetime.now().isoformat(),
             "llm_validations": {},
-            "technical_validations": {}
+            "technical_validations": {},
+            "cache": {"hits": [], "misses": []},
+            "routing": {},
+            "llm_metrics": {},
+            "queue": {"session": session_id, "calls": 0, "wait_s": 0.0, "service_s": 0.0},
+            "timings": {},
+            "agent_replies": {},
+            "resource_hashes": {},
+            "incremental": {"enabled": previous is not None, "reused": []},
+            "values": values or {},
+            "stage_errors": {},
+            "deadline": {
+                "budget_s": budget,
+                # Os agentes param antes, deixando tempo para o coordenador montar o relatório com o que terminou
+                "agents_budget_s": max(budget - COORDINATOR_RESERVE_SECONDS, budget / 2),
+                "expires_at": time.time() + budget,
+                "timed_out": []
+            }
         }
         logger.info("Iniciando validação de template.")
 
-        # Usar diretório temporário seguro
-        with tempfile.TemporaryDirectory(prefix="helm_validation_") as temp_dir:
-            logger.info(f"Diretório temporário criado: {temp_dir}")
-
-            # --- Preparação do Ambiente Temporário ---
-            # Salva o conteúdo como um arquivo de template (ex: deployment.yaml)
-            # Para que helm lint/template funcione minimamente, precisamos de uma estrutura de chart
-            templates_dir = os.path.join(temp_dir, "templates")
-            os.makedirs(templates_dir, exist_ok=True)
-            template_filename = "uploaded_template.yaml" # Nome genérico
-            template_path = os.path.join(templates_dir, template_filename)
-            with open(template_path, "w") as f:
-                f.write(template_content)
-            logger.debug(f"Conteúdo do template salvo em {template_path}")
-
-            # Cria um Chart.yaml mínimo para satisfazer o helm lint/template
-            chart_yaml_content = """
-apiVersion: v2
-name: temp-chart
-description: A temporary Helm chart for validation
-version: 0.1.0
-appVersion: "1.0"
-"""
-            chart_yaml_path = os.path.join(temp_dir, "Chart.yaml")
-            with open(chart_yaml_path, "w") as f:
-                f.write(chart_yaml_content)
-            logger.debug(f"Chart.yaml mínimo criado em {chart_yaml_path}")
-
-            # --- Execução das Validações Técnicas ---
-            logger.info("Executando validações técnicas CLI...")
-            results["technical_validations"]["helm_lint"] = self.helm_lint(temp_dir)
-            results["technical_validations"]["kubeval"] = self.helm_template_validate(temp_dir)
-
-            # --- Execução das Validações LLM (Paralelo) ---
-            logger.info("Executando validações LLM em paralelo...")
-            llm_tasks = {}
-            # Mensagem base para os agentes LLM
-            message_template = f"Analise o seguinte template Helm Kubernetes:\n\n```yaml\n{template_content}\n```\n\nForneça sua análise de acordo com seu CONTEXTO e TAREFA."
-
-            with ThreadPoolExecutor(max_workers=len(self.agents)) as executor:
-                # Submete cada tarefa de validação LLM com o formato correto de mensagem
-                future_to_agent = {
-                    executor.submit(
-                        agent.generate_reply, 
-                        [{"role": "user", "content": message_template}]
-                    ): agent_type
-                    for agent_type, agent in self.agents.items()
+        cache_enabled = use_cache and self.cache is not None
+        validation_key = self._validation_key(template_content, chart_files, fast_mode, values)
+        if cache_enabled:
+            lookup_start = time.perf_counter()
+            cached_results = self._cache_get("validation", validation_key, results)
+            results["timings"]["cache_lookup"] = time.perf_counter() - lookup_start
+            if cached_results is not None:
+                logger.info("Resultado completo encontrado no cache.")
+                cached_results["cache"] = results["cache"]
+                cached_results["queue"] = results["queue"]
+                cached_results["timings"] = results["timings"]
+                cached_results["incremental"] = results["incremental"]
+                cached_results["deadline"] = results["deadline"]
+                cached_results["cached"] = True
+                return cached_results
+
+        # Backpressure: não inicia uma validação que só acumularia mais chamadas em uma fila cheia
+        scheduler_stats = self.scheduler.stats()
+        if scheduler_stats["waiting"] >= scheduler_stats["max_queue"]:
+            raise QueueFullError(
+                f"Servidor LLM ocupado: {scheduler_stats['waiting']} chamadas na fila. Tente novamente em instantes."
+            )
+
+        # Workspace do pool: scaffold de chart já criado, reiniciado apenas com o template e os arquivos de contexto
+        workspace_timings = {}
+        with self.workspace_pool.checkout(template_content, chart_files, timings=workspace_timings) as temp_dir:
+            logger.info(f"Workspace em uso: {temp_dir}")
+
+            # --- Montagem do Grafo de Estágios ---
+            # 'helm template' roda uma única vez; schema, agentes e coordenador reutilizam a renderização
+            cli_checks = ("helm_lint", "schema")
+
+            # Prazos (segundos desde o início do grafo); estágios atrasados são abandonados com um substituto
+            cli_deadline = min(self.cli_timeout + 5, budget)
+            agents_deadline = results["deadline"]["agents_budget_s"]
+
+            graph = StageGraph()
+            graph.add_stage(
+                "render",
+                lambda inputs: self._run_render_stage(temp_dir, template_content, chart_files, results, cache_enabled, values, rendered),
+                timeout=cli_deadline,
+                fallback=lambda name, exc: {
+                    "manifest": "", "error": self._stage_failure_message(name, exc), "documents": parse_manifests(template_content)
                 }
-                # Coleta os resultados conforme completam
-                for future in future_to_agent:
-                    agent_type = future_to_agent[future]
-                    try:
-                        response = future.result()
-                        # Extrai apenas o conteúdo textual da resposta
-                        content = extract_llm_content(response)
-                        results["llm_validations"][agent_type] = content
-                        logger.debug(f"Agente {agent_type} concluiu.")
-                    except Exception as exc:
-                        logger.exception(f"Agente {agent_type} gerou uma exceção: {exc}")
-                        results["llm_validations"][agent_type] = f"ERRO: Falha ao executar agente {agent_type}: {exc}"
-
-            # --- Geração do Relatório Consolidado ---
-            logger.info("Gerando relatório consolidado com o Coordinator Agent...")
-            summary_message = "Resultados das validações do template Helm:\n\n"
-
-            for val_type, result in results["llm_validations"].items():
-                trimmed_result = chunk_message(result) if isinstance(result, str) else "Erro ao obter resultado"
-                summary_message += f"### Análise de {val_type.capitalize()}\n{trimmed_result}\n\n"
-
-            cli_summary = "## Validações Técnicas (CLI)\n"
-            for tool, output in results["technical_validations"].items():
-                tool_name = tool.replace('_', ' ').title()
-                
-                if len(output) > 500:  # Limite arbitrário para saídas de ferramentas
-                    output = output[:497] + "..."
-                cli_summary += f"### {tool_name}\n```\n{output}\n```\n\n"
+            )
+            graph.add_stage(
+                "helm_lint",
+                lambda inputs: lint if lint is not None else self._run_cli_stage(
+                    "helm_lint", lambda chart_dir: self.helm_lint(chart_dir, values),
+                    temp_dir, template_content, chart_files, results, cache_enabled, values
+                ),
+                timeout=cli_deadline, fallback=self._stage_failure_message
+            )
+            graph.add_stage(
+                "schema",
+                lambda inputs: self._run_cli_stage(
+                    "schema", lambda chart_dir: self.schema_validate(chart_dir, inputs["render"]),
+                    temp_dir, template_content, chart_files, results, cache_enabled, values
+                ),
+                deps=["render"], timeout=min(2 * cli_deadline, budget), fallback=self._stage_failure_message
+            )
+            graph.add_stage(
+                "rules", lambda inputs: run_rules(inputs["render"]["documents"]), deps=["render"],
+                timeout=agents_deadline, fallback=lambda name, exc: []
+            )
+            for agent_type in self.agents:
+                graph.add_stage(
+                    agent_type,
+                    lambda inputs, agent_type=agent_type: self._run_routed_agent_stage(
+                        agent_type, template_content, inputs["render"], inputs["rules"], fast_mode, results, cache_enabled,
+                        on_token, previous, shared
+                    ),
+                    deps=["render", "rules"], timeout=agents_deadline, fallback=self._stage_failure_message
+                )
+            graph.add_stage(
+                "coordinator",
+                lambda inputs: self._run_coordinator_stage(
+                    {agent_type: inputs[agent_type] for agent_type in self.agents},
+                    {tool: inputs[tool] for tool in cli_checks},
+                    describe_resources(inputs["render"]["documents"]),
+                    results, cache_enabled, on_token, (previous or {}).get("agent_replies")
+                ),
+                deps=["render"] + list(cli_checks) + list(self.agents),
+                timeout=budget,
+                fallback=lambda name, exc: (self._fallback_summary(
+                    results["llm_validations"], results["technical_validations"],
+                    reason="tempo esgotado" if isinstance(exc, TimeoutError) else f"uma falha interna ({exc})"
+                ), False)
+            )
 
-            summary_message += cli_summary
-            summary_message += "\n---\nTAREFA: Com base nos resultados acima, produza um relatório consolidado em Markdown, priorizando os problemas críticos."
+            def stage_done(name, value):
+                # Publica cada resultado no dicionário assim que o estágio termina
+                if name == "render":
+                    results["rendered_manifest"] = value["manifest"]
+                    results["resources"] = describe_resources(value["documents"])
+                    results["resource_hashes"] = {resource_key(doc): content_hash(doc) for doc in value["documents"]}
+                    if previous is not None:
+                        results["incremental"].update(diff_resources(previous.get("resource_hashes", {}), results["resource_hashes"]))
+                elif name == "rules":
+                    results["rule_findings"] = value
+                elif name in cli_checks:
+                    results["technical_validations"][name] = value
+                elif name in self.agents:
+                    results["llm_validations"][name] = value
+                if on_stage_done is not None:
+                    on_stage_done(name, value[0] if name == "coordinator" else value)
 
-            try:
-                logger.info("Tamanho do prompt final: %d caracteres", len(summary_message))
-                
-                # Evite tokens duplos BOS adicionando contexto específico 
-                formatted_message = [{"role": "system", "content": "Você é um especialista em avaliação de templates Helm."}, 
-                                    {"role": "user", "content": summary_message}]
-                                    
-                summary_response = self.coordinator_agent.generate_reply(formatted_message)
-                results["summary"] = extract_llm_content(summary_response)
-                logger.info("Relatório consolidado gerado.")
-            except Exception as e:
-                logger.exception("Erro ao gerar relatório consolidado pelo Coordinator Agent.")
-                results["summary"] = f"ERRO: Falha ao gerar o sumário consolidado: {str(e)}"
-                # Tente uma versão simplificada como fallback
-                results["summary"] = "## Resumo da Análise\n\nNão foi possível gerar um relatório completo devido a limitações do modelo.\n\n### Principais Pontos:\n\n"
-                for val_type, result in results["llm_validations"].items():
-                    if isinstance(result, str) and len(result) > 10:
-                        results["summary"] += f"- **{val_type.capitalize()}**: {result[:100]}...\n"
-            return results
+            logger.info("Executando validações CLI e LLM em paralelo...")
+            graph.run(on_stage_done=stage_done, on_tick=on_tick)
+            results["deadline"]["timed_out"] = list(graph.timed_out)
+            results["stage_errors"].update(
+                (name, f"{type(exc).__name__}: {exc}") for name, exc in graph.errors.items() if name not in graph.timed_out
+            )
+            if graph.timed_out:
+                logger.warning(f"Estágios abandonados pelo prazo de {budget}s: {graph.timed_out}")
+
+        # Mantém a ordem das ferramentas e dos agentes independentemente da ordem de conclusão
+        results["technical_validations"] = {tool: results["technical_validations"][tool] for tool in cli_checks}
+        results["llm_validations"] = {agent_type: results["llm_validations"][agent_type] for agent_type in self.agents}
+        results["summary"], summary_ok = graph.results["coordinator"]
+        # Estágios do grafo + preparação do workspace + subetapas registradas durante a execução
+        results["timings"].update(graph.timings)
+        results["timings"].update(workspace_timings)
+        logger.info(f"Validação concluída em {graph.timings['total']:.2f}s.")
+
+        # Só armazena o resultado completo se nenhum estágio falhou
+        stage_outputs = list(results["technical_validations"].values()) + list(results["llm_validations"].values())
+        if cache_enabled and summary_ok and not graph.errors and all(is_cacheable_result(output) for output in stage_outputs):
+            self._cache_put("validation", validation_key, results)
+        return results
+
+    def validate_values_matrix(self, template_content, combinations, chart_files=None, use_cache=True, fast_mode=False,
+                               session_id="default", deadline_seconds=None):
+        """Valida o template com cada combinação da matriz de values (ver `values_matrix.build_matrix`).
+
+        Todas as combinações são renderizadas e passam pelo 'helm lint' em
+        paralelo (sem LLM, então o lint não é agrupado); manifestos idênticos
+        são agrupados por hash e cada manifesto distinto passa uma única vez pela
+        validação completa (schema, regras, agentes e coordenador), também em
+        paralelo, reaproveitando o lint da matriz. Mensagens idênticas entre os
+        grupos (como o template bruto do agente de sintaxe) vão ao LLM uma única
+        vez (`SharedReplies`). Os arquivos de values referenciados devem estar em `chart_files`.
+        Retorna {combinations, unique, timings}: cada combinação traz o hash do
+        seu manifesto e a saída do seu lint; cada item de `unique` traz o hash do
+        manifesto, as combinações que o geraram e o resultado da validação.
+        """
+        start = time.perf_counter()
+        lint_results = {"cache": {"hits": [], "misses": []}}
+
+        def render_and_lint(chart_dir, values):
+            lint = self._run_cli_stage(
+                "helm_lint", lambda path: self.helm_lint(path, values), chart_dir,
+                template_content, chart_files, lint_results, use_cache, values
+            )
+            return self.render_chart(chart_dir, values), lint
+
+        with self.workspace_pool.checkout(template_content, chart_files) as chart_dir:
+            with ThreadPoolExecutor(max_workers=min(len(combinations), os.cpu_count() or 4)) as executor:
+                checked = list(executor.map(lambda values: render_and_lint(chart_dir, values), combinations))
+        renders = [rendered for rendered, _ in checked]
+        render_seconds = time.perf_counter() - start
+        groups = group_by_manifest(zip(combinations, renders))
+        logger.info(f"Matriz de values: {len(combinations)} combinação(ões), {len(groups)} manifesto(s) distinto(s).")
+
+        lint_of = {combination["name"]: lint for combination, (_, lint) in zip(combinations, checked)}
+        shared = SharedReplies()
+
+        def validate(group):
+            # A primeira combinação representa o grupo (o lint e as chaves de cache usam os seus values)
+            representative = group["combinations"][0]
+            return self.validate_template_content(
+                template_content, use_cache=use_cache, chart_files=chart_files, fast_mode=fast_mode,
+                session_id=session_id, deadline_seconds=deadline_seconds,
+                values=representative, rendered=group["rendered"], lint=lint_of[representative["name"]], shared=shared
+            )
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            validations = list(executor.map(validate, groups))
+
+        manifest_of = {
+            combination["name"]: group["hash"] for group in groups for combination in group["combinations"]
+        }
+        return {
+            "combinations": [
+                {**combination, "manifest_hash": manifest_of[combination["name"]], "error": rendered["error"], "lint": lint}
+                for combination, (rendered, lint) in zip(combinations, checked)
+            ],
+            "unique": [
+                {"hash": group["hash"], "combinations": [c["name"] for c in group["combinations"]], "results": results}
+                for group, results in zip(groups, validations)
+            ],
+            "timings": {"render_matrix": render_seconds, "total": time.perf_counter() - start},
+        }
+
+# Rótulos dos estágios na tabela de tempos do Sumário (agentes usam o próprio nome)
+STAGE_LABELS = {
+    "total": "Total (tempo de parede)",
+    "workspace": "Preparação do workspace",
+    "cache_lookup": "Consulta ao cache",
+    "render": "helm template (renderização)",
+    "helm_lint": "helm lint",
+    "schema": "Validação de schema",
+    "rules": "Motor de regras",
+    "coordinator": "Coordenador (inclui condensação)",
+    "condense": "Condensação do prompt",
+}
 
 # --- Inicialização do Sistema ---
+# Cache de resultados compartilhado por todas as instâncias (modelos/URLs) do processo
+@st.cache_resource
+def load_validation_cache():
+    """Carrega e cacheia o cache persistente de resultados de validação."""
+    return ValidationCache()
+
+@st.cache_resource
+def load_schema_validator():
+    """Indexa os schemas Kubernetes locais uma única vez; os validadores compilados ficam em memória."""
+    return SchemaValidator()
+
+@st.cache_resource
+def load_llm_scheduler():
+    """Cria o escalonador de chamadas LLM compartilhado por todas as sessões e modelos."""
+    return LLMScheduler(max_concurrent=2, max_queue=32)
+
+@st.cache_resource
+def load_workspace_pool():
+    """Cria o pool de workspaces compartilhado por todas as sessões do Streamlit."""
+    return WorkspacePool(size=4)
+
 # Cacheia o recurso para evitar recriar agentes a cada interação
 @st.cache_resource
 def load_validation_system(url, model):
     """Carrega e cacheia a instância do HelmValidationSystem."""
     logger.info(f"Tentando carregar/criar HelmValidationSystem para {url} com {model}")
-    return HelmValidationSystem(url, model)
+    schema_validator = load_schema_validator()
+    if schema_validator.available:
+        # Idempotente: só a primeira carga do processo compila, as demais encontram os validadores em memória
+        schema_validator.precompile(COMMON_KINDS)
+    return HelmValidationSystem(url, model, cache=load_validation_cache(), schema_validator=schema_validator,
+                                workspace_pool=load_workspace_pool(), scheduler=load_llm_scheduler())
 
 # --- Interface Streamlit ---
-st.title("Validador AG2 de Templates Helm para Kubernetes")
-st.write("Faça upload de um arquivo YAML de template Helm para análise por Agentes IA e ferramentas CLI.")
-st.info("Este sistema usa LLMs locais via Ollama e ferramentas como `helm lint` e `kubeval` (se instalados).")
-
-# Carregar o sistema de validação
-try:
-    validation_system = load_validation_system(ollama_url, ollama_model)
-except Exception as e:
-    st.error(f"Falha ao inicializar o sistema de validação: {e}")
-    logger.exception("Erro crítico na inicialização do HelmValidationSystem.")
-    st.stop()
-
-# Upload do arquivo YAML
-uploaded_file = st.file_uploader(
-    "Selecione seu template Helm (arquivo YAML único)",
-    type=["yaml", "yml"],
-    accept_multiple_files=False
-)
+def main():
+    """Renderiza a interface Streamlit do validador."""
+    # --- Configurações Streamlit ---
+    st.set_page_config(page_title="Validador AG2 de Templates Helm", layout="wide")
 
-# Botão de validação e barra de progresso
-col1, col2 = st.columns([1, 3])
-with col1:
-    validation_button = st.button("Validar Template", type="primary", disabled=uploaded_file is None)
+    # --- Configuração do Ollama ---
+    st.sidebar.header("Configuração do Ollama")
+    ollama_url = st.sidebar.text_input("URL do Ollama", value="http://localhost:11434")
+    ollama_model = st.sidebar.selectbox(
+        "Modelo LLM",
+        ["codellama", "llama3.2", "mistral", "deepseek-coder-v2:latest", "gemma"],
+        index=0,
+        help="Modelos como CodeLlama ou Llama 3.2 são recomendados para análise de código."
+    )
+    use_result_cache = st.sidebar.checkbox(
+        "Usar cache de resultados",
+        value=True,
+        help="Reutiliza resultados de validações anteriores do mesmo conteúdo, modelo e prompts."
+    )
+    fast_mode = st.sidebar.checkbox(
+        "Modo rápido (regras determinísticas)",
+        value=False,
+        help="Segurança e Recursos são respondidos apenas pelo motor de regras, sem chamadas ao LLM."
+    )
+    deadline_seconds = st.sidebar.number_input(
+        "Prazo da validação (s)",
+        min_value=30, max_value=1800, value=VALIDATION_DEADLINE_SECONDS, step=30,
+        help="Orçamento de latência: etapas que não terminarem no prazo são interrompidas e marcadas como incompletas."
+    )
+    incremental = st.sidebar.checkbox(
+        "Revalidação incremental",
+        value=True,
+        help="Ao revalidar uma versão editada, reaproveita as análises dos recursos que não mudaram."
+    )
+    stream_responses = st.sidebar.checkbox(
+        "Streaming das respostas",
+        value=True,
+        help="Exibe os tokens de cada agente à medida que são gerados pelo Ollama."
+    )
+    with st.sidebar.expander("Matriz de values"):
+        matrix_values_files = st.file_uploader(
+            "Arquivos de values alternativos",
+            type=["yaml", "yml"],
+            accept_multiple_files=True,
+            help="Cada arquivo é uma alternativa (-f); sem arquivos, usa os values padrão."
+        )
+        matrix_overrides = st.text_area(
+            "Overrides (um eixo por linha)",
+            placeholder="autoscaling.enabled=true,false\ningress.enabled=true,false",
+            help="Cada linha 'chave=valor1,valor2' multiplica as combinações (--set)."
+        )
 
-# Limpa resultados anteriores se um novo arquivo for carregado ou modelo mudar
-if "last_uploaded_filename" not in st.session_state:
-     st.session_state.last_uploaded_filename = None
-if "last_model" not in st.session_state:
-     st.session_state.last_model = None
+    st.title("Validador AG2 de Templates Helm para Kubernetes")
+    st.write("Faça upload de um arquivo YAML de template Helm para análise por Agentes IA e ferramentas CLI.")
+    st.info("Este sistema usa LLMs locais via Ollama e ferramentas como `helm lint` e validação de schema Kubernetes (schemas locais ou `kubeval`).")
 
-if (uploaded_file and uploaded_file.name != st.session_state.get("last_uploaded_filename")) or \
-   (ollama_model != st.session_state.get("last_model")):
-    if "validation_results" in st.session_state:
-        del st.session_state["validation_results"]
-    if "validation_progress" in st.session_state:
-         del st.session_state["validation_progress"]
-    st.session_state.last_uploaded_filename = uploaded_file.name if uploaded_file else None
-    st.session_state.last_model = ollama_model
-    logger.info("Novo arquivo ou modelo detectado, limpando resultados anteriores.")
+    # Carregar o sistema de validação
+    try:
+        validation_system = load_validation_system(ollama_url, ollama_model)
+    except Exception as e:
+        st.error(f"Falha ao inicializar o sistema de validação: {e}")
+        logger.exception("Erro crítico na inicialização do HelmValidationSystem.")
+        st.stop()
 
+    # Upload do arquivo YAML
+    uploaded_file = st.file_uploader(
+        "Selecione seu template Helm (arquivo YAML único)",
+        type=["yaml", "yml"],
+        accept_multiple_files=False
+    )
 
-# Processamento do template
-if validation_button and uploaded_file:
-    st.session_state.validation_progress = 0
-    progress_bar = st.progress(0, text="Iniciando validação...")
-    logger.info(f"Botão 'Validar' pressionado para o arquivo: {uploaded_file.name}")
+    # Botão de validação e barra de progresso
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        validation_button = st.button("Validar Template", type="primary", disabled=uploaded_file is None)
 
-    try:
-        # Ler conteúdo do arquivo
-        template_content = uploaded_file.getvalue().decode("utf-8")
-        progress_bar.progress(10, text="Arquivo lido...")
+    # Limpa resultados anteriores se um novo arquivo for carregado ou modelo mudar
+    if "last_uploaded_filename" not in st.session_state:
+         st.session_state.last_uploaded_filename = None
+    if "last_model" not in st.session_state:
+         st.session_state.last_model = None
 
-        try:
-            # Tenta carregar, mas não necessariamente interrompe se for erro de template
-            list(yaml.safe_load_all(template_content)) # Use safe_load_all para múltiplos documentos
-            progress_bar.progress(20, text="Sintaxe YAML básica verificada...")
-            logger.debug("Verificação básica de sintaxe YAML passou ou foi ignorada para template.")
-        except yaml.YAMLError as e:
-            # Verifica se o erro parece ser de template Helm
-            if "{{" in template_content and "}}" in template_content:
-                 logger.warning(f"Erro de parsing YAML detectado, possivelmente devido a template Helm. Continuando com helm lint/kubeval. Erro: {e}")
-                 st.warning(f"Aviso: Erro na validação YAML básica (pode ser sintaxe de template Helm): {e}. As validações Helm/Kubeval prosseguirão.")
-                 progress_bar.progress(20, text="Aviso: YAML básico inválido (template?), continuando...")
+    if (uploaded_file and uploaded_file.name != st.session_state.get("last_uploaded_filename")) or \
+       (ollama_model != st.session_state.get("last_model")):
+        if "validation_results" in st.session_state:
+            # Uma nova versão do template é revalidada de forma incremental a partir do resultado anterior;
+            # com outro modelo, as respostas anteriores não servem
+            previous_results = st.session_state.pop("validation_results")
+            if ollama_model == st.session_state.get("last_model"):
+                st.session_state.previous_results = previous_results
             else:
-                 # Se não parece template, é um erro YAML real
-                 st.error(f"Erro crítico de parsing YAML no arquivo: {str(e)}")
-                 logger.error(f"Erro crítico de parsing YAML: {e}")
-                 st.stop() # Interrompe a execução se o YAML for inválido e não parecer template
+                st.session_state.pop("previous_results", None)
+        if "validation_progress" in st.session_state:
+             del st.session_state["validation_progress"]
+        st.session_state.last_uploaded_filename = uploaded_file.name if uploaded_file else None
+        st.session_state.last_model = ollama_model
+        logger.info("Novo arquivo ou modelo detectado, limpando resultados anteriores.")
 
-        # Processar com o sistema de validação (continua mesmo com warning acima)
-        progress_bar.progress(30, text="Iniciando análise completa...")
-        with st.spinner("Executando validações LLM e técnicas... Isso pode levar um tempo."):
-            results = validation_system.validate_template_content(template_content)
-            progress_bar.progress(90, text="Gerando relatório final...")
 
-            # Armazenar resultados na sessão
-            st.session_state.validation_results = results
-            logger.info("Resultados da validação armazenados na sessão.")
+    # Processamento do template
+    if validation_button and uploaded_file:
+        st.session_state.validation_progress = 0
+        progress_bar = st.progress(0, text="Iniciando validação...")
+        logger.info(f"Botão 'Validar' pressionado para o arquivo: {uploaded_file.name}")
 
-        progress_bar.progress(100, text="Validação concluída!")
-        st.success("Validação concluída com sucesso!")
+        try:
+            # Ler conteúdo do arquivo
+            template_content = uploaded_file.getvalue().decode("utf-8")
+            progress_bar.progress(10, text="Arquivo lido...")
 
-    except Exception as e:
-        st.error(f"Erro inesperado durante a validação: {str(e)}")
-        logger.exception("Erro inesperado no fluxo de validação principal.")
-        if "validation_progress" in st.session_state:
-             del st.session_state["validation_progress"] # Limpa progresso em caso de erro
-
-# Mostrar resultados quando disponíveis
-if "validation_results" in st.session_state:
-    results = st.session_state.validation_results
-    
-    # Verificação adicional para evitar erro com resultados nulos
-    if results is None:
-        st.error("A validação não retornou resultados. Tente novamente ou escolha outro arquivo/modelo.")
-    else:
-        st.divider()
-        st.header("Relatório de Validação Consolidado")
-
-        if "summary" in results and results["summary"]:
-            st.markdown(results["summary"])
+            try:
+                # Tenta carregar, mas não necessariamente interrompe se for erro de template
+                list(yaml.safe_load_all(template_content)) # Use safe_load_all para múltiplos documentos
+                progress_bar.progress(20, text="Sintaxe YAML básica verificada...")
+                logger.debug("Verificação básica de sintaxe YAML passou ou foi ignorada para template.")
+            except yaml.YAMLError as e:
+                # Verifica se o erro parece ser de template Helm
+                if "{{" in template_content and "}}" in template_content:
+                     logger.warning(f"Erro de parsing YAML detectado, possivelmente devido a template Helm. Continuando com helm lint/kubeval. Erro: {e}")
+                     st.warning(f"Aviso: Erro na validação YAML básica (pode ser sintaxe de template Helm): {e}. As validações Helm/Kubeval prosseguirão.")
+                     progress_bar.progress(20, text="Aviso: YAML básico inválido (template?), continuando...")
+                else:
+                     # Se não parece template, é um erro YAML real
+                     st.error(f"Erro crítico de parsing YAML no arquivo: {str(e)}")
+                     logger.error(f"Erro crítico de parsing YAML: {e}")
+                     st.stop() # Interrompe a execução se o YAML for inválido e não parecer template
+
+            # Processar com o sistema de validação (continua mesmo com warning acima)
+            progress_bar.progress(30, text="Iniciando análise completa...")
+            # Resultados parciais publicados na sessão à medida que cada estágio termina
+            st.session_state.partial_results = {}
+            total_stages = len(VALIDATION_PROMPTS) + 5  # agentes + render + regras + helm_lint + schema + coordenador
+
+            def on_stage_done(stage, value):
+                st.session_state.partial_results[stage] = value
+                done = len(st.session_state.partial_results)
+                st.session_state.validation_progress = 30 + int(70 * done / total_stages)
+                progress_bar.progress(
+                    min(st.session_state.validation_progress, 99),
+                    text=f"Estágio '{stage}' concluído ({done}/{total_stages})..."
+                )
+
+            # Identifica a sessão no escalonador (justiça entre usuários e posição na fila)
+            if "session_id" not in st.session_state:
+                st.session_state.session_id = uuid.uuid4().hex
+            queue_status = st.empty()
+
+            def show_queue_position():
+                position = validation_system.scheduler.queue_position(st.session_state.session_id)
+                if position is None:
+                    queue_status.empty()
+                else:
+                    queue_status.info(f"Aguardando o servidor LLM: posição {position} na fila.")
+
+            on_token = None
+            on_tick = show_queue_position
+            live_area = st.empty()
+            if stream_responses:
+                # Tokens chegam nas threads de trabalho; a interface só é atualizada na thread principal (on_tick)
+                token_queue = queue.Queue()
+                live_keys = list(VALIDATION_PROMPTS.keys()) + ["coordinator"]
+                live_text = {key: "" for key in live_keys}
+                with live_area.container():
+                    st.caption("Respostas em andamento")
+                    live_tabs = st.tabs([key.capitalize() for key in live_keys])
+                    placeholders = {}
+                    for key, tab in zip(live_keys, live_tabs):
+                        with tab:
+                            placeholders[key] = st.empty()
+
+                def on_token(stream_key, token):
+                    token_queue.put((stream_key, token))
+
+                def on_tick():
+                    show_queue_position()
+                    touched = set()
+                    while True:
+                        try:
+                            stream_key, token = token_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        # Shards do mesmo agente ("recursos#2") compartilham a aba do agente
+                        key = stream_key.split("#", 1)[0]
+                        if key in live_text:
+                            live_text[key] += token
+                            touched.add(key)
+                    for key in touched:
+                        placeholders[key].markdown(live_text[key] + " ▌")
+
+                stage_done_base = on_stage_done
+
+                def on_stage_done(stage, value):
+                    stage_done_base(stage, value)
+                    if stage in placeholders and isinstance(value, str):
+                        on_tick()
+                        live_text[stage] = value
+                        placeholders[stage].markdown(value)
+
+            # Resultado anterior (mesmo arquivo revalidado ou versão anterior enviada) para a revalidação incremental
+            previous = st.session_state.get("validation_results") or st.session_state.get("previous_results")
+
+            # Matriz de values: arquivos enviados viram arquivos de contexto do chart, referenciados por -f
+            try:
+                override_axes = [parse_override_axis(line) for line in matrix_overrides.splitlines() if line.strip()]
+                combinations = build_matrix([f.name for f in matrix_values_files or []], override_axes)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            st.session_state.pop("matrix_results", None)
+
+            with st.spinner("Executando validações LLM e técnicas... Isso pode levar um tempo."):
+                if len(combinations) > 1 or matrix_values_files:
+                    # Sem streaming nem progresso por estágio: as validações rodam em paralelo, fora da thread da interface
+                    matrix_files = {f.name: f.getvalue().decode("utf-8") for f in matrix_values_files or []}
+                    matrix = validation_system.validate_values_matrix(
+                        template_content, combinations, chart_files=matrix_files, use_cache=use_result_cache,
+                        fast_mode=fast_mode, session_id=st.session_state.session_id, deadline_seconds=deadline_seconds
+                    )
+                    st.session_state.matrix_results = matrix
+                    results = matrix["unique"][0]["results"]
+                else:
+                    results = validation_system.validate_template_content(
+                        template_content, use_cache=use_result_cache, on_stage_done=on_stage_done, fast_mode=fast_mode,
+                        on_token=on_token, on_tick=on_tick, session_id=st.session_state.session_id,
+                        previous=previous if incremental else None, deadline_seconds=deadline_seconds
+                    )
+
+                # Armazenar resultados na sessão
+                st.session_state.validation_results = results
+                logger.info("Resultados da validação armazenados na sessão.")
+            live_area.empty()
+            queue_status.empty()
+
+            progress_bar.progress(100, text="Validação concluída!")
+            st.success("Validação concluída com sucesso!")
+
+        except QueueFullError as e:
+            st.warning(str(e))
+            logger.warning(f"Validação recusada por backpressure: {e}")
+            if "validation_progress" in st.session_state:
+                 del st.session_state["validation_progress"]
+        except Exception as e:
+            st.error(f"Erro inesperado durante a validação: {str(e)}")
+            logger.exception("Erro inesperado no fluxo de validação principal.")
+            if "validation_progress" in st.session_state:
+                 del st.session_state["validation_progress"] # Limpa progresso em caso de erro
+
+    # Mostrar resultados quando disponíveis
+    if "validation_results" in st.session_state:
+        results = st.session_state.validation_results
+        matrix = st.session_state.get("matrix_results")
+        if matrix:
+            st.subheader("Matriz de Values")
+            st.caption(
+                f"{len(matrix['combinations'])} combinação(ões) renderizadas em {matrix['timings']['render_matrix']:.2f}s; "
+                f"{len(matrix['unique'])} manifesto(s) distinto(s) analisado(s) pelos agentes."
+            )
+            manifest_ids = {item["hash"]: f"Manifesto {i}" for i, item in enumerate(matrix["unique"], start=1)}
+            st.table([
+                {
+                    "Combinação": c["name"], "Manifesto": manifest_ids[c["manifest_hash"]],
+                    "Renderização": c["error"] or "OK", "helm lint": lint_summary(c["lint"]),
+                }
+                for c in matrix["combinations"]
+            ])
+            for c in matrix["combinations"]:
+                if lint_summary(c["lint"]) == "OK":
+                    continue
+                with st.expander(f"helm lint: {c['name']}"):
+                    st.code(compact_cli_output(c["lint"]))
+            selected = st.selectbox(
+                "Exibir o relatório do",
+                range(len(matrix["unique"])),
+                format_func=lambda i: f"{manifest_ids[matrix['unique'][i]['hash']]} ({', '.join(matrix['unique'][i]['combinations'])})"
+            )
+            results = matrix["unique"][selected]["results"]
+
+        # Verificação adicional para evitar erro com resultados nulos
+        if results is None:
+            st.error("A validação não retornou resultados. Tente novamente ou escolha outro arquivo/modelo.")
         else:
-            st.warning("O relatório consolidado não pôde ser gerado.")
-
-    st.subheader("Detalhes das Validações")
-
-    # Abas para resultados específicos
-    tab_names = ["Sumário"] + \
-                [t.capitalize() for t in VALIDATION_PROMPTS.keys()] + \
-                ["Técnico (CLI)"]
-
-    tabs = st.tabs(tab_names)
-
-    # Tab Sumário (já exibido acima)
-    with tabs[0]:
-        st.info("O sumário consolidado gerado pelo Agente Coordenador é exibido acima.")
-        st.write(f"Validação realizada em: {results.get('timestamp', 'N/A')}")
-        st.write(f"Modelo LLM utilizado: {ollama_model}")
-
-    # Abas de Validação LLM
-    llm_validation_keys = list(VALIDATION_PROMPTS.keys())
-    for i, key in enumerate(llm_validation_keys):
-        with tabs[i + 1]:
-            st.subheader(f"Análise de {key.capitalize()}")
-            if key in results.get("llm_validations", {}):
-                st.markdown(results["llm_validations"][key])
+            st.divider()
+            st.header("Relatório de Validação Consolidado")
+
+            timed_out = results.get("deadline", {}).get("timed_out")
+            if timed_out:
+                st.warning(
+                    f"Prazo de {results['deadline']['budget_s']}s esgotado: as etapas {', '.join(timed_out)} foram "
+                    "interrompidas e o relatório foi gerado com o que terminou."
+                )
+            if "summary" in results and results["summary"]:
+                st.markdown(results["summary"])
             else:
-                st.warning(f"Resultado da validação de {key} não disponível.")
-
-    # Tab Técnico (CLI)
-    with tabs[len(llm_validation_keys) + 1]:
-        st.subheader("Validações Técnicas (CLI)")
-        if "technical_validations" in results:
-            for tool, output in results["technical_validations"].items():
-                 tool_name = tool.replace('_', ' ').title()
-                 with st.expander(f"Resultado do {tool_name}", expanded="ERRO" in output):
-                     if "ERRO:" in output:
-                         st.error(output)
-                     elif "AVISO:" in output:
-                          st.warning(output)
-                     else:
-                         st.code(output, language="bash")
-        else:
-            st.warning("Resultados das validações técnicas não disponíveis.")
+                st.warning("O relatório consolidado não pôde ser gerado.")
 
-# --- Rodapé ---
-st.sidebar.divider()
-st.sidebar.subheader("Sobre")
-st.sidebar.info(
-    """
-    **Validador AG2 de Templates Helm**
+        st.subheader("Detalhes das Validações")
 
-    Utiliza agentes IA (AutoGen/AG2 + Ollama) e ferramentas CLI (`helm`, `kubeval`)
-    para análise multifacetada de templates Helm.
+        # Abas para resultados específicos
+        tab_names = ["Sumário"] + \
+                    [t.capitalize() for t in VALIDATION_PROMPTS.keys()] + \
+                    ["Técnico (CLI)"]
 
-    **Categorias de Análise:**
-    - Sintaxe e Estrutura YAML/Go Template
-    - Segurança (CIS Benchmark, OWASP K8s)
-    - Otimização de Recursos (CPU/Memória, Probes)
-    - Boas Práticas Helm (Estrutura, Labels, Docs)
-    - Validação Técnica (Lint, Schema K8s)
-    """
-)
-st.sidebar.caption(f"v1.1.0 | Data: {datetime.now().strftime('%Y-%m-%d')}")
\ No newline at end of file
+        tabs = st.tabs(tab_names)
+
+        # Tab Sumário (já exibido acima)
+        with tabs[0]:
+            st.info("O sumário consolidado gerado pelo Agente Coordenador é exibido acima.")
+            st.write(f"Validação realizada em: {results.get('timestamp', 'N/A')}")
+            st.write(f"Modelo LLM utilizado: {ollama_model}")
+            cache_info = results.get("cache", {})
+            if results.get("cached"):
+                st.success("Resultado completo recuperado do cache.")
+            elif cache_info.get("hits"):
+                st.write(f"Estágios recuperados do cache: {', '.join(cache_info['hits'])}")
+            incremental_info = results.get("incremental", {})
+            if incremental_info.get("enabled") and "changed" in incremental_info:
+                st.write(
+                    f"Revalidação incremental: {len(incremental_info['changed'])} recurso(s) alterado(s), "
+                    f"{len(incremental_info['added'])} adicionado(s), {len(incremental_info['removed'])} removido(s), "
+                    f"{len(incremental_info['unchanged'])} inalterado(s); "
+                    f"{len(incremental_info['reused'])} análise(s) reaproveitada(s) da validação anterior."
+                )
+                changed = incremental_info["changed"] + incremental_info["added"]
+                if changed:
+                    st.caption(f"Recursos reanalisados: {', '.join(changed)}")
+            queue_info = results.get("queue", {})
+            if queue_info.get("calls"):
+                st.caption(
+                    f"Chamadas ao LLM: {queue_info['calls']} | espera na fila: {queue_info['wait_s']:.2f}s | "
+                    f"atendimento: {queue_info['service_s']:.2f}s"
+                )
+            timings = results.get("timings", {})
+            if timings:
+                st.write("Tempo por estágio:")
+                total = timings.get("total") or sum(timings.values()) or 1
+                st.table([
+                    {"Estágio": STAGE_LABELS.get(stage, stage), "Duração (s)": round(seconds, 3),
+                     "% do tempo total": round(100 * seconds / total, 1)}
+                    for stage, seconds in sorted(timings.items(), key=lambda item: -item[1])
+                    if stage != "workspace_saved"
+                ])
+            if "workspace" in timings:
+                st.caption(
+                    f"Preparação do workspace: {timings['workspace'] * 1000:.2f} ms "
+                    f"({timings['workspace_saved'] * 1000:.2f} ms economizados em relação a um diretório temporário novo)"
+                )
+            if results.get("llm_metrics"):
+                st.write("Desempenho das chamadas ao LLM (streaming):")
+                st.table([
+                    {"Chamada": key, "TTFT (s)": m["ttft_s"], "Tokens": m["tokens"],
+                     "Tokens/s": m["tokens_per_s"], "Duração (s)": m["duration_s"]}
+                    for key, m in sorted(results["llm_metrics"].items())
+                ])
+
+        # Abas de Validação LLM
+        llm_validation_keys = list(VALIDATION_PROMPTS.keys())
+        for i, key in enumerate(llm_validation_keys):
+            with tabs[i + 1]:
+                st.subheader(f"Análise de {key.capitalize()}")
+                routing = results.get("routing", {}).get(key)
+                if routing and routing["resources"]:
+                    st.caption(f"Recursos analisados ({routing['shards']} shard(s)): {', '.join(routing['resources'])}")
+                if is_timed_out(results.get("llm_validations", {}).get(key)):
+                    st.warning(results["llm_validations"][key])
+                elif key in results.get("llm_validations", {}):
+                    st.markdown(results["llm_validations"][key])
+                else:
+                    st.warning(f"Resultado da validação de {key} não disponível.")
+
+        # Tab Técnico (CLI)
+        with tabs[len(llm_validation_keys) + 1]:
+            st.subheader("Validações Técnicas (CLI)")
+            if "technical_validations" in results:
+                for tool, output in results["technical_validations"].items():
+                     tool_name = tool.replace('_', ' ').title()
+                     with st.expander(f"Resultado do {tool_name}", expanded="ERRO" in output):
+                         if "ERRO:" in output:
+                             st.error(output)
+                         elif "AVISO:" in output:
+                              st.warning(output)
+                         else:
+                             st.code(output, language="bash")
+            else:
+                st.warning("Resultados das validações técnicas não disponíveis.")
+            if results.get("rendered_manifest"):
+                with st.expander(f"Manifestos renderizados ({len(results.get('resources', []))} recursos)"):
+                    st.code(results["rendered_manifest"], language="yaml")
+
+    # --- Estatísticas do Cache ---
+    st.sidebar.divider()
+    st.sidebar.subheader("Cache de Resultados")
+    cache_stats = validation_system.cache.stats()
+    cache_col1, cache_col2 = st.sidebar.columns(2)
+    cache_col1.metric("Hits", cache_stats["hits"])
+    cache_col2.metric("Misses", cache_stats["misses"])
+    st.sidebar.caption(f"{cache_stats['entries']} entradas | {cache_stats['bytes'] / 1024:.1f} KiB em disco")
+    if st.sidebar.button("Limpar cache"):
+        validation_system.cache.clear()
+        st.rerun()
+
+    # --- Fila do LLM ---
+    st.sidebar.divider()
+    st.sidebar.subheader("Fila do LLM")
+    scheduler_stats = validation_system.scheduler.stats()
+    queue_col1, queue_col2 = st.sidebar.columns(2)
+    queue_col1.metric("Em atendimento", f"{scheduler_stats['active']}/{scheduler_stats['max_concurrent']}")
+    queue_col2.metric("Na fila", scheduler_stats["waiting"])
+    if scheduler_stats["served"]:
+        st.sidebar.caption(
+            f"Espera média {scheduler_stats['wait_avg_s']:.2f}s (p95 {scheduler_stats['wait_p95_s']:.2f}s) | "
+            f"atendimento médio {scheduler_stats['service_avg_s']:.2f}s (p95 {scheduler_stats['service_p95_s']:.2f}s) | "
+            f"{scheduler_stats['rejected']} recusadas"
+        )
+
+    # --- Rodapé ---
+    st.sidebar.divider()
+    st.sidebar.subheader("Sobre")
+    st.sidebar.info(
+        """
+        **Validador AG2 de Templates Helm**
+
+        Utiliza agentes IA (AutoGen/AG2 + Ollama) e ferramentas CLI (`helm`, `kubeval`)
+        para análise multifacetada de templates Helm.
+
+        **Categorias de Análise:**
+        - Sintaxe e Estrutura YAML/Go Template
+        - Segurança (CIS Benchmark, OWASP K8s)
+        - Otimização de Recursos (CPU/Memória, Probes)
+        - Boas Práticas Helm (Estrutura, Labels, Docs)
+        - Validação Técnica (Lint, Schema K8s em processo)
+        """
+    )
+    st.sidebar.caption(f"v1.1.0 | Data: {datetime.now().strftime('%Y-%m-%d')}")
+
+
+if __name__ == "__main__":
+    main()
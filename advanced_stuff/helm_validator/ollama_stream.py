@@ -0,0 +1,80 @@
+"""Cliente de streaming para o endpoint `/api/chat` do Ollama.
+
+O `generate_reply` do AutoGen só retorna quando a resposta inteira termina;
+este cliente entrega cada token assim que chega e mede o tempo até o primeiro
+token (TTFT) e a vazão em tokens/s de cada chamada.
+"""
+import json
+import logging
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaStreamClient:
+    """Faz chamadas de chat com `stream: true` ao Ollama usando apenas a biblioteca padrão."""
+
+    def __init__(self, base_url, model, options=None, timeout=300):
+        self.chat_url = base_url.rstrip("/") + "/api/chat"
+        self.model = model
+        self.options = options or {}
+        self.timeout = timeout
+
+    def chat(self, messages, on_token=None, timeout=None, deadline=None):
+        """Envia as mensagens e retorna (texto, métricas), chamando `on_token(token)` a cada fragmento.
+
+        `deadline` (instante em `time.time()`) interrompe a geração e fecha a
+        conexão com `TimeoutError`, liberando o Ollama para outras chamadas.
+        """
+        payload = json.dumps({
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "options": self.options,
+        }).encode("utf-8")
+        request = urllib.request.Request(self.chat_url, data=payload, headers={"Content-Type": "application/json"})
+
+        start = time.perf_counter()
+        first_token_at = None
+        parts, chunks, final = [], 0, {}
+        timeout = timeout or self.timeout
+        if deadline is not None:
+            timeout = max(min(timeout, deadline - time.time()), 0.1)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            # O Ollama responde em NDJSON: um objeto JSON por linha
+            for raw_line in response:
+                if deadline is not None and time.time() >= deadline:
+                    raise TimeoutError(f"Geração interrompida pelo prazo após {chunks} tokens.")
+                if not raw_line.strip():
+                    continue
+                event = json.loads(raw_line)
+                if "error" in event:
+                    raise RuntimeError(f"Ollama: {event['error']}")
+                token = (event.get("message") or {}).get("content", "")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(token)
+                    chunks += 1
+                    if on_token is not None:
+                        on_token(token)
+                if event.get("done"):
+                    final = event
+                    break
+
+        elapsed = time.perf_counter() - start
+        # Prefere as contagens do próprio Ollama; senão, usa os fragmentos recebidos
+        tokens = final.get("eval_count", chunks)
+        if final.get("eval_duration"):
+            generation_seconds = final["eval_duration"] / 1e9
+        else:
+            generation_seconds = elapsed - (first_token_at - start) if first_token_at else elapsed
+        metrics = {
+            "ttft_s": round(first_token_at - start, 3) if first_token_at else None,
+            "tokens": tokens,
+            "tokens_per_s": round(tokens / generation_seconds, 1) if generation_seconds > 0 else None,
+            "duration_s": round(elapsed, 3),
+        }
+        logger.debug(f"Streaming concluído: {metrics}")
+        return "".join(parts), metrics
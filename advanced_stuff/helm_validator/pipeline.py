@@ -0,0 +1,168 @@
+"""Executor de grafo de estágios (DAG) para o pipeline de validação Helm.
+
+Cada estágio declara suas dependências; estágios sem dependências pendentes
+são iniciados imediatamente em um pool de threads e os resultados são
+entregues ao chamador à medida que cada estágio termina.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """Um nó do grafo: nome, função a executar e nomes dos estágios dos quais depende."""
+
+    def __init__(self, name, func, deps=(), timeout=None, fallback=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+class StageGraph:
+    """Executa estágios respeitando dependências, com o máximo de paralelismo possível.
+
+    A função de cada estágio recebe um dicionário {dependência: resultado}.
+    Estágios podem ter um prazo (`timeout`, em segundos desde o início de `run`)
+    e um valor substituto (`fallback(nome, exceção)`).
+
+    Se um estágio levanta uma exceção, ela é registrada em `errors`; com um
+    substituto, o valor substituto é entregue e os dependentes continuam, senão
+    os estágios que dependem dele não são executados. Um estágio que não termina
+    no prazo é abandonado: `run` não espera mais por ele, registra-o em
+    `timed_out` e trata o abandono como uma falha com `TimeoutError`.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+        self.timed_out = []
+
+    def add_stage(self, name, func, deps=(), timeout=None, fallback=None):
+        """Adiciona um estágio ao grafo. As dependências devem ser adicionadas antes.
+
+        `fallback(nome, exceção)` fornece o resultado de um estágio que falha ou
+        excede `timeout` (com `TimeoutError`); sem ele, os dependentes não são executados.
+        """
+        if name in self.stages:
+            raise ValueError(f"Estágio duplicado: {name}")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Estágio '{name}' depende de estágios inexistentes: {missing}")
+        self.stages[name] = Stage(name, func, deps, timeout, fallback)
+        return self
+
+    def _timed(self, stage, inputs):
+        """Executa a função do estágio medindo sua duração."""
+        start = time.perf_counter()
+        try:
+            return stage.func(inputs)
+        finally:
+            # Um estágio abandonado por prazo mantém o tempo registrado no abandono
+            if stage.name not in self.timed_out:
+                self.timings[stage.name] = time.perf_counter() - start
+
+    def run(self, on_stage_done=None, on_tick=None, tick_interval=0.1):
+        """Executa o grafo e retorna {estágio: resultado}.
+
+        `on_stage_done(nome, resultado)` é chamado na thread que invocou `run`
+        assim que cada estágio termina com sucesso, o que permite atualizar
+        estado de interface (ex: `st.session_state`) com segurança.
+        `on_tick()` é chamado na mesma thread a cada `tick_interval` segundos
+        enquanto há estágios em execução (ex: para exibir tokens em streaming).
+        """
+        pending = dict(self.stages)
+        running = {}
+        max_workers = self.max_workers or max(1, len(self.stages))
+        wall_start = time.perf_counter()
+
+        def deliver(name, value):
+            self.results[name] = value
+            logger.debug(f"Estágio '{name}' concluído em {self.timings.get(name, 0):.2f}s.")
+            if on_stage_done is not None:
+                on_stage_done(name, value)
+
+        def fail(name, exc):
+            """Registra a falha de um estágio e entrega o substituto, se houver."""
+            self.errors[name] = exc
+            if self.stages[name].fallback is not None:
+                deliver(name, self.stages[name].fallback(name, exc))
+
+        def expire(name):
+            """Abandona um estágio fora do prazo."""
+            stage = self.stages[name]
+            self.timings[name] = time.perf_counter() - wall_start
+            self.timed_out.append(name)
+            logger.warning(f"Estágio '{name}' excedeu o prazo de {stage.timeout:.1f}s e foi abandonado.")
+            fail(name, TimeoutError(f"Estágio '{name}' excedeu o prazo de {stage.timeout:.1f}s"))
+
+        def deadline_of(name):
+            timeout = self.stages[name].timeout
+            return wall_start + timeout if timeout is not None else None
+
+        # Sem context manager: ao final, não espera por estágios abandonados
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            while pending or running:
+                # Descarta estágios cujas dependências falharam sem substituto
+                for name, stage in list(pending.items()):
+                    failed = [dep for dep in stage.deps if dep in self.errors and dep not in self.results]
+                    if failed:
+                        self.errors[name] = RuntimeError(f"Dependências falharam: {failed}")
+                        logger.warning(f"Estágio '{name}' ignorado porque dependências falharam: {failed}")
+                        del pending[name]
+                # Inicia todos os estágios prontos (ou os expira, se o prazo já passou)
+                for name, stage in list(pending.items()):
+                    if all(dep in self.results for dep in stage.deps):
+                        deadline = deadline_of(name)
+                        if deadline is not None and time.perf_counter() >= deadline:
+                            del pending[name]
+                            expire(name)
+                            continue
+                        inputs = {dep: self.results[dep] for dep in stage.deps}
+                        running[executor.submit(self._timed, stage, inputs)] = name
+                        del pending[name]
+                        logger.debug(f"Estágio '{name}' iniciado.")
+                if not running:
+                    if pending and not any(all(dep in self.results for dep in stage.deps) for stage in pending.values()):
+                        raise RuntimeError(f"Grafo de estágios bloqueado: {list(pending)}")
+                    if not pending:
+                        break
+                    continue
+
+                # Acorda no próximo tick ou no prazo mais próximo de um estágio em execução
+                deadlines = [d for d in (deadline_of(name) for name in running.values()) if d is not None]
+                timeouts = [tick_interval] if on_tick else []
+                if deadlines:
+                    timeouts.append(max(min(deadlines) - time.perf_counter(), 0))
+                done, _ = wait(running, timeout=min(timeouts) if timeouts else None, return_when=FIRST_COMPLETED)
+                if on_tick is not None:
+                    on_tick()
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as exc:
+                        logger.exception(f"Estágio '{name}' gerou uma exceção: {exc}")
+                        fail(name, exc)
+                        continue
+                    deliver(name, value)
+                now = time.perf_counter()
+                for future, name in list(running.items()):
+                    deadline = deadline_of(name)
+                    if deadline is not None and now >= deadline:
+                        # A thread não pode ser interrompida; o resultado tardio é descartado
+                        future.cancel()
+                        del running[future]
+                        expire(name)
+        finally:
+            executor.shutdown(wait=not self.timed_out, cancel_futures=True)
+
+        self.timings["total"] = time.perf_counter() - wall_start
+        return self.results
@@ -0,0 +1,101 @@
+"""Roteamento de documentos por `kind` para os agentes relevantes e divisão em shards.
+
+Cada agente recebe apenas os recursos que fazem sentido para sua análise;
+conjuntos grandes são divididos em shards analisados em chamadas paralelas
+e os resultados são mesclados depois.
+"""
+import yaml
+
+from rule_engine import WORKLOAD_KINDS, resource_key
+from token_budget import estimate_tokens
+
+# Kinds relevantes por agente (None = todos os documentos)
+AGENT_KINDS = {
+    "seguranca": WORKLOAD_KINDS + (
+        "Role", "ClusterRole", "RoleBinding", "ClusterRoleBinding", "ServiceAccount",
+        "NetworkPolicy", "Secret", "ConfigMap", "Ingress", "PodSecurityPolicy",
+    ),
+    "recursos": WORKLOAD_KINDS + (
+        "HorizontalPodAutoscaler", "PodDisruptionBudget", "LimitRange", "ResourceQuota",
+    ),
+    "boas_praticas": None,
+}
+
+# Tamanho máximo (em tokens estimados de YAML) de cada shard enviado a um agente
+MAX_SHARD_TOKENS = 2000
+
+
+def route_documents(documents, agent_types):
+    """Distribui os documentos entre os agentes conforme `AGENT_KINDS`.
+
+    Agentes ausentes de `AGENT_KINDS` não são roteados (recebem o template bruto).
+    """
+    routed = {}
+    for agent_type in agent_types:
+        if agent_type not in AGENT_KINDS:
+            continue
+        kinds = AGENT_KINDS[agent_type]
+        routed[agent_type] = [doc for doc in documents if kinds is None or doc.get("kind") in kinds]
+    return routed
+
+
+def shard_documents(documents, max_tokens=MAX_SHARD_TOKENS, count_tokens=estimate_tokens):
+    """Agrupa os documentos em shards de até `max_tokens`, preservando a ordem.
+
+    Retorna uma lista de shards; cada shard é uma lista de (recurso, yaml).
+    Um documento maior que o limite ocupa um shard sozinho.
+    """
+    shards = []
+    current, current_size = [], 0
+    for doc in documents:
+        text = yaml.safe_dump(doc, sort_keys=False, allow_unicode=True)
+        size = count_tokens(text)
+        if current and current_size + size > max_tokens:
+            shards.append(current)
+            current, current_size = [], 0
+        current.append((resource_key(doc), text))
+        current_size += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def reshard_documents(documents, previous_groups, max_tokens=MAX_SHARD_TOKENS, count_tokens=estimate_tokens):
+    """Refaz os shards mantendo a composição da validação anterior.
+
+    Grupos anteriores cujos recursos continuam presentes (e ainda cabem em
+    `max_tokens`) são mantidos, para que um recurso editado invalide apenas o
+    seu shard; recursos novos e de grupos desfeitos formam novos shards. Os
+    shards seguem a ordem dos documentos.
+    """
+    texts = {}
+    for doc in documents:
+        key = resource_key(doc)
+        if key in texts:
+            # Recursos com nome repetido não podem ser identificados entre validações
+            return shard_documents(documents, max_tokens, count_tokens)
+        texts[key] = yaml.safe_dump(doc, sort_keys=False, allow_unicode=True)
+    order = {key: index for index, key in enumerate(texts)}
+
+    shards, used = [], set()
+    for group in previous_groups:
+        if not group or any(key not in texts or key in used for key in group):
+            continue
+        if len(group) > 1 and sum(count_tokens(texts[key]) for key in group) > max_tokens:
+            continue
+        shards.append([(key, texts[key]) for key in group])
+        used.update(group)
+    leftover = [doc for doc in documents if resource_key(doc) not in used]
+    shards += shard_documents(leftover, max_tokens, count_tokens)
+    return sorted(shards, key=lambda shard: min(order[key] for key, _ in shard))
+
+
+def merge_shard_replies(shards, replies):
+    """Mescla as respostas de vários shards em um único texto, identificando os recursos de cada parte."""
+    if len(replies) == 1:
+        return replies[0]
+    parts = []
+    for index, (shard, reply) in enumerate(zip(shards, replies), start=1):
+        resources = ", ".join(resource for resource, _ in shard)
+        parts.append(f"#### Parte {index}/{len(replies)} ({resources})\n{reply}")
+    return "\n\n".join(parts)
@@ -0,0 +1,276 @@
+"""Motor de regras determinísticas para manifestos Kubernetes.
+
+Cobre a parte mecânica do que os agentes de segurança e de recursos verificam
+(privileged, runAsNonRoot, requests/limits, probes, hostNetwork, PDB,
+NetworkPolicy...). As regras percorrem os documentos já interpretados e
+produzem achados em microssegundos, sem nenhuma chamada ao LLM.
+"""
+import re
+
+WORKLOAD_KINDS = ("Pod", "Deployment", "StatefulSet", "DaemonSet", "ReplicaSet", "Job", "CronJob")
+REPLICATED_KINDS = ("Deployment", "StatefulSet", "ReplicaSet")
+SEVERITY_ORDER = {"Crítico": 0, "Alto": 1, "Médio": 2, "Baixo": 3}
+SECRET_ENV_PATTERN = re.compile(r"(PASSWORD|PASSWD|SECRET|TOKEN|API_?KEY|PRIVATE_?KEY|CREDENTIAL)", re.IGNORECASE)
+
+# O que as regras decidem por agente; o LLM só é consultado sobre o restante
+RULE_COVERAGE = {
+    "seguranca": [
+        "containers privilegiados e runAsUser 0",
+        "runAsNonRoot, allowPrivilegeEscalation, readOnlyRootFilesystem e capabilities drop ALL",
+        "hostNetwork, hostPID, hostIPC e volumes hostPath",
+        "variáveis de ambiente com aparência de segredo em texto puro",
+        "ausência de NetworkPolicy",
+        "ClusterRoleBinding para cluster-admin ou grupos genéricos",
+    ],
+    "recursos": [
+        "presença de requests e limits de CPU/memória",
+        "limits menores que requests",
+        "presença de livenessProbe e readinessProbe",
+        "ausência de PodDisruptionBudget para workloads replicados",
+        "HPA sem métricas ou com minReplicas < 2",
+    ],
+}
+
+# Perguntas que as regras não conseguem responder e continuam com o agente
+LLM_REMAINING_SCOPE = {
+    "seguranca": "segredos em ConfigMaps, permissões RBAC excessivas em Roles, imagens e tags, e riscos dependentes de contexto",
+    "recursos": "adequação dos valores (proporção limits/requests, thresholds e timeouts das probes, terminationGracePeriodSeconds, métricas do HPA)",
+}
+
+
+def _mapping(value):
+    """O próprio valor se for um mapeamento; {} para campos ausentes ou malformados (ex: `metadata: "x"`)."""
+    return value if isinstance(value, dict) else {}
+
+
+def resource_key(doc):
+    """Identificador do recurso no formato 'Kind/nome'."""
+    return f"{doc.get('kind', 'Desconhecido')}/{_mapping(doc.get('metadata')).get('name', 'sem-nome')}"
+
+
+def pod_spec(doc):
+    """Retorna o PodSpec de um workload (Pod, Deployment, CronJob...) ou None."""
+    kind = doc.get("kind")
+    spec = _mapping(doc.get("spec"))
+    if kind == "Pod":
+        return spec
+    if kind == "CronJob":
+        spec = _mapping(_mapping(spec.get("jobTemplate")).get("spec"))
+    if kind in WORKLOAD_KINDS:
+        return _mapping(_mapping(spec.get("template")).get("spec"))
+    return None
+
+
+def _containers(spec):
+    for field in ("initContainers", "containers"):
+        for container in spec.get(field) or []:
+            if isinstance(container, dict):
+                yield field, container
+
+
+def parse_quantity(value):
+    """Converte uma quantidade Kubernetes (ex: '500m', '256Mi', '1') em float; None se inválida."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    suffixes = {
+        "Ki": 2 ** 10, "Mi": 2 ** 20, "Gi": 2 ** 30, "Ti": 2 ** 40,
+        "K": 1e3, "k": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "m": 1e-3,
+    }
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if text.endswith(suffix):
+            try:
+                return float(text[:-len(suffix)]) * suffixes[suffix]
+            except ValueError:
+                return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _finding(rule_id, category, severity, resource, location, problem, fix):
+    return {
+        "rule": rule_id,
+        "category": category,
+        "severity": severity,
+        "resource": resource,
+        "location": location,
+        "problem": problem,
+        "fix": fix,
+    }
+
+
+# --- Regras de Segurança ---
+def check_pod_security(doc, spec):
+    """Verifica securityContext de pod e containers, acessos ao host e segredos em env."""
+    resource = resource_key(doc)
+    findings = []
+    pod_context = _mapping(spec.get("securityContext"))
+
+    for flag in ("hostNetwork", "hostPID", "hostIPC"):
+        if spec.get(flag) is True:
+            findings.append(_finding("SEC006", "seguranca", "Alto", resource, f"spec/{flag}",
+                                     f"`{flag}: true` compartilha namespaces do nó", f"Remover `{flag}` ou definir `{flag}: false`"))
+    for volume in spec.get("volumes") or []:
+        if isinstance(volume, dict) and "hostPath" in volume:
+            findings.append(_finding("SEC007", "seguranca", "Alto", resource, f"spec/volumes/{volume.get('name')}",
+                                     "Volume `hostPath` expõe o sistema de arquivos do nó", "Usar PVC, `emptyDir` ou ConfigMap/Secret"))
+
+    for field, container in _containers(spec):
+        location = f"spec/{field}/{container.get('name', '?')}"
+        context = _mapping(container.get("securityContext"))
+        if context.get("privileged") is True:
+            findings.append(_finding("SEC001", "seguranca", "Crítico", resource, f"{location}/securityContext",
+                                     "Container com `privileged: true`", "`privileged: false`"))
+        run_as_user = context.get("runAsUser", pod_context.get("runAsUser"))
+        if run_as_user == 0:
+            findings.append(_finding("SEC010", "seguranca", "Crítico", resource, f"{location}/securityContext",
+                                     "Container roda como root (`runAsUser: 0`)", "`runAsUser: 1001`"))
+        if context.get("runAsNonRoot", pod_context.get("runAsNonRoot")) is not True:
+            findings.append(_finding("SEC002", "seguranca", "Alto", resource, f"{location}/securityContext",
+                                     "`runAsNonRoot: true` ausente (pod e container)", "`securityContext: {runAsNonRoot: true}`"))
+        if context.get("allowPrivilegeEscalation") is not False:
+            findings.append(_finding("SEC003", "seguranca", "Alto", resource, f"{location}/securityContext",
+                                     "`allowPrivilegeEscalation` não está definido como `false`", "`allowPrivilegeEscalation: false`"))
+        if context.get("readOnlyRootFilesystem") is not True:
+            findings.append(_finding("SEC004", "seguranca", "Médio", resource, f"{location}/securityContext",
+                                     "Sistema de arquivos raiz gravável", "`readOnlyRootFilesystem: true`"))
+        dropped = [str(cap).upper() for cap in (_mapping(context.get("capabilities")).get("drop") or [])]
+        if "ALL" not in dropped:
+            findings.append(_finding("SEC005", "seguranca", "Médio", resource, f"{location}/securityContext/capabilities",
+                                     "Capabilities não são removidas (`drop: [ALL]` ausente)", "`capabilities: {drop: [ALL]}`"))
+        for env in container.get("env") or []:
+            if isinstance(env, dict) and "value" in env and SECRET_ENV_PATTERN.search(str(env.get("name", ""))):
+                findings.append(_finding("SEC008", "seguranca", "Alto", resource, f"{location}/env/{env.get('name')}",
+                                         "Valor com aparência de segredo em texto puro", "Usar `valueFrom.secretKeyRef`"))
+    return findings
+
+
+def check_rbac(doc):
+    """Sinaliza ClusterRoleBindings para cluster-admin ou para grupos genéricos."""
+    if doc.get("kind") != "ClusterRoleBinding":
+        return []
+    resource = resource_key(doc)
+    findings = []
+    if _mapping(doc.get("roleRef")).get("name") == "cluster-admin":
+        findings.append(_finding("SEC011", "seguranca", "Crítico", resource, "roleRef",
+                                 "Vínculo com `cluster-admin`", "Criar Role/ClusterRole com permissões mínimas"))
+    for subject in doc.get("subjects") or []:
+        if isinstance(subject, dict) and subject.get("name") in ("system:authenticated", "system:unauthenticated", "system:serviceaccounts"):
+            findings.append(_finding("SEC011", "seguranca", "Alto", resource, "subjects",
+                                     f"Subject genérico `{subject.get('name')}`", "Vincular apenas ServiceAccounts específicas"))
+    return findings
+
+
+# --- Regras de Recursos ---
+def check_pod_resources(doc, spec):
+    """Verifica requests/limits e probes de cada container."""
+    resource = resource_key(doc)
+    findings = []
+    long_running = doc.get("kind") not in ("Job", "CronJob")
+    for field, container in _containers(spec):
+        location = f"spec/{field}/{container.get('name', '?')}"
+        resources = _mapping(container.get("resources"))
+        requests = _mapping(resources.get("requests"))
+        limits = _mapping(resources.get("limits"))
+        missing_requests = [r for r in ("cpu", "memory") if r not in requests]
+        missing_limits = [r for r in ("cpu", "memory") if r not in limits]
+        if missing_requests:
+            findings.append(_finding("RES001", "recursos", "Alto", resource, f"{location}/resources/requests",
+                                     f"`requests` ausente para {', '.join(missing_requests)}", "Definir requests de CPU e memória"))
+        if missing_limits:
+            findings.append(_finding("RES002", "recursos", "Médio", resource, f"{location}/resources/limits",
+                                     f"`limits` ausente para {', '.join(missing_limits)}", "Definir limits de CPU e memória"))
+        for name in ("cpu", "memory"):
+            request, limit = parse_quantity(requests.get(name)), parse_quantity(limits.get(name))
+            if request is not None and limit is not None and limit < request:
+                findings.append(_finding("RES007", "recursos", "Alto", resource, f"{location}/resources",
+                                         f"`limits.{name}` menor que `requests.{name}`", "limits >= requests"))
+        if field == "containers" and long_running:
+            for probe, severity in (("readinessProbe", "Alto"), ("livenessProbe", "Médio")):
+                if not container.get(probe):
+                    findings.append(_finding("RES003" if probe == "livenessProbe" else "RES004", "recursos", severity, resource,
+                                             f"{location}/{probe}", f"`{probe}` ausente", f"Adicionar `{probe}` (httpGet/tcpSocket/exec)"))
+    return findings
+
+
+def check_hpa(doc):
+    """Verifica minReplicas e métricas de um HorizontalPodAutoscaler."""
+    if doc.get("kind") != "HorizontalPodAutoscaler":
+        return []
+    resource = resource_key(doc)
+    spec = _mapping(doc.get("spec"))
+    findings = []
+    try:
+        min_replicas = int(spec.get("minReplicas") or 1)
+    except (TypeError, ValueError):
+        findings.append(_finding("RES006", "recursos", "Médio", resource, "spec/minReplicas",
+                                 f"`minReplicas` não é um inteiro ({spec.get('minReplicas')!r})", "`minReplicas: 2`"))
+    else:
+        if min_replicas < 2:
+            findings.append(_finding("RES006", "recursos", "Baixo", resource, "spec/minReplicas",
+                                     "`minReplicas` < 2 (sem redundância)", "`minReplicas: 2`"))
+    if not spec.get("metrics") and spec.get("targetCPUUtilizationPercentage") is None:
+        findings.append(_finding("RES006", "recursos", "Médio", resource, "spec/metrics",
+                                 "HPA sem métricas definidas", "Definir métricas de CPU/memória"))
+    return findings
+
+
+# --- Regras de Conjunto (todos os documentos) ---
+def check_manifest_set(documents):
+    """Regras que dependem do conjunto de manifestos (NetworkPolicy e PDB)."""
+    kinds = {doc.get("kind") for doc in documents if isinstance(doc.get("kind"), str)}
+    workloads = [doc for doc in documents if doc.get("kind") in WORKLOAD_KINDS]
+    findings = []
+    if workloads and "NetworkPolicy" not in kinds:
+        findings.append(_finding("SEC009", "seguranca", "Médio", "Namespace (implícito)", "-",
+                                 "Ausência de NetworkPolicy para os workloads", "Criar NetworkPolicy default deny"))
+    replicated = [doc for doc in workloads if doc.get("kind") in REPLICATED_KINDS]
+    if replicated and "PodDisruptionBudget" not in kinds:
+        for doc in replicated:
+            findings.append(_finding("RES005", "recursos", "Médio", resource_key(doc), "-",
+                                     "Workload sem PodDisruptionBudget", "Criar PDB com `minAvailable` ou `maxUnavailable`"))
+    return findings
+
+
+def _run_rule(rule, category, resource, *args):
+    """Executa uma regra; um manifesto que ainda assim a quebra vira um achado, não uma falha da validação."""
+    try:
+        return rule(*args)
+    except Exception as exc:
+        return [_finding("GEN001", category, "Médio", resource, "-",
+                         f"Manifesto malformado: a regra `{rule.__name__}` não pôde ser avaliada ({type(exc).__name__}: {exc})",
+                         "Corrigir os tipos dos campos conforme o schema do recurso")]
+
+
+def run_rules(documents):
+    """Executa todas as regras sobre os documentos interpretados e retorna os achados ordenados."""
+    findings = []
+    documents = [doc for doc in documents if isinstance(doc, dict)]
+    for doc in documents:
+        resource = resource_key(doc)
+        spec = pod_spec(doc)
+        if spec is not None:
+            findings.extend(_run_rule(check_pod_security, "seguranca", resource, doc, spec))
+            findings.extend(_run_rule(check_pod_resources, "recursos", resource, doc, spec))
+        findings.extend(_run_rule(check_rbac, "seguranca", resource, doc))
+        findings.extend(_run_rule(check_hpa, "recursos", resource, doc))
+    findings.extend(_run_rule(check_manifest_set, "recursos", "Namespace (implícito)", documents))
+    findings.sort(key=lambda f: (f["category"], SEVERITY_ORDER.get(f["severity"], 9), f["resource"], f["rule"]))
+    return findings
+
+
+def format_findings(findings, category):
+    """Formata os achados de uma categoria como tabela Markdown (mesmo formato pedido aos agentes)."""
+    selected = [f for f in findings if f["category"] == category]
+    if not selected:
+        checks = "; ".join(RULE_COVERAGE.get(category, []))
+        return f"Nenhum problema encontrado pelas regras determinísticas. Verificações feitas: {checks}."
+    lines = [
+        "| Severidade | Regra | Problema Detectado | Localização (Recurso/Campo) | Correção Recomendada |",
+        "|------------|-------|--------------------|-----------------------------|----------------------|",
+    ]
+    for f in selected:
+        lines.append(f"| {f['severity']} | {f['rule']} | {f['problem']} | {f['resource']} `{f['location']}` | {f['fix']} |")
+    return "\n".join(lines)
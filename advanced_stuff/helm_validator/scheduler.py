@@ -0,0 +1,158 @@
+"""Escalonador de admissão de chamadas LLM compartilhado por todo o processo.
+
+Todas as sessões do Streamlit usam a mesma instância do `HelmValidationSystem`
+(via `st.cache_resource`); sem um limite global, dez usuários validando ao
+mesmo tempo enviam dezenas de requisições simultâneas a um único Ollama.
+O escalonador admite no máximo `max_concurrent` chamadas por vez e mantém
+as demais em uma fila limitada, ordenada por prioridade e, dentro da mesma
+prioridade, pela sessão com menos chamadas em andamento ou admitidas entre as
+últimas `fair_window` (justiça entre sessões, mesmo com `max_concurrent=1`). Com a fila cheia, novas chamadas são rejeitadas (backpressure).
+"""
+import itertools
+import logging
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor = atendida antes): o coordenador e o condensador concluem
+# validações já em andamento, então passam à frente de novos agentes.
+PRIORITY_COORDINATOR = 0
+PRIORITY_AGENT = 1
+
+
+class QueueFullError(RuntimeError):
+    """A fila de chamadas LLM está cheia; a chamada foi rejeitada."""
+
+
+class _Ticket:
+    __slots__ = ("session", "priority", "seq", "enqueued_at", "started_at")
+
+    def __init__(self, session, priority, seq):
+        self.session = session
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+
+
+class LLMScheduler:
+    """Fila de prioridade limitada, com justiça por sessão, para chamadas ao LLM."""
+
+    def __init__(self, max_concurrent=2, max_queue=32, history=500, fair_window=8):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._active = Counter()  # chamadas em andamento por sessão
+        self._recent = deque(maxlen=fair_window)  # sessões das últimas admissões
+        self._recent_counts = Counter()
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=history)
+        self._services = deque(maxlen=history)
+        self.served = 0
+        self.rejected = 0
+
+    def _order_key(self, ticket):
+        # Só as chamadas em andamento não bastam: com um slot, a sessão atendida nunca tem chamada ativa
+        load = self._active[ticket.session] + self._recent_counts[ticket.session]
+        return ticket.priority, load, ticket.seq
+
+    def _record_admission(self, session):
+        """Registra a sessão admitida na janela de justiça (chamador segura a condição)."""
+        if not self._recent.maxlen:
+            return
+        if len(self._recent) == self._recent.maxlen:
+            evicted = self._recent[0]
+            self._recent_counts[evicted] -= 1
+            if not self._recent_counts[evicted]:
+                del self._recent_counts[evicted]
+        self._recent.append(session)
+        self._recent_counts[session] += 1
+
+    def _next_ticket(self):
+        return min(self._waiting, key=self._order_key) if self._waiting else None
+
+    @contextmanager
+    def slot(self, session="default", priority=PRIORITY_AGENT, timeout=None):
+        """Aguarda a vez da chamada e libera o slot ao final.
+
+        Levanta `QueueFullError` se já houver `max_queue` chamadas aguardando e
+        `TimeoutError` se a chamada não for admitida em `timeout` segundos (ela
+        sai da fila, sem ocupar o servidor depois que o prazo já passou).
+        Produz um dicionário com `wait_s`, preenchido na admissão, e `service_s`,
+        preenchido na liberação.
+        """
+        timing = {"wait_s": 0.0, "service_s": 0.0}
+        with self._condition:
+            if len(self._waiting) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Fila do LLM cheia ({self.max_queue} chamadas aguardando). Tente novamente em instantes."
+                )
+            ticket = _Ticket(session, priority, next(self._seq))
+            self._waiting.append(ticket)
+            give_up_at = ticket.enqueued_at + timeout if timeout is not None else None
+            while sum(self._active.values()) >= self.max_concurrent or self._next_ticket() is not ticket:
+                remaining = give_up_at - time.perf_counter() if give_up_at is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._condition.notify_all()
+                    raise TimeoutError(f"Chamada não admitida na fila do LLM em {timeout:.1f}s.")
+                self._condition.wait(remaining)
+            self._waiting.remove(ticket)
+            self._active[session] += 1
+            self._record_admission(session)
+            ticket.started_at = time.perf_counter()
+            timing["wait_s"] = ticket.started_at - ticket.enqueued_at
+            # Outro ticket pode ter se tornado o próximo da fila
+            self._condition.notify_all()
+        try:
+            yield timing
+        finally:
+            finished_at = time.perf_counter()
+            timing["service_s"] = finished_at - ticket.started_at
+            with self._condition:
+                self._active[session] -= 1
+                if not self._active[session]:
+                    del self._active[session]
+                self.served += 1
+                self._waits.append(timing["wait_s"])
+                self._services.append(timing["service_s"])
+                self._condition.notify_all()
+
+    def queue_position(self, session):
+        """Posição (1 = próxima) da primeira chamada da sessão na fila, ou None se nenhuma estiver aguardando."""
+        with self._condition:
+            ordered = sorted(self._waiting, key=self._order_key)
+        for position, ticket in enumerate(ordered, start=1):
+            if ticket.session == session:
+                return position
+        return None
+
+    def stats(self):
+        """Estado atual e métricas recentes de espera na fila versus tempo de atendimento."""
+        with self._condition:
+            waits, services = list(self._waits), list(self._services)
+            state = {
+                "active": sum(self._active.values()),
+                "waiting": len(self._waiting),
+                "sessions": len({ticket.session for ticket in self._waiting} | set(self._active)),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "served": self.served,
+                "rejected": self.rejected,
+            }
+        for name, values in (("wait", waits), ("service", services)):
+            state[f"{name}_avg_s"] = round(statistics.fmean(values), 3) if values else None
+            state[f"{name}_p95_s"] = round(_percentile(values, 95), 3) if values else None
+        return state
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,171 @@
+"""Validação de schema Kubernetes em processo, sem subprocessos e sem rede.
+
+Substitui o `kubeval` (que baixa os schemas a cada execução) por um pacote
+local de JSON Schemas no formato do projeto `kubernetes-json-schema`
+(ex: `v1.29.0-standalone-strict/deployment-apps-v1.json`). O diretório é
+indexado uma única vez; os kinds mais comuns (`COMMON_KINDS`) são compilados
+na carga e os demais na primeira vez que o (apiVersion, kind) aparece; o
+validador compilado fica em memória.
+
+Usa `fastjsonschema` (gera código Python, mais rápido) ou `jsonschema`,
+o que estiver instalado. Sem nenhum dos dois, ou sem o pacote de schemas,
+o validador fica indisponível e o sistema volta a usar o `kubeval`.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from rule_engine import resource_key
+from validation_cache import content_hash
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEMA_DIR = os.environ.get(
+    "HELM_VALIDATOR_SCHEMA_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "helm_validator", "schemas")
+)
+
+# Formatos específicos do Kubernetes presentes nos schemas; o tipo já é verificado pelo próprio schema
+KUBERNETES_FORMATS = ("int-or-string", "int32", "int64", "double", "byte", "quantity")
+
+# (apiVersion, kind) que quase todo chart gera; compilados na carga para que a primeira validação não pague a compilação
+COMMON_KINDS = (
+    ("v1", "ConfigMap"), ("v1", "Secret"), ("v1", "Service"), ("v1", "ServiceAccount"),
+    ("v1", "PersistentVolumeClaim"), ("apps/v1", "Deployment"), ("apps/v1", "StatefulSet"),
+    ("apps/v1", "DaemonSet"), ("batch/v1", "Job"), ("batch/v1", "CronJob"),
+    ("networking.k8s.io/v1", "Ingress"), ("networking.k8s.io/v1", "NetworkPolicy"),
+    ("autoscaling/v2", "HorizontalPodAutoscaler"), ("policy/v1", "PodDisruptionBudget"),
+    ("rbac.authorization.k8s.io/v1", "Role"), ("rbac.authorization.k8s.io/v1", "RoleBinding"),
+)
+
+
+def schema_filename(api_version, kind):
+    """Nome do arquivo de schema para (apiVersion, kind), na convenção do kubernetes-json-schema.
+
+    "apps/v1" + Deployment -> "deployment-apps-v1.json"; "v1" + Service -> "service-v1.json";
+    grupos com domínio usam só o primeiro segmento ("networking.k8s.io/v1" -> "networking").
+    """
+    group, _, version = api_version.rpartition("/")
+    suffix = f"-{group.split('.')[0]}-{version}" if group else f"-{version}"
+    return f"{kind.lower()}{suffix.lower()}.json"
+
+
+class SchemaValidator:
+    """Valida documentos Kubernetes contra schemas locais, com validadores compilados em memória."""
+
+    def __init__(self, schema_dir=DEFAULT_SCHEMA_DIR, engine=None):
+        self.schema_dir = schema_dir
+        self.engine = engine or ("fastjsonschema" if fastjsonschema else "jsonschema" if jsonschema else None)
+        self._files = {}
+        self._validators = {}
+        self._lock = threading.Lock()
+        if os.path.isdir(schema_dir):
+            self._files = {name: os.path.join(schema_dir, name) for name in os.listdir(schema_dir) if name.endswith(".json")}
+        # Identifica o pacote de schemas nas chaves de cache (trocar de versão invalida os resultados)
+        self.fingerprint = content_hash(
+            self.engine, schema_dir, sorted((name, os.path.getsize(path)) for name, path in self._files.items())
+        )
+        if self.available:
+            logger.info(f"SchemaValidator: {len(self._files)} schemas em {schema_dir} (engine={self.engine}).")
+        else:
+            logger.info(f"SchemaValidator indisponível (schemas em {schema_dir}: {len(self._files)}, engine={self.engine}).")
+
+    @property
+    def available(self):
+        return bool(self._files) and self.engine is not None
+
+    def _compile(self, schema):
+        """Compila um schema em uma função documento -> lista de erros."""
+        if self.engine == "fastjsonschema":
+            validate = fastjsonschema.compile(schema, formats={name: lambda value: True for name in KUBERNETES_FORMATS})
+
+            def check(document):
+                try:
+                    validate(document)
+                except fastjsonschema.JsonSchemaValueException as e:
+                    # fastjsonschema interrompe no primeiro erro
+                    return [e.message]
+                return []
+            return check
+
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        validator = validator_class(schema)
+
+        def check(document):
+            errors = []
+            for error in validator.iter_errors(document):
+                path = ".".join(str(part) for part in error.absolute_path)
+                errors.append(f"{path}: {error.message}" if path else error.message)
+            return errors
+        return check
+
+    def validator_for(self, api_version, kind):
+        """Retorna o validador compilado de (apiVersion, kind), ou None se não houver schema."""
+        key = (api_version, kind)
+        if key in self._validators:
+            return self._validators[key]
+        with self._lock:
+            if key not in self._validators:
+                path = self._files.get(schema_filename(api_version, kind))
+                check = None
+                if path:
+                    start = time.perf_counter()
+                    with open(path) as f:
+                        check = self._compile(json.load(f))
+                    logger.debug(f"Schema {os.path.basename(path)} compilado em {(time.perf_counter() - start) * 1000:.1f} ms.")
+                self._validators[key] = check
+        return self._validators[key]
+
+    def precompile(self, kinds):
+        """Compila antecipadamente os validadores de uma lista de (apiVersion, kind)."""
+        for api_version, kind in kinds:
+            self.validator_for(api_version, kind)
+
+    def validate_documents(self, documents):
+        """Valida cada documento e retorna [{resource, api_version, status, errors}].
+
+        `status` é "valid", "invalid" ou "skipped" (sem apiVersion/kind ou sem schema, ex: CRDs).
+        """
+        report = []
+        for doc in documents:
+            api_version, kind = doc.get("apiVersion"), doc.get("kind")
+            entry = {"resource": resource_key(doc), "api_version": api_version, "status": "skipped", "errors": []}
+            if not isinstance(api_version, str) or not isinstance(kind, str):
+                entry["errors"] = ["apiVersion/kind ausentes"]
+            else:
+                check = self.validator_for(api_version, kind)
+                if check is None:
+                    entry["errors"] = ["schema não encontrado no pacote local"]
+                else:
+                    entry["errors"] = check(doc)
+                    entry["status"] = "invalid" if entry["errors"] else "valid"
+            report.append(entry)
+        return report
+
+
+def format_schema_report(report):
+    """Formata o relatório no estilo do kubeval ("PASS - ...", "ERR - ..."), prefixando "ERRO (schema)" se houver falhas."""
+    labels = {"valid": "PASS", "invalid": "ERR", "skipped": "SKIP"}
+    lines = []
+    for entry in report:
+        line = f"{labels[entry['status']]} - {entry['resource']} ({entry['api_version']})"
+        lines.append(f"{line}: {'; '.join(entry['errors'])}" if entry["errors"] else line)
+    invalid = sum(1 for entry in report if entry["status"] == "invalid")
+    if invalid:
+        header = f"ERRO (schema): {invalid} de {len(report)} documento(s) inválido(s)."
+    else:
+        header = f"Validação de schema bem-sucedida: {len(report)} documento(s)."
+    return "\n".join([header] + lines)
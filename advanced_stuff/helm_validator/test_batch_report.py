@@ -0,0 +1,36 @@
+"""Relatório do lote: registros curados e níveis SARIF."""
+import pytest
+
+# batch_validate importa o validador completo (streamlit, autogen)
+batch_validate = pytest.importorskip("batch_validate")
+
+JOB = {"chart": "web", "template": "templates/deployment.yaml"}
+RESULTS = {
+    "technical_validations": {"helm_lint": "ERRO: Executável 'helm' não encontrado.", "schema": "PASS"},
+    "llm_validations": {"sintaxe": "ok"},
+    "summary": "## Resumo",
+    "rule_findings": [{"rule": "SEC001", "severity": "Crítico", "resource": "Pod/p", "location": "-", "problem": "x", "fix": "y"}],
+    "agent_replies": {"chave": "ok"},
+    "rendered_manifest": "kind: Pod\n" * 1000,
+    "queue": {"calls": 3},
+    "deadline": {"timed_out": ["recursos"]},
+    "stage_errors": {},
+}
+
+
+def test_report_entry_drops_internal_state():
+    entry = batch_validate.report_entry(JOB, RESULTS, 1.23456)
+    assert set(entry) == {
+        "chart", "template", "duration_seconds", "technical_validations", "llm_validations", "summary", "findings",
+        "incomplete_stages",
+    }
+    assert entry["duration_seconds"] == 1.235
+    assert entry["incomplete_stages"] == ["recursos"]
+
+
+def test_reports_use_the_curated_entries():
+    entry = batch_validate.report_entry(JOB, RESULTS, 1.0)
+    report = batch_validate.build_json_report([entry], "modelo", 2.0)
+    assert report["templates_with_errors"] == 1
+    rule_ids = {result["ruleId"] for result in batch_validate.build_sarif_report([entry])["runs"][0]["results"]}
+    assert rule_ids == {"helm_lint", "SEC001", "sintaxe"}
@@ -0,0 +1,49 @@
+"""Propagação de falhas e prazos no executor de estágios."""
+import threading
+
+from pipeline import StageGraph
+
+
+def fail(inputs):
+    raise ValueError("quebrou")
+
+
+def test_dependents_run_on_fallback_when_stage_raises():
+    graph = StageGraph()
+    graph.add_stage("render", fail, fallback=lambda name, exc: f"substituto ({exc})")
+    graph.add_stage("agent", lambda inputs: inputs["render"].upper(), deps=["render"])
+    results = graph.run()
+    assert results == {"render": "substituto (quebrou)", "agent": "SUBSTITUTO (QUEBROU)"}
+    assert isinstance(graph.errors["render"], ValueError)
+    assert graph.timed_out == []
+
+
+def test_dependents_skipped_when_stage_raises_without_fallback():
+    graph = StageGraph()
+    graph.add_stage("render", fail)
+    graph.add_stage("agent", lambda inputs: "nunca", deps=["render"])
+    graph.add_stage("lint", lambda inputs: "ok")
+    results = graph.run()
+    assert results == {"lint": "ok"}
+    assert set(graph.errors) == {"render", "agent"}
+
+
+def test_timed_out_stage_delivers_fallback_with_timeout_error():
+    release = threading.Event()
+    graph = StageGraph()
+    graph.add_stage("slow", lambda inputs: release.wait(5), timeout=0.05, fallback=lambda name, exc: type(exc).__name__)
+    graph.add_stage("after", lambda inputs: inputs["slow"], deps=["slow"])
+    try:
+        results = graph.run()
+    finally:
+        release.set()
+    assert results == {"slow": "TimeoutError", "after": "TimeoutError"}
+    assert graph.timed_out == ["slow"]
+
+
+def test_on_stage_done_receives_fallbacks():
+    done = []
+    graph = StageGraph()
+    graph.add_stage("render", fail, fallback=lambda name, exc: "substituto")
+    graph.run(on_stage_done=lambda name, value: done.append((name, value)))
+    assert done == [("render", "substituto")]
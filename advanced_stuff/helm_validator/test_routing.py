@@ -0,0 +1,52 @@
+"""Shards por orçamento de tokens e sua estabilidade entre validações."""
+from routing import reshard_documents, shard_documents
+
+
+def doc(name, kind="ConfigMap", size=1):
+    return {"kind": kind, "metadata": {"name": name}, "data": {"k": "x " * size}}
+
+
+def count_lines(text):
+    return len(text.splitlines())
+
+
+def keys(shards):
+    return [[key for key, _ in shard] for shard in shards]
+
+
+def test_shards_respect_budget_and_order():
+    docs = [doc("a"), doc("b"), doc("c")]
+    # Cada documento tem 5 linhas: dois cabem em 10
+    assert keys(shard_documents(docs, max_tokens=10, count_tokens=count_lines)) == [
+        ["ConfigMap/a", "ConfigMap/b"], ["ConfigMap/c"]
+    ]
+
+
+def test_document_larger_than_budget_gets_its_own_shard():
+    docs = [doc("a"), doc("big"), doc("b")]
+    assert keys(shard_documents(docs, max_tokens=2, count_tokens=count_lines)) == [
+        ["ConfigMap/a"], ["ConfigMap/big"], ["ConfigMap/b"]
+    ]
+    assert shard_documents([]) == []
+
+
+def test_reshard_keeps_previous_groups_and_shards_new_resources():
+    docs = [doc("a"), doc("b"), doc("c"), doc("d")]
+    previous = [["ConfigMap/a", "ConfigMap/c"], ["ConfigMap/b"]]
+    shards = reshard_documents(docs, previous, max_tokens=10, count_tokens=count_lines)
+    assert keys(shards) == [["ConfigMap/a", "ConfigMap/c"], ["ConfigMap/b"], ["ConfigMap/d"]]
+
+
+def test_reshard_drops_groups_with_removed_or_oversized_resources():
+    docs = [doc("a"), doc("b"), doc("c", size=50)]
+    previous = [["ConfigMap/a", "ConfigMap/gone"], ["ConfigMap/b", "ConfigMap/c"]]
+    shards = reshard_documents(docs, previous, max_tokens=10, count_tokens=count_lines)
+    assert keys(shards) == [["ConfigMap/a", "ConfigMap/b"], ["ConfigMap/c"]]
+
+
+def test_reshard_with_repeated_names_falls_back_to_fresh_shards():
+    docs = [doc("a"), doc("a"), doc("b")]
+    previous = [["ConfigMap/b"], ["ConfigMap/a"]]
+    assert reshard_documents(docs, previous, max_tokens=10, count_tokens=count_lines) == shard_documents(
+        docs, max_tokens=10, count_tokens=count_lines
+    )
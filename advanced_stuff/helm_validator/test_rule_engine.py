@@ -0,0 +1,77 @@
+"""Regras determinísticas, inclusive sobre manifestos malformados."""
+import yaml
+
+from rule_engine import format_findings, pod_spec, resource_key, run_rules
+
+
+def rules_of(findings):
+    return {(f["rule"], f["resource"]) for f in findings}
+
+
+def test_secure_deployment_has_no_pod_findings():
+    doc = yaml.safe_load("""
+kind: Deployment
+metadata: {name: web}
+spec:
+  template:
+    spec:
+      securityContext: {runAsNonRoot: true}
+      containers:
+        - name: app
+          securityContext:
+            allowPrivilegeEscalation: false
+            readOnlyRootFilesystem: true
+            capabilities: {drop: [ALL]}
+          resources:
+            requests: {cpu: 100m, memory: 128Mi}
+            limits: {cpu: 200m, memory: 256Mi}
+          readinessProbe: {tcpSocket: {port: 80}}
+          livenessProbe: {tcpSocket: {port: 80}}
+""")
+    findings = run_rules([doc])
+    # Só as regras de conjunto: sem NetworkPolicy e sem PDB
+    assert rules_of(findings) == {("SEC009", "Namespace (implícito)"), ("RES005", "Deployment/web")}
+
+
+def test_privileged_root_container_and_limits_below_requests():
+    doc = {
+        "kind": "Pod", "metadata": {"name": "p"},
+        "spec": {"containers": [{
+            "name": "c",
+            "securityContext": {"privileged": True, "runAsUser": 0},
+            "resources": {"requests": {"memory": "1Gi"}, "limits": {"memory": "512Mi"}},
+        }]},
+    }
+    rules = {f["rule"] for f in run_rules([doc])}
+    assert {"SEC001", "SEC010", "RES007"} <= rules
+
+
+def test_hpa_min_replicas_as_string_is_reported_not_raised():
+    doc = {"kind": "HorizontalPodAutoscaler", "metadata": {"name": "h"}, "spec": {"minReplicas": "2", "metrics": [{}]}}
+    assert run_rules([doc]) == []
+    doc["spec"]["minReplicas"] = "dois"
+    findings = run_rules([doc])
+    assert [f["rule"] for f in findings] == ["RES006"]
+    assert "não é um inteiro" in findings[0]["problem"]
+
+
+def test_malformed_fields_do_not_raise():
+    doc = {"kind": "Deployment", "metadata": "web", "spec": {"template": "x"}}
+    assert resource_key(doc) == "Deployment/sem-nome"
+    assert pod_spec(doc) == {}
+    run_rules([doc, {"kind": ["lista"]}, "não é um documento"])
+
+
+def test_rule_exception_becomes_finding(monkeypatch):
+    import rule_engine
+
+    def broken(doc):
+        raise KeyError("boom")
+
+    monkeypatch.setattr(rule_engine, "check_rbac", broken)
+    findings = run_rules([{"kind": "ConfigMap", "metadata": {"name": "cm"}}])
+    assert [(f["rule"], f["category"], f["resource"]) for f in findings] == [("GEN001", "seguranca", "ConfigMap/cm")]
+
+
+def test_format_findings_without_findings_lists_checks():
+    assert "Verificações feitas" in format_findings([], "seguranca")
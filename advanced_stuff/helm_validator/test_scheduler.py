@@ -0,0 +1,79 @@
+"""Admissão do escalonador: prioridade, justiça entre sessões e backpressure."""
+import threading
+import time
+
+import pytest
+
+from scheduler import PRIORITY_AGENT, PRIORITY_COORDINATOR, LLMScheduler, QueueFullError
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condição não atingida"
+        time.sleep(0.001)
+
+
+def admission_order(scheduler, calls):
+    """Enfileira `calls` [(nome, sessão, prioridade)] com o único slot ocupado e retorna a ordem de admissão."""
+    order = []
+
+    def call(name, session, priority):
+        with scheduler.slot(session, priority):
+            order.append(name)
+
+    threads = []
+    with scheduler.slot("holder"):
+        for waiting, args in enumerate(calls, start=1):
+            threads.append(threading.Thread(target=call, args=args))
+            threads[-1].start()
+            wait_until(lambda: scheduler.stats()["waiting"] == waiting)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_coordinator_passes_queued_agents():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = admission_order(scheduler, [
+        ("agent1", "s1", PRIORITY_AGENT), ("agent2", "s1", PRIORITY_AGENT), ("coordinator", "s1", PRIORITY_COORDINATOR),
+    ])
+    assert order == ["coordinator", "agent1", "agent2"]
+
+
+def test_sessions_alternate_with_a_single_slot():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = admission_order(scheduler, [
+        ("a1", "a", PRIORITY_AGENT), ("a2", "a", PRIORITY_AGENT), ("a3", "a", PRIORITY_AGENT), ("b1", "b", PRIORITY_AGENT),
+    ])
+    # Sem a janela de justiça, "b" esperaria as três chamadas de "a"
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_full_queue_rejects_new_calls():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=1)
+    def queued():
+        with scheduler.slot("s"):
+            pass
+
+    with scheduler.slot("holder"):
+        waiter = threading.Thread(target=queued)
+        waiter.start()
+        wait_until(lambda: scheduler.stats()["waiting"] == 1)
+        with pytest.raises(QueueFullError):
+            with scheduler.slot("s"):
+                pass
+    waiter.join(5)
+    assert scheduler.rejected == 1
+
+
+def test_timed_out_call_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrent=1)
+    with scheduler.slot("holder"):
+        with pytest.raises(TimeoutError):
+            with scheduler.slot("s", timeout=0.05):
+                pass
+        assert scheduler.stats()["waiting"] == 0
+        assert scheduler.queue_position("s") is None
+    with scheduler.slot("s", timeout=1) as timing:
+        assert timing["wait_s"] < 1
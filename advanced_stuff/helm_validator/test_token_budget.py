@@ -0,0 +1,57 @@
+"""Condensação map-reduce das seções do prompt do coordenador."""
+import threading
+
+import pytest
+
+from token_budget import TokenCounter, allocate_budget, condense_sections
+
+# Um token por palavra, para que os tamanhos sejam fáceis de conferir
+WORDS = TokenCounter(tokenizer=str.split)
+
+
+def words(count, word="achado"):
+    return " ".join([word] * count)
+
+
+def test_sections_within_budget_are_not_condensed():
+    calls = []
+    sections = {"a": words(10), "b": words(20)}
+    condensed, report = condense_sections(sections, 40, lambda text, target: calls.append(text), WORDS, chunk_tokens=8)
+    assert condensed == sections and report == {} and calls == []
+
+
+def test_only_oversized_sections_are_condensed_to_their_share():
+    sections = {"small": words(10), "big": words(100)}
+
+    def condense(text, target):
+        return words(target, "resumo")
+
+    condensed, report = condense_sections(sections, 50, condense, WORDS, chunk_tokens=30)
+    assert condensed["small"] == sections["small"]
+    assert "achado" not in condensed["big"]
+    assert report == {"big": (100, WORDS.count(condensed["big"]))}
+    assert WORDS.count(condensed["big"]) <= allocate_budget({"small": 10, "big": 100}, 50)["big"]
+
+
+def test_condenser_that_never_shrinks_is_cut_with_marker():
+    rounds = []
+    lock = threading.Lock()
+
+    def condense(text, target):
+        with lock:
+            rounds.append(target)
+        return text
+
+    condensed, report = condense_sections({"big": words(200)}, 50, condense, WORDS, chunk_tokens=40, max_rounds=2)
+    assert condensed["big"].endswith("[... condensado por limite de contexto]")
+    assert report["big"][1] <= 50
+    # Cada uma das duas rodadas condensou todos os trechos
+    assert len(rounds) == 2 * 5
+
+
+def test_condenser_error_propagates():
+    def condense(text, target):
+        raise RuntimeError("LLM indisponível")
+
+    with pytest.raises(RuntimeError, match="LLM indisponível"):
+        condense_sections({"big": words(100)}, 10, condense, WORDS, chunk_tokens=20)
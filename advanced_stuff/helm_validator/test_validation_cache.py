@@ -0,0 +1,12 @@
+"""Regressões do hash de conteúdo usado nas chaves de cache e na revalidação incremental."""
+import yaml
+
+from validation_cache import content_hash
+
+
+def test_content_hash_accepts_yaml_dates():
+    # YAML converte valores como 2024-01-01 em datetime.date, que o json não serializa por padrão
+    doc = yaml.safe_load("apiVersion: v1\nkind: ConfigMap\ndata:\n  release: 2024-01-01\n  built: 2024-01-01T10:00:00Z\n")
+    assert content_hash(doc) == content_hash(doc)
+    changed = yaml.safe_load("apiVersion: v1\nkind: ConfigMap\ndata:\n  release: 2024-01-02\n  built: 2024-01-01T10:00:00Z\n")
+    assert content_hash(doc) != content_hash(changed)
@@ -0,0 +1,70 @@
+"""Matriz de values: combinações, agrupamento por manifesto e respostas compartilhadas."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from values_matrix import (
+    MAX_COMBINATIONS, SharedReplies, build_matrix, group_by_manifest, helm_values_args, lint_summary, parse_override_axis,
+)
+
+
+def test_parse_override_axis():
+    assert parse_override_axis(" hpa.enabled = true,false ") == ("hpa.enabled", ["true", "false"])
+    for text in ("hpa.enabled", "=true", "hpa.enabled=true,,false"):
+        with pytest.raises(ValueError):
+            parse_override_axis(text)
+
+
+def test_build_matrix_is_the_cartesian_product():
+    matrix = build_matrix(["prod.yaml", "dev.yaml"], [("hpa.enabled", ["true", "false"])])
+    assert [c["name"] for c in matrix] == [
+        "prod.yaml + hpa.enabled=true", "prod.yaml + hpa.enabled=false",
+        "dev.yaml + hpa.enabled=true", "dev.yaml + hpa.enabled=false",
+    ]
+    assert helm_values_args(matrix[0]) == ["-f", "prod.yaml", "--set", "hpa.enabled=true"]
+    assert build_matrix() == [{"name": "values padrão", "files": [], "set": {}}]
+
+
+def test_build_matrix_rejects_too_many_combinations():
+    with pytest.raises(ValueError):
+        build_matrix([], [("a", [str(i) for i in range(MAX_COMBINATIONS + 1)])])
+
+
+def test_group_by_manifest_merges_identical_renders():
+    combinations = build_matrix([], [("x", ["1", "2", "3"])])
+    renders = [{"manifest": "a", "error": None}, {"manifest": "b", "error": None}, {"manifest": "a", "error": None}]
+    groups = group_by_manifest(zip(combinations, renders))
+    assert [[c["name"] for c in group["combinations"]] for group in groups] == [["x=1", "x=3"], ["x=2"]]
+
+
+def test_lint_summary():
+    assert lint_summary("==> Linting .\n\n1 chart(s) linted, 0 chart(s) failed") == "OK"
+    assert lint_summary("[ERROR] a\n[ERROR] b\nError: 1 chart(s) linted, 1 chart(s) failed") == "[ERROR] a (+1)"
+
+
+def test_shared_replies_compute_each_key_once_across_threads():
+    shared, calls, gate = SharedReplies(), [], threading.Event()
+
+    def compute():
+        calls.append(1)
+        gate.wait(1)
+        return "resposta"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(shared.get_or_run, "sintaxe", compute) for _ in range(4)]
+        time.sleep(0.05)
+        gate.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1
+    assert sorted(reused for _, reused in results) == [False, True, True, True]
+    assert {reply for reply, _ in results} == {"resposta"}
+
+
+def test_shared_replies_propagate_errors_to_waiters():
+    shared = SharedReplies()
+    with pytest.raises(RuntimeError):
+        shared.get_or_run("k", lambda: (_ for _ in ()).throw(RuntimeError("falhou")))
+    with pytest.raises(RuntimeError):
+        shared.get_or_run("k", lambda: "nunca")
@@ -0,0 +1,154 @@
+"""Orçamento de tokens e condensação map-reduce para os prompts do validador.
+
+Substitui o corte por caracteres (que descartava tudo após o primeiro trecho)
+por uma contagem de tokens, feita pelo tokenizer do modelo quando disponível
+ou por uma aproximação rápida. Seções que excedem o orçamento são divididas
+em trechos, condensados em paralelo e recombinados, sem descartar achados.
+"""
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text):
+    """Aproximação rápida do número de tokens (BPE) de um texto.
+
+    Cada pontuação conta como um token e cada palavra como ~1 token a cada
+    4 caracteres, o que tende a superestimar levemente modelos Llama/Mistral.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+class TokenCounter:
+    """Conta tokens com o tokenizer do modelo (se fornecido) ou com a aproximação rápida."""
+
+    def __init__(self, tokenizer=None):
+        # `tokenizer` pode ser um callable texto -> lista de tokens ou um objeto com `.encode`
+        self.tokenizer = tokenizer
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        encode = getattr(self.tokenizer, "encode", self.tokenizer)
+        return len(encode(text))
+
+
+def split_by_tokens(text, max_tokens, counter):
+    """Divide um texto em trechos de até `max_tokens`, preservando parágrafos e depois linhas/palavras.
+
+    Diferente do corte antigo, nenhum conteúdo é descartado: todos os trechos são retornados.
+    """
+    if counter.count(text) <= max_tokens:
+        return [text]
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current))
+        current, current_tokens = [], 0
+
+    for unit in _split_units(text, max_tokens, counter):
+        unit_tokens = counter.count(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            flush()
+        current.append(unit)
+        current_tokens += unit_tokens
+    flush()
+    return chunks
+
+
+def _split_units(text, max_tokens, counter):
+    """Quebra o texto em unidades que cabem no orçamento: parágrafos, linhas e, por fim, palavras."""
+    for paragraph in text.split("\n\n"):
+        if counter.count(paragraph) <= max_tokens:
+            yield paragraph + "\n"
+            continue
+        for line in paragraph.split("\n"):
+            if counter.count(line) <= max_tokens:
+                yield line
+                continue
+            words, piece = line.split(" "), []
+            for word in words:
+                if piece and counter.count(" ".join(piece + [word])) > max_tokens:
+                    yield " ".join(piece)
+                    piece = []
+                piece.append(word)
+            if piece:
+                yield " ".join(piece)
+
+
+def allocate_budget(sizes, budget):
+    """Distribui `budget` tokens entre seções (water-filling).
+
+    Seções menores que a cota justa mantêm o tamanho integral; o restante é
+    dividido igualmente entre as maiores. Retorna {seção: cota}.
+    """
+    allocation = {}
+    remaining = dict(sizes)
+    available = budget
+    while remaining:
+        share = available // len(remaining)
+        small = {name: size for name, size in remaining.items() if size <= share}
+        if not small:
+            for name in remaining:
+                allocation[name] = share
+            break
+        for name, size in small.items():
+            allocation[name] = size
+            available -= size
+            del remaining[name]
+    return allocation
+
+
+def condense_sections(sections, budget, condense, counter, chunk_tokens, max_workers=4, max_rounds=3):
+    """Condensa as seções (map-reduce) até que a soma caiba em `budget` tokens.
+
+    `condense(texto, alvo_em_tokens)` deve resumir um trecho preservando todos os
+    achados. Seções dentro da sua cota não são tocadas. Retorna
+    (seções_condensadas, {seção: (tokens_antes, tokens_depois)}).
+    """
+    sizes = {name: counter.count(text) for name, text in sections.items()}
+    if sum(sizes.values()) <= budget:
+        return dict(sections), {}
+
+    allocation = allocate_budget(sizes, budget)
+    condensed = dict(sections)
+    report = {}
+    oversized = [name for name in sections if sizes[name] > allocation[name]]
+
+    def condense_section(name):
+        text, target = sections[name], max(allocation[name], 1)
+        for round_number in range(1, max_rounds + 1):
+            chunks = split_by_tokens(text, chunk_tokens, counter)
+            # Map: cada trecho recebe uma fração do alvo proporcional ao seu tamanho
+            total = sum(counter.count(chunk) for chunk in chunks) or 1
+            targets = [max(1, target * counter.count(chunk) // total) for chunk in chunks]
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+                parts = list(executor.map(condense, chunks, targets))
+            # Reduce: recombina os resumos; repete se ainda exceder a cota
+            text = "\n\n".join(parts)
+            if counter.count(text) <= target:
+                break
+            logger.debug(f"Seção '{name}' ainda excede a cota após a rodada {round_number}.")
+        if counter.count(text) > target:
+            # Último recurso: mantém o máximo possível dentro da cota, sinalizando o corte
+            logger.warning(f"Seção '{name}' não coube na cota de {target} tokens após {max_rounds} rodadas.")
+            text = split_by_tokens(text, max(target - 16, 1), counter)[0] + "\n[... condensado por limite de contexto]"
+        return name, text
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(oversized)))) as executor:
+        for name, text in executor.map(condense_section, oversized):
+            condensed[name] = text
+            report[name] = (sizes[name], counter.count(text))
+    return condensed, report
@@ -0,0 +1,133 @@
+"""Cache persistente, endereçado por conteúdo, para os resultados do validador Helm.
+
+Cada estágio da validação (helm lint, kubeval, cada agente LLM, coordenador e o
+resultado completo) é armazenado de forma independente em um banco SQLite local,
+com despejo LRU limitado por número de entradas e por tamanho total em bytes.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "helm_validator")
+
+
+def content_hash(*parts):
+    """Gera um hash SHA-256 estável a partir de várias partes (str, bytes ou objetos serializáveis)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            # default=str: documents YAML podem conter date/datetime (ex: `release: 2024-01-01`)
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        # Prefixa o tamanho para que ("ab", "c") e ("a", "bc") gerem hashes diferentes
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ValidationCache:
+    """Cache LRU em disco para resultados de validação, com granularidade por estágio."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=5000, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "validation_cache.sqlite3")
+        # Uma única conexão compartilhada entre as threads, serializada pelo lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        logger.info(f"ValidationCache inicializado em {self.db_path} (max_entries={max_entries}, max_bytes={max_bytes})")
+
+    def get(self, stage, key):
+        """Retorna o valor armazenado para (estágio, chave) ou None, atualizando o LRU."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[stage] += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits[stage] += 1
+        return json.loads(row[0])
+
+    def put(self, stage, key, value):
+        """Armazena um valor serializável em JSON e aplica o despejo LRU se necessário."""
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, stage, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, payload, len(payload.encode("utf-8")), time.time())
+            )
+            self._evict()
+
+    def get_or_compute(self, stage, key, compute, cacheable=None):
+        """Retorna (valor, hit). Em caso de miss, calcula o valor e o armazena se for cacheável."""
+        cached = self.get(stage, key)
+        if cached is not None:
+            return cached, True
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.put(stage, key, value)
+        return value, False
+
+    def _evict(self):
+        """Remove as entradas menos recentemente usadas até respeitar os limites (chamado com o lock)."""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            evicted += 1
+        logger.debug(f"ValidationCache: {evicted} entradas despejadas (restam {count}, {total} bytes)")
+
+    def stats(self):
+        """Retorna contadores de hits/misses e a ocupação atual do cache."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            stages = sorted(set(self.hits) | set(self.misses))
+            return {
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "entries": count,
+                "bytes": total,
+                "by_stage": {stage: {"hits": self.hits[stage], "misses": self.misses[stage]} for stage in stages},
+            }
+
+    def clear(self):
+        """Remove todas as entradas e zera os contadores."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self.hits.clear()
+            self.misses.clear()
+        logger.info("ValidationCache limpo.")
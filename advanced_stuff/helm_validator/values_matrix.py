@@ -0,0 +1,111 @@
+"""Matriz de values para validar um chart em várias configurações.
+
+Charts reais renderizam manifestos muito diferentes conforme os values (HPA,
+Ingress, PDB e NetworkPolicy ligados ou desligados). A matriz combina arquivos
+de values alternativos com eixos de overrides (`chave=valor1,valor2`); cada
+combinação é renderizada e os manifestos idênticos são agrupados por hash, de
+modo que os agentes analisem cada manifesto distinto uma única vez.
+"""
+import itertools
+import threading
+from concurrent.futures import Future
+
+from validation_cache import content_hash
+
+# Limite de combinações por validação (o produto cartesiano cresce rápido)
+MAX_COMBINATIONS = 32
+
+
+def parse_override_axis(text):
+    """Converte "chave=v1,v2" em (chave, [v1, v2]). Levanta ValueError se o formato for inválido."""
+    key, separator, values = text.partition("=")
+    key = key.strip()
+    options = [value.strip() for value in values.split(",")] if separator else []
+    if not key or not options or any(option == "" for option in options):
+        raise ValueError(f"Override inválido: '{text}'. Use o formato chave=valor1,valor2")
+    return key, options
+
+
+def build_matrix(values_files=(), override_axes=()):
+    """Gera as combinações [{name, files, set}] de arquivos de values alternativos e eixos de override.
+
+    Cada arquivo é uma alternativa (`-f arquivo`); sem arquivos, usa os values
+    padrão do chart. Cada eixo (chave, [valores]) multiplica as combinações
+    (`--set chave=valor`).
+    """
+    file_options = [[path] for path in values_files] or [[]]
+    keys = [key for key, _ in override_axes]
+    combinations = []
+    for files, values in itertools.product(file_options, itertools.product(*(options for _, options in override_axes))):
+        overrides = dict(zip(keys, values))
+        parts = list(files) + [f"{key}={value}" for key, value in overrides.items()]
+        combinations.append({"name": " + ".join(parts) or "values padrão", "files": files, "set": overrides})
+    if len(combinations) > MAX_COMBINATIONS:
+        raise ValueError(f"A matriz gera {len(combinations)} combinações (máximo: {MAX_COMBINATIONS}).")
+    return combinations
+
+
+def helm_values_args(values):
+    """Converte uma combinação ({files, set}) nos argumentos `-f`/`--set` do helm."""
+    args = []
+    for path in (values or {}).get("files", []):
+        args += ["-f", path]
+    for key, value in (values or {}).get("set", {}).items():
+        args += ["--set", f"{key}={value}"]
+    return args
+
+
+def group_by_manifest(renders):
+    """Agrupa as combinações pelo hash do manifesto renderizado (ou do erro de renderização).
+
+    `renders` é uma lista de (combinação, {"manifest", "error"}). Retorna uma
+    lista de grupos {hash, rendered, combinations}, na ordem da primeira ocorrência.
+    """
+    groups = {}
+    for combination, rendered in renders:
+        key = content_hash(rendered["manifest"] or rendered["error"] or "")
+        group = groups.setdefault(key, {"hash": key, "rendered": rendered, "combinations": []})
+        group["combinations"].append(combination)
+    return list(groups.values())
+
+
+def lint_summary(output):
+    """Resumo de uma linha da saída do 'helm lint' para a tabela da matriz."""
+    output = output if isinstance(output, str) else str(output)
+    if "0 chart(s) failed" in output:
+        return "OK"
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    errors = [line for line in lines if line.startswith("[ERROR]")]
+    if errors:
+        return errors[0] + (f" (+{len(errors) - 1})" if len(errors) > 1 else "")
+    return lines[0] if lines else "sem saída"
+
+
+class SharedReplies:
+    """Respostas de agentes compartilhadas entre os grupos da matriz, que validam em paralelo.
+
+    Mensagens idênticas em grupos diferentes (o template bruto enviado ao agente
+    de sintaxe, ou um recurso igual em dois manifestos) geram uma única chamada
+    ao LLM: a primeira thread calcula e as demais aguardam o mesmo resultado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get_or_run(self, key, compute):
+        """Retorna (resposta, reaproveitada); `compute()` roda no máximo uma vez por chave."""
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if not owner:
+            return future.result(), True
+        try:
+            value = compute()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        future.set_result(value)
+        return value, False
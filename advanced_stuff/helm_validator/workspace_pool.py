@@ -0,0 +1,155 @@
+"""Pool de workspaces (scaffolds de chart) reutilizáveis para as validações.
+
+Em vez de criar um diretório temporário, a estrutura `templates/` e um
+`Chart.yaml` a cada validação, o pool mantém scaffolds já prontos (em tmpfs,
+`/dev/shm`, quando disponível). Cada validação faz checkout de um scaffold,
+que é reiniciado sobrescrevendo apenas `templates/uploaded_template.yaml`
+(e removendo os arquivos de contexto da validação anterior), e o devolve ao
+final. O pool é seguro para uso simultâneo por várias sessões do Streamlit.
+"""
+import atexit
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SHM_DIR = "/dev/shm"
+TEMPLATE_FILENAME = "uploaded_template.yaml"
+SCAFFOLD_CHART_YAML = """
+apiVersion: v2
+name: temp-chart
+description: A temporary Helm chart for validation
+version: 0.1.0
+appVersion: "1.0"
+"""
+
+
+def default_pool_root():
+    """Usa tmpfs (`/dev/shm`) se disponível e gravável; senão, o diretório temporário padrão."""
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+def write_scaffold(chart_dir):
+    """Cria a estrutura mínima de chart (Chart.yaml + templates/) em `chart_dir`."""
+    os.makedirs(os.path.join(chart_dir, "templates"), exist_ok=True)
+    with open(os.path.join(chart_dir, "Chart.yaml"), "w") as f:
+        f.write(SCAFFOLD_CHART_YAML)
+
+
+class Workspace:
+    """Um scaffold de chart do pool; guarda os arquivos extras escritos pela validação corrente."""
+
+    def __init__(self, path):
+        self.path = path
+        self.template_path = os.path.join(path, "templates", TEMPLATE_FILENAME)
+        self.extra_files = set()
+
+    def reset(self, template_content, chart_files=None):
+        """Prepara o workspace para uma nova validação, tocando apenas nos arquivos necessários."""
+        chart_yaml_overridden = "Chart.yaml" in self.extra_files
+        for relative_path in self.extra_files:
+            try:
+                os.remove(os.path.join(self.path, relative_path))
+            except FileNotFoundError:
+                pass
+        self.extra_files = set()
+        if chart_yaml_overridden and "Chart.yaml" not in (chart_files or {}):
+            write_scaffold(self.path)
+
+        # Arquivos de contexto do chart original sobrescrevem o scaffold mínimo
+        for relative_path, file_content in (chart_files or {}).items():
+            file_path = os.path.join(self.path, relative_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                f.write(file_content)
+            self.extra_files.add(relative_path)
+        with open(self.template_path, "w") as f:
+            f.write(template_content)
+
+
+class WorkspacePool:
+    """Pool thread-safe de workspaces pré-criados, que cresce sob demanda até `max_size`."""
+
+    def __init__(self, size=2, max_size=16, root=None):
+        self.max_size = max(size, max_size)
+        self.base_dir = tempfile.mkdtemp(prefix="helm_validator_pool_", dir=root or default_pool_root())
+        self._available = queue.LifoQueue()  # LIFO: reaproveita o scaffold mais recente (ainda em cache)
+        self._lock = threading.Lock()
+        self._created = 0
+        for _ in range(size):
+            self._available.put(self._create())
+        # Custo de referência: o scaffold descartável que cada validação criava antes do pool
+        self.cold_setup_seconds = self._measure_cold_setup()
+        atexit.register(self.close)
+        logger.info(
+            f"WorkspacePool com {size} scaffolds em {self.base_dir} "
+            f"(scaffold descartável: {self.cold_setup_seconds * 1000:.2f} ms)."
+        )
+
+    def _create(self):
+        with self._lock:
+            self._created += 1
+            path = os.path.join(self.base_dir, f"workspace_{self._created}")
+        write_scaffold(path)
+        return Workspace(path)
+
+    @staticmethod
+    def _measure_cold_setup():
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="helm_validation_") as temp_dir:
+            write_scaffold(temp_dir)
+            with open(os.path.join(temp_dir, "templates", TEMPLATE_FILENAME), "w") as f:
+                f.write("")
+        return time.perf_counter() - start
+
+    def _acquire(self):
+        try:
+            return self._available.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_grow = self._created < self.max_size
+        if can_grow:
+            logger.debug("WorkspacePool esgotado; criando um novo scaffold.")
+            return self._create()
+        return self._available.get()
+
+    @contextmanager
+    def checkout(self, template_content, chart_files=None, timings=None):
+        """Empresta um workspace preparado com o template e devolve-o ao pool ao final.
+
+        Se `timings` for informado, registra `workspace` (tempo de preparação e
+        devolução) e `workspace_saved` (economia em relação a um scaffold descartável).
+        """
+        start = time.perf_counter()
+        workspace = self._acquire()
+        try:
+            workspace.reset(template_content, chart_files)
+        except OSError:
+            # Scaffold corrompido (ex: removido externamente): substitui por um novo
+            logger.warning(f"Falha ao reiniciar {workspace.path}; recriando o scaffold.", exc_info=True)
+            shutil.rmtree(workspace.path, ignore_errors=True)
+            workspace = self._create()
+            workspace.reset(template_content, chart_files)
+        setup_seconds = time.perf_counter() - start
+        try:
+            yield workspace.path
+        finally:
+            release_start = time.perf_counter()
+            self._available.put(workspace)
+            if timings is not None:
+                elapsed = setup_seconds + time.perf_counter() - release_start
+                timings["workspace"] = elapsed
+                timings["workspace_saved"] = max(self.cold_setup_seconds - elapsed, 0.0)
+
+    def close(self):
+        """Remove todos os scaffolds do disco."""
+        shutil.rmtree(self.base_dir, ignore_errors=True)
@@ -3,9 +3,18 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
-from datetime import datetime
+from datetime import date as Date, datetime
+from collections import OrderedDict
+import calendar
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import io
 import json
+import os
 import re
+import sqlite3
+import threading
+import uuid
 from langchain_community.llms import Ollama
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -15,66 +24,618 @@ from qdrant_client.http import models
 import numpy as np
 import fitz
 
-# Initialize Qdrant client
-qdrant_client = QdrantClient("localhost", port=6333)
+# Bulk import tuning: MiniLM on CPU is fastest around 64 texts per call,
+# and Qdrant handles a few hundred points per upsert request comfortably
+EMBED_BATCH_SIZE = 64
+UPSERT_BATCH_SIZE = 256
+UPSERT_WORKERS = 4
 
-# Create collection if not exists
-try:
-    qdrant_client.create_collection(
-        collection_name="expenses",
-        vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE)
+# Bill processing: text extraction in worker threads, bounded concurrent LLM calls
+PDF_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+LLM_EXTRACT_CONCURRENCY = 2
+
+# Known bill layouts: static lines compared to learned templates
+SIGNATURE_LINES = 40
+LAYOUT_SIMILARITY = 0.8
+DATE_FORMATS = {
+    "%Y-%m-%d": r"\d{4}-\d{2}-\d{2}",
+    "%d/%m/%Y": r"\d{2}/\d{2}/\d{4}",
+    "%m/%d/%Y": r"\d{2}/\d{2}/\d{4}",
+    "%d.%m.%Y": r"\d{2}\.\d{2}\.\d{4}",
+    "%B %d, %Y": r"[A-Z][a-z]+ \d{1,2}, \d{4}",
+    "%b %d, %Y": r"[A-Z][a-z]{2} \d{1,2}, \d{4}",
+}
+
+# Embeddings: model name is part of every cache key
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_SIZE = 4096  # vectors kept in memory (384 float32 = 1.5 KB each)
+
+# Vector store: embedded Qdrant when FINANCE_QDRANT_PATH is set (a directory, or ":memory:"
+# for tests), otherwise the Qdrant server at FINANCE_QDRANT_URL
+QDRANT_PATH = os.environ.get("FINANCE_QDRANT_PATH")
+QDRANT_URL = os.environ.get("FINANCE_QDRANT_URL", "http://localhost:6333")
+EXPENSES_COLLECTION = "expenses"
+EMBEDDING_DIM = 384
+PAYLOAD_INDEXES = {
+    "date": models.PayloadSchemaType.DATETIME,
+    "category": models.PayloadSchemaType.KEYWORD,
+    "subcategory": models.PayloadSchemaType.KEYWORD,
+    "amount": models.PayloadSchemaType.FLOAT,
+}
+
+
+def create_qdrant_client() -> QdrantClient:
+    """Qdrant client for the configured backend"""
+    if QDRANT_PATH == ":memory:":
+        return QdrantClient(location=":memory:")
+    if QDRANT_PATH:
+        return QdrantClient(path=QDRANT_PATH)
+    return QdrantClient(url=QDRANT_URL)
+
+
+def ensure_expenses_collection(client: QdrantClient):
+    """Create (or upgrade) the expenses collection: full vectors on disk, int8 copies in RAM for search"""
+    quantization = models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
     )
-except Exception:
-    pass
-
-# Dark theme styling
-st.markdown("""
-    <style>
-    .stApp {
-        background-color: #1E1E1E;
-        color: #00FF00;
-    }
-    [data-testid="stHeader"] {
-        background-color: #000000;
-    }
-    .stButton>button {
-        background-color: #004400;
-        color: #00FF00;
-        border: 1px solid #00FF00;
-    }
-    .expense-block {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-        border: 1px solid #00FF00;
-        background-color: #0A2A0A;
-    }
-    .data-block {
-        padding: 1rem;
-        border: 2px solid #00FF00;
-        border-radius: 0.5rem;
-        background-color: #0A2A0A;
-    }
-    .insights {
-        background-color: #0A2A0A;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border: 1px solid #00FF00;
-        margin: 1rem 0;
-    }
-    </style>
-""", unsafe_allow_html=True)
+    if not client.collection_exists(EXPENSES_COLLECTION):
+        client.create_collection(
+            collection_name=EXPENSES_COLLECTION,
+            vectors_config=models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE, on_disk=True),
+            quantization_config=quantization,
+            on_disk_payload=True
+        )
+    info = client.get_collection(EXPENSES_COLLECTION)
+    # Unnamed vectors are keyed "" in updates; named vectors (a dict) are upgraded one by one
+    vectors = info.config.params.vectors
+    vectors = vectors if isinstance(vectors, dict) else {"": vectors}
+    in_ram = {name: models.VectorParamsDiff(on_disk=True) for name, params in vectors.items() if not params.on_disk}
+    if in_ram or not info.config.quantization_config or not info.config.params.on_disk_payload:
+        # Collections created before quantization: the server rebuilds them in the background
+        client.update_collection(
+            collection_name=EXPENSES_COLLECTION,
+            vectors_config=in_ram or None,
+            quantization_config=quantization,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=True)
+        )
+    # Payload indexes for filtered search, created only when missing
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in (info.payload_schema or {}):
+            client.create_payload_index(collection_name=EXPENSES_COLLECTION, field_name=field_name, field_schema=field_schema)
+
+
+@st.cache_resource
+def get_qdrant_client() -> QdrantClient:
+    """Qdrant client shared by the whole process, with the collection checked once"""
+    client = create_qdrant_client()
+    ensure_expenses_collection(client)
+    return client
+
+# Query parsing: month names, amount bounds and questions answered from the ledger
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MIN_AMOUNT_PATTERN = re.compile(r"\b(?:over|above|more than|greater than|at least)\s*\$?(\d+(?:\.\d+)?)")
+MAX_AMOUNT_PATTERN = re.compile(r"\b(?:under|below|less than|at most)\s*\$?(\d+(?:\.\d+)?)")
+BETWEEN_AMOUNT_PATTERN = re.compile(r"\bbetween\s*\$?(\d+(?:\.\d+)?)\s*and\s*\$?(\d+(?:\.\d+)?)")
+AGGREGATE_PATTERN = re.compile(r"\b(?:how much|how many|total|sum|count)\b")
+# Spending digest sent to the LLM: fixed size regardless of history length
+DIGEST_TOP_N = 10
+DIGEST_MONTHS = 12
+OUTLIER_IQR_FACTOR = 3.0
+ADVICE_PATTERN = re.compile(r"\b(?:why|should|advice|advise|recommend\w*|tips?|improve|reduce|compare)\b")
+
+
+def extract_pdf_text(content: bytes) -> str:
+    """Extract the text of every page of a PDF"""
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        return "".join(page.get_text() for page in doc)
+
+
+def expense_id(expense: dict, source: str = None) -> str:
+    """Deterministic id of an expense, from its content and (when known) its source file and position"""
+    content = [source] + [str(expense.get(column)) for column in ("category", "subcategory", "date", "description")]
+    content.append(f"{float(expense.get('amount') or 0):.2f}")
+    return str(uuid.UUID(hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()[:32]))
+
+
+def file_hash(content: bytes) -> str:
+    """Hash identifying an uploaded file"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ExpenseLedger:
+    """Expense ledger in SQLite, indexed by date and category, with totals maintained on write"""
+
+    COLUMNS = ("category", "subcategory", "amount", "date", "description")
+
+    def __init__(self, path: Path):
+        # Streamlit reruns on different threads; one connection guarded by a lock
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS expenses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    year INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    subcategory TEXT,
+                    amount REAL NOT NULL,
+                    description TEXT,
+                    uid TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_expenses_period ON expenses (year, month);
+                CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, date);
+                CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+                CREATE TABLE IF NOT EXISTS expense_totals (
+                    year INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    subcategory TEXT NOT NULL,
+                    total REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (year, month, category, subcategory)
+                );
+                CREATE TABLE IF NOT EXISTS sources (
+                    hash TEXT PRIMARY KEY,
+                    name TEXT,
+                    imported_at TEXT NOT NULL,
+                    expenses INTEGER NOT NULL
+                );
+            """)
+            # Ledgers created before expenses had deterministic ids
+            if "uid" not in [row["name"] for row in self.conn.execute("PRAGMA table_info(expenses)")]:
+                self.conn.execute("ALTER TABLE expenses ADD COLUMN uid TEXT")
+                self._backfill_uids()
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_uid ON expenses (uid)")
+            # Ledgers created before the totals table existed
+            has_expenses = self.conn.execute("SELECT 1 FROM expenses LIMIT 1").fetchone()
+            has_totals = self.conn.execute("SELECT 1 FROM expense_totals LIMIT 1").fetchone()
+            if has_expenses and not has_totals:
+                self._rebuild_totals("1 = 1", ())
+
+    def _rebuild_totals(self, where: str, params: tuple):
+        """Recompute totals from the expenses table (caller holds the lock and transaction)"""
+        self.conn.execute(f"DELETE FROM expense_totals WHERE {where}", params)
+        self.conn.execute(
+            "INSERT INTO expense_totals (year, month, category, subcategory, total, count) "
+            "SELECT year, month, category, COALESCE(subcategory, ''), SUM(amount), COUNT(*) "
+            f"FROM expenses WHERE {where} GROUP BY year, month, category, COALESCE(subcategory, '')",
+            params
+        )
+
+    def _backfill_uids(self):
+        """Give legacy rows an id salted with their row id, so repeated expenses are all kept (caller holds the lock and transaction)"""
+        legacy = self.conn.execute(f"SELECT id, {', '.join(self.COLUMNS)} FROM expenses WHERE uid IS NULL").fetchall()
+        self.conn.executemany(
+            "UPDATE expenses SET uid = ? WHERE id = ?",
+            [(expense_id(dict(row), f"legacy:{row['id']}"), row["id"]) for row in legacy]
+        )
+
+    def _dedupe(self) -> int:
+        """Drop legacy and content-only rows repeating an earlier expense (caller holds the lock and transaction)
+
+        Rows whose id carries a source (an imported file row or a manual entry nonce)
+        are genuine and always kept.
+        """
+        seen, removed = set(), []
+        for row in self.conn.execute(f"SELECT id, uid, {', '.join(self.COLUMNS)} FROM expenses ORDER BY id").fetchall():
+            expense = dict(row)
+            content = expense_id(expense)
+            if content in seen and row["uid"] in (content, expense_id(expense, f"legacy:{row['id']}")):
+                removed.append((row["id"],))
+            seen.add(content)
+        self.conn.executemany("DELETE FROM expenses WHERE id = ?", removed)
+        if removed:
+            self._rebuild_totals("1 = 1", ())
+        return len(removed)
+
+    def dedupe(self) -> int:
+        """Remove duplicated legacy expenses and recompute totals; returns the number of rows removed"""
+        with self.lock, self.conn:
+            return self._dedupe()
+
+    def has_source(self, source_hash: str) -> bool:
+        """Whether a file with this hash was already imported"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM sources WHERE hash = ?", (source_hash,)).fetchone() is not None
+
+    def record_source(self, source_hash: str, name: str, expenses: int):
+        """Remember an imported file"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (hash, name, imported_at, expenses) VALUES (?, ?, ?, ?)",
+                (source_hash, name, datetime.now().isoformat(), expenses)
+            )
+
+    def uids(self) -> set:
+        """Ids of every expense in the ledger"""
+        with self.lock:
+            return {row["uid"] for row in self.conn.execute("SELECT uid FROM expenses")}
+
+    def by_uid(self, uids) -> dict:
+        """Expenses with the given ids, keyed by id (ids not in the ledger are absent)"""
+        uids, found = list(uids), {}
+        with self.lock:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(uids), 500):
+                chunk = uids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT uid, {', '.join(self.COLUMNS)} FROM expenses WHERE uid IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((row["uid"], {column: row[column] for column in self.COLUMNS}) for row in rows)
+        return found
+
+    def uids_by_content(self) -> dict:
+        """Ids of the ledger expenses grouped by their content id, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT uid, {', '.join(self.COLUMNS)} FROM expenses ORDER BY id").fetchall()
+        groups = {}
+        for row in rows:
+            groups.setdefault(expense_id(dict(row)), []).append(row["uid"])
+        return groups
+
+    def append(self, expenses: list, uids: list = None) -> set:
+        """Append expenses in a single transaction, ignoring ids already present; returns the ids added"""
+        uids = uids or [expense_id(expense) for expense in expenses]
+        added, rows = set(), []
+        with self.lock, self.conn:
+            for expense, uid in zip(expenses, uids):
+                date = datetime.fromisoformat(expense["date"])
+                row = (date.year, date.month) + tuple(expense.get(column) for column in self.COLUMNS)
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO expenses (year, month, category, subcategory, amount, date, description, uid) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    row + (uid,)
+                )
+                if cursor.rowcount:
+                    added.add(uid)
+                    rows.append(row)
+            # Totals are updated in the same transaction
+            self.conn.executemany(
+                "INSERT INTO expense_totals (year, month, category, subcategory, total, count) "
+                "VALUES (?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (year, month, category, subcategory) "
+                "DO UPDATE SET total = total + excluded.total, count = count + 1",
+                [(row[0], row[1], row[2], row[3] or "", row[4]) for row in rows]
+            )
+        return added
+
+    def replace_month(self, year: int, month: int, expenses: list):
+        """Replace all expenses of a month"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM expenses WHERE year = ? AND month = ?", (year, month))
+            self.conn.execute("DELETE FROM expense_totals WHERE year = ? AND month = ?", (year, month))
+        self.append(expenses)
+
+    def _select(self, where: str, params: tuple) -> list:
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT month, {', '.join(self.COLUMNS)} FROM expenses WHERE {where} ORDER BY date, id", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def month(self, year: int, month: int) -> list:
+        """Expenses of a month"""
+        return [
+            {column: row[column] for column in self.COLUMNS}
+            for row in self._select("year = ? AND month = ?", (year, month))
+        ]
+
+    def year(self, year: int) -> list:
+        """Expenses of a year, with their month"""
+        return self._select("year = ?", (year,))
+
+    def all(self) -> list:
+        """All expenses, with their month"""
+        return self._select("1 = 1", ())
+
+    def month_totals(self, year: int, month: int) -> list:
+        """Totals and counts of a month by category and subcategory"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT category, subcategory, total, count FROM expense_totals WHERE year = ? AND month = ?",
+                (year, month)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def year_totals(self, year: int) -> list:
+        """Totals and counts of a year by month and category"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT month, category, SUM(total) AS total, SUM(count) AS count FROM expense_totals "
+                "WHERE year = ? GROUP BY month, category ORDER BY month",
+                (year,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def summarize(self, constraints: dict) -> dict:
+        """Total and count of the expenses matching structured constraints"""
+        clauses, params = [], []
+        for column, operator, key in (
+            ("date", ">=", "start"), ("date", "<=", "end"),
+            ("category", "=", "category"), ("subcategory", "=", "subcategory"),
+            ("amount", ">=", "min_amount"), ("amount", "<=", "max_amount"),
+        ):
+            if constraints.get(key) is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(constraints[key])
+        where = " AND ".join(clauses) or "1 = 1"
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT COALESCE(SUM(amount), 0) AS total, COUNT(*) AS count FROM expenses WHERE {where}", params
+            ).fetchone()
+        return dict(row)
+
+    def years(self) -> list:
+        """Years with expenses, most recent first"""
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT year FROM expense_totals ORDER BY year DESC").fetchall()
+        return [row["year"] for row in rows]
+
+    def migrate_json(self, history_path: Path) -> int:
+        """Import legacy YYYY_MM.json files once, renaming them to .json.migrated"""
+        migrated = 0
+        for filename in sorted(history_path.glob("[0-9][0-9][0-9][0-9]_[0-9][0-9].json")):
+            with open(filename) as f:
+                expenses = json.load(f).get("expenses", [])
+            # Repeated rows are genuine (two coffees on one day): they get the legacy per-row salt,
+            # so nothing is dropped here and compact_history can still dedupe them explicitly
+            self.append(expenses, [None] * len(expenses))
+            with self.lock, self.conn:
+                self._backfill_uids()
+            filename.rename(filename.with_name(filename.name + ".migrated"))
+            migrated += len(expenses)
+        return migrated
+
+
+class BillTemplateEngine:
+    """Recognizes known bill layouts and extracts expenses with learned rules, without the LLM"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.templates = json.loads(path.read_text()) if path.exists() else []
+
+    @staticmethod
+    def signature(text: str) -> set:
+        """Static lines of a bill (labels and headers, no digits), which identify its layout"""
+        lines = []
+        for line in text.splitlines():
+            line = " ".join(line.lower().split())
+            if len(line) >= 3 and not re.search(r"\d", line) and line not in lines:
+                lines.append(line)
+        return set(lines[:SIGNATURE_LINES])
+
+    def match(self, text: str):
+        """Most similar known template, if similar enough"""
+        signature = self.signature(text)
+        best, best_score = None, LAYOUT_SIMILARITY
+        for template in self.templates:
+            known = set(template["signature"])
+            score = len(signature & known) / len(signature | known) if signature | known else 0
+            if score >= best_score:
+                best, best_score = template, score
+        return best
+
+    @staticmethod
+    def _label_pattern(label: str) -> str:
+        return re.escape(re.sub(r"\d+", "#", label)).replace(r"\#", r"\d+")
+
+    @staticmethod
+    def _parse_amount(value: str, decimal: str) -> float:
+        if decimal == ",":
+            return float(value.replace(".", "").replace(",", "."))
+        return float(value.replace(",", ""))
+
+    @staticmethod
+    def _locate(lines: list, value_pattern: str, accept) -> tuple:
+        """Rule (label, same_line) for the first value accepted by `accept`, labelled by its line or the one above"""
+        for index, line in enumerate(lines):
+            for match in re.finditer(value_pattern, line):
+                if not accept(match.group()):
+                    continue
+                prefix = line[:match.start()].strip(" :-$")
+                if re.search(r"[A-Za-z]", prefix):
+                    return prefix, True
+                previous = next((lines[i].strip() for i in range(index - 1, -1, -1) if lines[i].strip()), "")
+                if previous:
+                    return previous, False
+        return None, None
+
+    def _apply(self, template: dict, text: str):
+        """Amount and date extracted by a template's rules, or None"""
+        rules = template["rules"]
+        # Templates store every date format consistent with the learned bill ("format" in older ones)
+        formats = rules["date"].get("formats") or [rules["date"].get("format")]
+        raw = {}
+        for field, value_pattern in (("amount", r"(\d[\d.,]*\d|\d)"), ("date", f"({DATE_FORMATS[formats[0]]})")):
+            separator = r"[^\n\d]*?" if rules[field]["same_line"] else r"[^\n]*\n[^\n\d]*?"
+            match = re.search(rules[field]["label"] + separator + value_pattern, text)
+            if not match:
+                return None
+            raw[field] = match.group(1)
+        dates = set()
+        for date_format in formats:
+            try:
+                dates.add(datetime.strptime(raw["date"], date_format).date().isoformat())
+            except ValueError:
+                pass
+        # Day-first and month-first candidates reading 03/05 differently: leave it to the LLM
+        if len(dates) != 1:
+            return None
+        try:
+            return {"amount": self._parse_amount(raw["amount"], rules["amount"]["decimal"]), "date": dates.pop()}
+        except ValueError:
+            return None
+
+    def extract(self, text: str):
+        """Expense extracted from a known layout, or None"""
+        template = self.match(text)
+        values = template and self._apply(template, text)
+        if not values:
+            return None
+        return {
+            "category": template["category"],
+            "subcategory": template["subcategory"],
+            "amount": values["amount"],
+            "date": values["date"],
+            "description": template["description"],
+        }
+
+    def learn(self, text: str, expense: dict) -> bool:
+        """Learn a template from a confirmed extraction; False if its values cannot be located in the text"""
+        lines = text.splitlines()
+        amount = float(expense["amount"])
+        expected_date = datetime.fromisoformat(expense["date"]).date()
+
+        def is_amount(decimal):
+            def accept(value):
+                try:
+                    return abs(self._parse_amount(value, decimal) - amount) < 0.005
+                except ValueError:
+                    return False
+            return accept
+
+        for decimal in (".", ","):
+            label, same_line = self._locate(lines, r"\d[\d.,]*\d", is_amount(decimal))
+            if label is not None:
+                break
+        else:
+            return False
+        rules = {"amount": {"label": self._label_pattern(label), "same_line": same_line, "decimal": decimal}}
+
+        def is_expected_date(date_format):
+            def accept(value):
+                try:
+                    return datetime.strptime(value, date_format).date() == expected_date
+                except ValueError:
+                    return False
+            return accept
+
+        for date_format, date_pattern in DATE_FORMATS.items():
+            label, same_line = self._locate(lines, date_pattern, is_expected_date(date_format))
+            if label is not None:
+                # A date like 03/03/2024 fits both %d/%m/%Y and %m/%d/%Y: keep both until a bill disambiguates
+                formats = [
+                    other for other, other_pattern in DATE_FORMATS.items()
+                    if other_pattern == date_pattern and self._locate(lines, other_pattern, is_expected_date(other))[0] == label
+                ]
+                rules["date"] = {"label": self._label_pattern(label), "same_line": same_line, "formats": formats}
+                break
+        else:
+            return False
+
+        template = {
+            "signature": sorted(self.signature(text)),
+            "rules": rules,
+            "category": expense["category"],
+            "subcategory": expense["subcategory"],
+            "description": expense["description"],
+            "learned_at": datetime.now().isoformat(),
+        }
+        # The rules must reproduce the confirmed values on the bill they were learned from
+        values = self._apply(template, text)
+        if not values or abs(values["amount"] - amount) > 0.005 or values["date"] != expected_date.isoformat():
+            return False
+        with self.lock:
+            known = self.match(text)
+            if known is not None:
+                self.templates.remove(known)
+            self.templates.append(template)
+            self.path.write_text(json.dumps(self.templates, indent=2))
+        return True
+
+
+class EmbeddingCache:
+    """Content-hashed embedding cache: in-memory LRU in front of a SQLite store of float32 vectors"""
+
+    def __init__(self, path: Path, model_name: str, capacity: int = EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL);
+            """)
+            # A different embedding model invalidates every stored vector
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+            if row is None or row[0] != model_name:
+                self.conn.execute("DELETE FROM embeddings")
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model', ?)", (model_name,))
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: list):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts: list, compute) -> list:
+        """Vectors for texts; `compute(missing_texts)` is called once for the misses"""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+            self.stats["memory_hits"] += len(found)
+            lookup = list({key for key in keys if key not in found})
+            for start in range(0, len(lookup), 500):
+                chunk = lookup[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, found[key])
+                    self.stats["disk_hits"] += 1
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = compute(list(missing.values()))
+            with self.lock, self.conn:
+                self.stats["misses"] += len(missing)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in zip(missing, vectors)]
+                )
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._remember(key, vector)
+        return [found[key] for key in keys]
+
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from memory or disk"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
 
 class FinanceAgent:
     def __init__(self):
         self.llm = Ollama(model="deepseek-r1:14b")
         self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
+            model_name=EMBEDDING_MODEL,
             model_kwargs={'device': 'cpu'}
         )
         self.history_path = Path.home() / "finance_history"
         self.history_path.mkdir(exist_ok=True)
-        self.qdrant = qdrant_client
+        self.embedding_cache = EmbeddingCache(self.history_path / "embeddings.db", EMBEDDING_MODEL)
+        self.ledger = ExpenseLedger(self.history_path / "ledger.db")
+        self.ledger.migrate_json(self.history_path)
+        self.bill_templates = BillTemplateEngine(self.history_path / "bill_templates.json")
+        self.qdrant = get_qdrant_client()
         
         self.categories = {
             "House Bills": ["Water", "Electricity", "Internet", "Phone"],
@@ -88,28 +649,106 @@ class FinanceAgent:
 
     def _get_embedding(self, text: str) -> list:
         """Get embedding for text"""
-        return self.embeddings.embed_query(text)
+        return self.embedding_cache.get_many([text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def _get_embeddings(self, texts: list) -> list:
+        """Get embeddings for many texts, EMBED_BATCH_SIZE at a time"""
+        def compute(missing):
+            vectors = []
+            for start in range(0, len(missing), EMBED_BATCH_SIZE):
+                vectors.extend(self.embeddings.embed_documents(missing[start:start + EMBED_BATCH_SIZE]))
+            return vectors
+        return self.embedding_cache.get_many(texts, compute)
+
+    @staticmethod
+    def _expense_text(expense_data: dict) -> str:
+        """Text embedded for an expense"""
+        return f"{expense_data['category']} {expense_data['subcategory']} {expense_data['description']}"
 
     def save_monthly_data(self, year: int, month: int, expenses: list):
         """Save monthly expense data"""
-        filename = self.history_path / f"{year}_{month:02d}.json"
-        data = {
-            "timestamp": datetime.now().isoformat(),
-            "expenses": expenses
-        }
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        self.ledger.replace_month(year, month, expenses)
 
     def load_monthly_data(self, year: int, month: int) -> dict:
         """Load monthly expense data"""
-        filename = self.history_path / f"{year}_{month:02d}.json"
-        if filename.exists():
-            with open(filename) as f:
-                return json.load(f)
-        return {"expenses": []}
+        return {"expenses": self.ledger.month(year, month)}
+
+    def _template_insights(self, expense: dict) -> dict:
+        """Insights for a bill read from a known layout, from the ledger history"""
+        history = self.ledger.summarize({"category": expense["category"], "subcategory": expense["subcategory"]})
+        if not history["count"]:
+            return {"comparison": "First bill of this kind.", "savings_tips": [], "warnings": []}
+        average = history["total"] / history["count"]
+        change = (expense["amount"] - average) / average * 100 if average else 0
+        warnings = [f"{change:.0f}% above your average {expense['subcategory']} bill."] if change > 25 else []
+        return {
+            "comparison": f"${expense['amount']:,.2f} vs. an average of ${average:,.2f} over {history['count']} bill(s) ({change:+.0f}%).",
+            "savings_tips": [],
+            "warnings": warnings,
+        }
+
+    def _parse_llm_json(self, response: str) -> dict:
+        """JSON object from an LLM response, ignoring <think> blocks and surrounding text"""
+        text = self._filter_think_content(response)
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise ValueError("No JSON object in the model response")
+        return json.loads(text[start:end + 1])
+
+    @staticmethod
+    def _normalize_date(value) -> str:
+        """ISO date from an extracted date; ValueError if unrecognized or ambiguous (03/05 vs 05/03)"""
+        text = str(value).strip()
+        try:
+            return datetime.fromisoformat(text).date().isoformat()
+        except ValueError:
+            pass
+        candidates = set()
+        for date_format in DATE_FORMATS:
+            try:
+                candidates.add(datetime.strptime(text, date_format).date())
+            except ValueError:
+                pass
+        if len(candidates) != 1:
+            raise ValueError(f"Unrecognized or ambiguous date: {value!r}")
+        return candidates.pop().isoformat()
+
+    def normalize_bill(self, result: dict) -> dict:
+        """Validate an extracted bill and normalize its expense (ISO date, float amount, known category)"""
+        expense = result.get("expense")
+        if not isinstance(expense, dict):
+            raise ValueError("No expense in the extraction")
+        try:
+            amount = expense["amount"]
+            amount = float(amount if isinstance(amount, (int, float)) else str(amount).replace("$", "").replace(",", "").strip())
+        except (KeyError, ValueError):
+            raise ValueError(f"Invalid amount: {expense.get('amount')!r}")
+        if "date" not in expense:
+            raise ValueError("Missing date")
+        category = expense.get("category") if expense.get("category") in self.categories else "Others"
+        insights = result.get("insights") if isinstance(result.get("insights"), dict) else {}
+        return {
+            **result,
+            "expense": {
+                "category": category,
+                "subcategory": str(expense.get("subcategory") or "Miscellaneous"),
+                "amount": abs(amount),
+                "date": self._normalize_date(expense["date"]),
+                "description": str(expense.get("description") or ""),
+            },
+            "insights": {
+                "comparison": str(insights.get("comparison") or ""),
+                "savings_tips": list(insights.get("savings_tips") or []),
+                "warnings": list(insights.get("warnings") or []),
+            },
+        }
 
     def process_pdf(self, content: str) -> dict:
-        """Process PDF content using DeepSeek"""
+        """Process PDF content: known layouts without the LLM, others using DeepSeek"""
+        expense = self.bill_templates.extract(content)
+        if expense is not None:
+            return {"expense": expense, "insights": self._template_insights(expense), "source": "template"}
+
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a financial analyst specializing in bill analysis.
             Extract expense information and provide insights.
@@ -117,20 +756,20 @@ class FinanceAgent:
             Available categories: {categories}
             
             Analyze the bill and return a JSON with:
-            {
-                "expense": {
+            {{
+                "expense": {{
                     "category": str,
                     "subcategory": str,
                     "amount": float,
-                    "date": str,
+                    "date": str (YYYY-MM-DD),
                     "description": str
-                },
-                "insights": {
+                }},
+                "insights": {{
                     "comparison": str,
                     "savings_tips": list,
                     "warnings": list
-                }
-            }
+                }}
+            }}
             
             CONTENT:
             {content}""")
@@ -142,41 +781,270 @@ class FinanceAgent:
             "content": content
         })
         
-        return json.loads(response)
+        return {**self._parse_llm_json(response), "source": "llm"}
 
-    def add_expense(self, expense_data: dict):
-        """Add expense to Qdrant and save to file"""
-        # Create embedding for expense
-        text_for_embedding = f"{expense_data['category']} {expense_data['subcategory']} {expense_data['description']}"
-        vector = self._get_embedding(text_for_embedding)
-        
-        # Add to Qdrant
-        self.qdrant.upsert(
-            collection_name="expenses",
-            points=[models.PointStruct(
-                id=int(datetime.now().timestamp() * 1000),
-                vector=vector,
-                payload=expense_data
-            )]
-        )
-        
-        # Save to file
-        date = datetime.fromisoformat(expense_data["date"])
-        data = self.load_monthly_data(date.year, date.month)
-        data["expenses"].append(expense_data)
-        self.save_monthly_data(date.year, date.month, data["expenses"])
+    def process_bills(self, bills: list):
+        """Extract and analyze many PDF bills concurrently
+
+        Yields (index, status, result) from the calling thread as each step finishes:
+        "analyzing" once the text is extracted, then "done" with the normalized
+        process_pdf result (plus the bill "text") or "failed" with the error message.
+        Extraction runs in threads: PyMuPDF releases the GIL for most of get_text,
+        and forking this multi-threaded process (torch, Qdrant) could deadlock.
+        """
+        with ThreadPoolExecutor(max_workers=PDF_EXTRACT_WORKERS) as pdf_pool, ThreadPoolExecutor(max_workers=LLM_EXTRACT_CONCURRENCY) as llm_pool:
+            extracting = {pdf_pool.submit(extract_pdf_text, content): index for index, content in enumerate(bills)}
+            analyzing, texts = {}, {}
+            for future in as_completed(extracting):
+                index = extracting[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    yield index, "failed", f"Could not read PDF: {e}"
+                    continue
+                analyzing[llm_pool.submit(self.process_pdf, text)] = index
+                texts[index] = text
+                yield index, "analyzing", None
+            for future in as_completed(analyzing):
+                index = analyzing[future]
+                try:
+                    result = self.normalize_bill(future.result())
+                except Exception as e:
+                    yield index, "failed", f"Could not analyze bill: {e}"
+                    continue
+                yield index, "done", {**result, "text": texts[index]}
+
+    def add_expense(self, expense_data: dict) -> int:
+        """Add a manually entered expense; a per-entry nonce keeps identical genuine expenses apart"""
+        return self.add_expenses([expense_data], [str(uuid.uuid4())])
+
+    def add_expenses(self, expenses: list, sources: list = None) -> int:
+        """Add many expenses: one ledger transaction, batched embeddings and batched upserts
+
+        Ids are derived from each expense (and its entry in `sources`, e.g. "<file hash>:<row>"),
+        so importing the same data again adds nothing. Returns the number of new expenses.
+        """
+        if not expenses:
+            return 0
+
+        # Only expenses the ledger does not know yet are indexed
+        uids = [expense_id(expense, source) for expense, source in zip(expenses, sources or [None] * len(expenses))]
+        known = self.ledger.by_uid(uids)
+        new = [(uid, expense) for uid, expense in dict(zip(uids, expenses)).items() if uid not in known]
+        if not new:
+            return 0
+        self._index_expenses(new)
+
+        # The ledger is written last: if indexing fails nothing is recorded and a retry indexes again
+        return len(self.ledger.append(expenses, uids))
+
+    def _index_expenses(self, expenses: list):
+        """Embed (uid, expense) pairs in batches and upsert them to Qdrant"""
+        vectors = self._get_embeddings([self._expense_text(expense) for _, expense in expenses])
+        points = [
+            models.PointStruct(id=uid, vector=vector, payload=expense)
+            for (uid, expense), vector in zip(expenses, vectors)
+        ]
+
+        # Add to Qdrant in large batches, several requests in flight
+        batches = [points[start:start + UPSERT_BATCH_SIZE] for start in range(0, len(points), UPSERT_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(UPSERT_WORKERS, len(batches))) as executor:
+            list(executor.map(lambda batch: self.qdrant.upsert(collection_name=EXPENSES_COLLECTION, points=batch), batches))
+
+    def compact_history(self) -> dict:
+        """Remove duplicated expenses from the ledger and duplicated or orphan points from Qdrant, and index unindexed expenses"""
+        removed_rows = self.ledger.dedupe()
+        known = self.ledger.uids()
+        by_content = self.ledger.uids_by_content()
+        seen, stale, rekeyed, offset = set(), [], [], None
+        while True:
+            points, offset = self.qdrant.scroll(
+                collection_name=EXPENSES_COLLECTION, limit=UPSERT_BATCH_SIZE, offset=offset, with_vectors=True
+            )
+            for point in points:
+                point_id = str(point.id)
+                # Legacy points (timestamp ids) are matched by content to a ledger id without a point yet
+                if point_id in known:
+                    uid = point_id
+                else:
+                    uid = next((uid for uid in by_content.get(expense_id(point.payload), []) if uid not in seen), None)
+                if uid is None or uid in seen:
+                    stale.append(point.id)
+                elif point_id != uid:
+                    stale.append(point.id)
+                    rekeyed.append(models.PointStruct(id=uid, vector=point.vector, payload=point.payload))
+                seen.add(uid)
+            if offset is None:
+                break
+        for start in range(0, len(rekeyed), UPSERT_BATCH_SIZE):
+            self.qdrant.upsert(collection_name=EXPENSES_COLLECTION, points=rekeyed[start:start + UPSERT_BATCH_SIZE])
+        if stale:
+            self.qdrant.delete(collection_name=EXPENSES_COLLECTION, points_selector=models.PointIdsList(points=stale))
+        # Ledger rows whose indexing failed (or was interrupted) get their point now
+        missing = list(self.ledger.by_uid(known - seen).items())
+        if missing:
+            self._index_expenses(missing)
+        return {
+            "ledger_rows_removed": removed_rows,
+            "points_removed": len(stale) - len(rekeyed),
+            "points_rekeyed": len(rekeyed),
+            "points_indexed": len(missing),
+        }
+
+    def parse_csv(self, content: bytes) -> list:
+        """Parse debits from a bank statement CSV (date, amount, description; optional type, category, subcategory)
+
+        With a `type` column (debit/credit, DR/CR) it selects the debits; otherwise
+        debits are the negative amounts, as in parse_ofx. A statement without a
+        `type` column and without negative amounts is rejected, since its sign
+        convention cannot tell debits from credits.
+        """
+        df = pd.read_csv(io.BytesIO(content), dtype=str)
+        df.columns = [column.strip().lower() for column in df.columns]
+        missing = {"date", "amount", "description"} - set(df.columns)
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        # "1,234.56", "$12.00" and "(12.00)" are all accepted
+        amount = df["amount"].astype(str).str.strip().str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+        df["amount"] = pd.to_numeric(amount.str.replace(r"[,$\s]", "", regex=True))
+        if "type" in df.columns:
+            df = df[df["type"].astype(str).str.strip().str.lower().isin(["debit", "dr", "d"])].copy()
+        elif not (df["amount"] < 0).any() and (df["amount"] > 0).any():
+            raise ValueError("no negative amounts and no debit/credit `type` column; cannot tell debits from credits")
+        else:
+            df = df[df["amount"] < 0].copy()  # credits (deposits, salary) are not expenses
+        df["amount"] = df["amount"].abs()
+        df["date"] = pd.to_datetime(df["date"]).dt.date.astype(str)
+        df["description"] = df["description"].fillna("").astype(str)
+        df["category"] = df["category"].fillna("Others") if "category" in df.columns else "Others"
+        df["subcategory"] = df["subcategory"].fillna("Miscellaneous") if "subcategory" in df.columns else "Miscellaneous"
+        return df[["category", "subcategory", "amount", "date", "description"]].to_dict("records")
+
+    def parse_ofx(self, content: bytes) -> list:
+        """Parse debit transactions from an OFX/QFX statement"""
+        text = content.decode("utf-8", errors="ignore")
+        expenses = []
+        for block in re.findall(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|</BANKTRANLIST>)", text, flags=re.DOTALL):
+            fields = dict(re.findall(r"<(\w+)>([^<\r\n]*)", block))
+            amount = float(fields.get("TRNAMT", "0").replace(",", "."))
+            if amount >= 0:
+                continue  # credits are not expenses
+            posted = fields.get("DTPOSTED", "")[:8]
+            expenses.append({
+                "category": "Others",
+                "subcategory": "Miscellaneous",
+                "amount": -amount,
+                "date": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}",
+                "description": (fields.get("NAME") or fields.get("MEMO") or "").strip()
+            })
+        return expenses
+
+    def parse_query(self, query: str, today: Date = None) -> dict:
+        """Extract date range, category and amount constraints from a question"""
+        today = today or Date.today()
+        text = query.lower()
+        constraints = {}
+
+        # Date range: "this/last month", "<month> [year]", or a bare year
+        year_match = re.search(r"\b(19|20)\d{2}\b", text)
+        month_match = re.search(rf"\b({'|'.join(sorted(MONTHS, key=len, reverse=True))})\b", text)
+        if month_match and month_match.group(1) == "may" and not re.search(r"\b(?:in|of|during|since) may\b|\bmay \d{4}\b", text):
+            month_match = None  # "may" as a verb
+        if "this month" in text:
+            year, month = today.year, today.month
+        elif "last month" in text:
+            year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+        elif month_match:
+            month = MONTHS[month_match.group(1)]
+            # Without a year, the most recent occurrence of that month
+            year = int(year_match.group()) if year_match else today.year - (month > today.month)
+        else:
+            year, month = (int(year_match.group()), None) if year_match else (None, None)
+        if year and month:
+            constraints["start"] = Date(year, month, 1).isoformat()
+            constraints["end"] = f"{Date(year, month, calendar.monthrange(year, month)[1]).isoformat()}T23:59:59"
+        elif year:
+            constraints["start"], constraints["end"] = f"{year}-01-01", f"{year}-12-31T23:59:59"
+
+        # Subcategory first (more specific), then category
+        for category, subcategories in self.categories.items():
+            for subcategory in subcategories:
+                if subcategory != "Miscellaneous" and re.search(rf"\b{re.escape(subcategory.lower().rstrip('s'))}", text):
+                    constraints.update(category=category, subcategory=subcategory)
+                    break
+            if "category" in constraints:
+                break
+        else:
+            for category in self.categories:
+                aliases = {category.lower(), category.lower().split()[0].rstrip("s")}
+                if category != "Others" and any(re.search(rf"\b{re.escape(alias)}", text) for alias in aliases):
+                    constraints["category"] = category
+                    break
+
+        # Amount range
+        between = BETWEEN_AMOUNT_PATTERN.search(text)
+        if between:
+            constraints["min_amount"], constraints["max_amount"] = float(between.group(1)), float(between.group(2))
+        else:
+            for key, pattern in (("min_amount", MIN_AMOUNT_PATTERN), ("max_amount", MAX_AMOUNT_PATTERN)):
+                match = pattern.search(text)
+                if match:
+                    constraints[key] = float(match.group(1))
+        return constraints
+
+    def _build_filter(self, constraints: dict):
+        """Qdrant payload filter for structured constraints"""
+        conditions = []
+        for key in ("category", "subcategory"):
+            if constraints.get(key):
+                conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=constraints[key])))
+        if constraints.get("start") or constraints.get("end"):
+            conditions.append(models.FieldCondition(
+                key="date", range=models.DatetimeRange(gte=constraints.get("start"), lte=constraints.get("end"))
+            ))
+        if constraints.get("min_amount") is not None or constraints.get("max_amount") is not None:
+            conditions.append(models.FieldCondition(
+                key="amount", range=models.Range(gte=constraints.get("min_amount"), lte=constraints.get("max_amount"))
+            ))
+        return models.Filter(must=conditions) if conditions else None
+
+    def _describe_constraints(self, constraints: dict) -> str:
+        parts = []
+        if constraints.get("subcategory") or constraints.get("category"):
+            parts.append(f"on {constraints.get('subcategory') or constraints['category']}")
+        if constraints.get("start"):
+            parts.append(f"from {constraints['start']} to {constraints['end'][:10]}")
+        if constraints.get("min_amount") is not None:
+            parts.append(f"of at least ${constraints['min_amount']:,.2f}")
+        if constraints.get("max_amount") is not None:
+            parts.append(f"of at most ${constraints['max_amount']:,.2f}")
+        return " ".join(parts)
 
     def query_expenses(self, query: str) -> str:
         """Query expense history using natural language"""
+        constraints = self.parse_query(query)
+
+        # Aggregate questions are answered from the ledger, without the LLM
+        text = query.lower()
+        if constraints and AGGREGATE_PATTERN.search(text) and not ADVICE_PATTERN.search(text):
+            summary = self.ledger.summarize(constraints)
+            return (
+                f"You spent **${summary['total']:,.2f}** across {summary['count']} expense(s) "
+                f"{self._describe_constraints(constraints)}."
+            )
+
         # Get query embedding
         query_vector = self._get_embedding(query)
         
-        # Search Qdrant
-        search_result = self.qdrant.search(
-            collection_name="expenses",
-            query_vector=query_vector,
+        # Search Qdrant within the structured constraints
+        search_result = self.qdrant.query_points(
+            collection_name=EXPENSES_COLLECTION,
+            query=query_vector,
+            query_filter=self._build_filter(constraints),
+            # Candidates come from the int8 vectors; the top ones are rescored with the originals
+            search_params=models.SearchParams(quantization=models.QuantizationSearchParams(rescore=True)),
             limit=5
-        )
+        ).points
         
         # Format context from results
         context = "\n".join([json.dumps(hit.payload) for hit in search_result])
@@ -210,180 +1078,380 @@ class FinanceAgent:
         
         return self._filter_think_content(response)
 
+    def get_spending_digest(self) -> dict:
+        """Statistical digest of the full history, bounded by DIGEST_TOP_N and DIGEST_MONTHS"""
+        df = pd.DataFrame(self.ledger.all())
+        if df.empty:
+            return {"expenses": 0}
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        df = df.dropna(subset=["date"])
+        amounts = df["amount"].to_numpy(dtype=float)
+
+        # Per-category totals (largest first, the rest folded into one bucket)
+        by_category = df.groupby("category")["amount"].agg(["sum", "count", "mean"]).sort_values("sum", ascending=False)
+        categories = {
+            category: {"total": round(row["sum"], 2), "count": int(row["count"]), "mean": round(row["mean"], 2)}
+            for category, row in by_category.head(DIGEST_TOP_N).iterrows()
+        }
+        if len(by_category) > DIGEST_TOP_N:
+            rest = by_category.iloc[DIGEST_TOP_N:]
+            categories["(other categories)"] = {"total": round(rest["sum"].sum(), 2), "count": int(rest["count"].sum())}
+
+        # Month-over-month totals and deltas for the most recent months
+        monthly = df.groupby(df["date"].dt.to_period("M"))["amount"].sum().sort_index().tail(DIGEST_MONTHS + 1)
+        deltas = monthly.pct_change() * 100
+        months = [
+            {"month": str(period), "total": round(total, 2),
+             "change_pct": None if np.isnan(deltas[period]) else round(deltas[period], 1)}
+            for period, total in monthly.tail(DIGEST_MONTHS).items()
+        ]
+
+        # Top merchants by total spent (descriptions without digits, e.g. invoice numbers)
+        merchants = df["description"].fillna("").str.lower().str.replace(r"[\d#*]+", "", regex=True).str.strip()
+        top_merchants = (
+            df.assign(merchant=merchants)[merchants != ""]
+            .groupby("merchant")["amount"].agg(["sum", "count"])
+            .sort_values("sum", ascending=False).head(DIGEST_TOP_N)
+        )
+
+        # Outliers: far above the interquartile range of their own category
+        quartiles = df.groupby("category")["amount"].quantile([0.25, 0.75]).unstack()
+        limits = df["category"].map(quartiles[0.75] + OUTLIER_IQR_FACTOR * (quartiles[0.75] - quartiles[0.25]))
+        outliers = df[df["amount"] > limits].sort_values("amount", ascending=False).head(DIGEST_TOP_N)
+
+        return {
+            "expenses": len(df),
+            "total": round(float(amounts.sum()), 2),
+            "period": {"from": df["date"].min().date().isoformat(), "to": df["date"].max().date().isoformat()},
+            "amount_percentiles": dict(zip(
+                ("p25", "p50", "p75", "p90", "p99"),
+                np.round(np.percentile(amounts, [25, 50, 75, 90, 99]), 2).tolist()
+            )),
+            "categories": categories,
+            "months": months,
+            "top_merchants": [
+                {"merchant": merchant, "total": round(row["sum"], 2), "count": int(row["count"])}
+                for merchant, row in top_merchants.iterrows()
+            ],
+            "outliers": [
+                {"date": row["date"].date().isoformat(), "category": row["category"],
+                 "description": row["description"], "amount": round(row["amount"], 2)}
+                for _, row in outliers.iterrows()
+            ],
+        }
+
     def get_spending_insights(self) -> str:
         """Generate AI-powered spending insights"""
-        search_result = self.qdrant.scroll(
-            collection_name="expenses",
-            limit=100
-        )[0]
-        
-        expenses = [hit.payload for hit in search_result]
+        digest = self.get_spending_digest()
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", """Analyze these expenses and provide detailed financial insights.
+            ("system", """Analyze this statistical digest of the full expense history and provide detailed financial insights.
             Focus on:
             1. Unusual spending patterns
             2. Potential savings opportunities
             3. Budget recommendations
             4. Category-specific advice
             
-            EXPENSES:
-            {expenses}
+            DIGEST:
+            {digest}
             
             Format response in Markdown with clear sections.""")
         ])
         
         chain = (prompt | self.llm | StrOutputParser())
-        return chain.invoke({"expenses": json.dumps(expenses)})
+        return chain.invoke({"digest": json.dumps(digest)})
 
     def _filter_think_content(self, text: str) -> str:
         return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
 
     def get_year_summary(self, year: int) -> pd.DataFrame:
         """Get year summary of expenses"""
-        all_expenses = []
-        for month in range(1, 13):
-            data = self.load_monthly_data(year, month)
-            if data["expenses"]:
-                for expense in data["expenses"]:
-                    expense["month"] = month
-                    all_expenses.append(expense)
-        return pd.DataFrame(all_expenses)
-
-# Initialize session state
-if 'finance_agent' not in st.session_state:
-    st.session_state.finance_agent = FinanceAgent()
-
-st.title("💰 Financial Advisor")
-
-# Sidebar for expense entry
-with st.sidebar:
-    st.header("📝 Add Expense")
-    
-    # PDF Upload
-    st.subheader("📄 Upload Bill")
-    uploaded_file = st.file_uploader("Upload PDF bill", type="pdf")
-    if uploaded_file:
-        with st.spinner("Processing bill..."):
-            doc = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            
-            result = st.session_state.finance_agent.process_pdf(text)
-            expense = result["expense"]
-            insights = result["insights"]
-            
-            st.session_state.finance_agent.add_expense(expense)
-            st.success("Bill processed!")
-            
-            with st.expander("📊 Bill Analysis"):
-                st.markdown(f"**Comparison:** {insights['comparison']}")
-                st.markdown("**Savings Tips:**")
-                for tip in insights['savings_tips']:
-                    st.markdown(f"- {tip}")
-                if insights['warnings']:
-                    st.markdown("**⚠️ Warnings:**")
-                    for warning in insights['warnings']:
-                        st.markdown(f"- {warning}")
-    
-    # Manual Entry
-    st.subheader("✍️ Manual Entry")
-    category = st.selectbox("Category", list(st.session_state.finance_agent.categories.keys()))
-    subcategory = st.selectbox("Subcategory", st.session_state.finance_agent.categories[category])
-    amount = st.number_input("Amount", min_value=0.0, step=0.01)
-    date = st.date_input("Date")
-    description = st.text_area("Description")
-    
-    if st.button("💾 Save Expense"):
-        expense = {
-            "category": category,
-            "subcategory": subcategory,
-            "amount": amount,
-            "date": date.isoformat(),
-            "description": description
-        }
-        st.session_state.finance_agent.add_expense(expense)
-        st.success("Expense saved!")
-
-# Main interface - Monthly Overview
-st.header("📊 Monthly Overview")
-col1, col2 = st.columns(2)
-with col1:
-    year = st.selectbox("Year", range(2024, 2025))
-with col2:
-    month = st.selectbox("Month", range(1, 13))
-
-data = st.session_state.finance_agent.load_monthly_data(year, month)
-if data["expenses"]:
-    df = pd.DataFrame(data["expenses"])
-    
-    # Monthly summary
-    total = df['amount'].sum()
-    st.markdown(f"### Total Expenses: ${total:,.2f}")
-    
-    # Category breakdown
-    fig = px.pie(df, values='amount', names='category', title="Expenses by Category")
-    st.plotly_chart(fig)
-    
-    # Expense table
-    with st.expander("📋 Detailed Expenses"):
-        st.dataframe(df)
-
-# Chat interface
-st.header("💬 Financial Assistant")
-with st.expander("ℹ️ Chat Help"):
+        return pd.DataFrame(self.ledger.year(year))
+
+    def get_month_totals(self, year: int, month: int) -> pd.DataFrame:
+        """Get month totals by category and subcategory"""
+        return pd.DataFrame(self.ledger.month_totals(year, month), columns=["category", "subcategory", "total", "count"])
+
+    def get_year_totals(self, year: int) -> pd.DataFrame:
+        """Get year totals by month and category"""
+        return pd.DataFrame(self.ledger.year_totals(year), columns=["month", "category", "total", "count"])
+
+
+def main():
+    """Streamlit UI (run with `streamlit run finance_tracker.py`)"""
+    # Dark theme styling
     st.markdown("""
-    Ask questions like:
-    - What are my highest expenses this month?
-    - Compare my spending between categories
-    - Show my savings progress
-    - Analyze my spending patterns
-    """)
-
-query = st.text_input("Ask about your finances...")
-if query:
-    with st.spinner("Analyzing..."):
-        response = st.session_state.finance_agent.query_expenses(query)
-        st.markdown(f"<div class='expense-block'>{response}</div>", unsafe_allow_html=True)
-
-# AI Insights
-st.header("🤖 AI Insights")
-if st.button("Generate Spending Insights"):
-    with st.spinner("Analyzing your spending patterns..."):
-        insights = st.session_state.finance_agent.get_spending_insights()
-        st.markdown(f"<div class='insights'>{insights}</div>", unsafe_allow_html=True)
-
-# Year Analysis
-if st.checkbox("📈 Show Yearly Analysis"):
-    yearly_data = st.session_state.finance_agent.get_year_summary(year)
-    if not yearly_data.empty:
-        st.header("Year Overview")
-        
-        # Monthly trend
-        monthly_trend = yearly_data.groupby('month')['amount'].sum()
-        fig = px.line(x=monthly_trend.index, y=monthly_trend.values,
-                     title="Monthly Expense Trend",
-                     labels={'x': 'Month', 'y': 'Total Expenses'})
-        st.plotly_chart(fig)
-        
-        # Category breakdown by month
-        pivot = pd.pivot_table(yearly_data, 
-                             values='amount',
-                             index='month',
-                             columns='category',
-                             aggfunc='sum',
-                             fill_value=0)
-        fig = px.bar(pivot, title="Monthly Expenses by Category", barmode='stack')
+        <style>
+        .stApp {
+            background-color: #1E1E1E;
+            color: #00FF00;
+        }
+        [data-testid="stHeader"] {
+            background-color: #000000;
+        }
+        .stButton>button {
+            background-color: #004400;
+            color: #00FF00;
+            border: 1px solid #00FF00;
+        }
+        .expense-block {
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin: 1rem 0;
+            border: 1px solid #00FF00;
+            background-color: #0A2A0A;
+        }
+        .data-block {
+            padding: 1rem;
+            border: 2px solid #00FF00;
+            border-radius: 0.5rem;
+            background-color: #0A2A0A;
+        }
+        .insights {
+            background-color: #0A2A0A;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            border: 1px solid #00FF00;
+            margin: 1rem 0;
+        }
+        </style>
+    """, unsafe_allow_html=True)
+
+    # Initialize session state
+    if 'finance_agent' not in st.session_state:
+        st.session_state.finance_agent = FinanceAgent()
+
+    st.title("💰 Financial Advisor")
+
+    # Sidebar for expense entry
+    with st.sidebar:
+        st.header("📝 Add Expense")
+
+        # PDF Upload
+        st.subheader("📄 Upload Bill")
+        uploaded_files = st.file_uploader("Upload PDF bills", type="pdf", accept_multiple_files=True)
+        if "bill_analyses" not in st.session_state:
+            st.session_state.bill_analyses = {}
+        if "failed_bills" not in st.session_state:
+            st.session_state.failed_bills = {}
+        if uploaded_files:
+            # Known bills (and bills that already failed in this session) are skipped before any LLM call
+            pending, failed, skipped = [], [], 0
+            for uploaded_file in uploaded_files:
+                content = uploaded_file.getvalue()
+                source_hash = file_hash(content)
+                if source_hash in st.session_state.failed_bills:
+                    failed.append(st.session_state.failed_bills[source_hash])
+                    continue
+                if st.session_state.finance_agent.ledger.has_source(source_hash):
+                    skipped += 1
+                else:
+                    pending.append((uploaded_file.name, source_hash, content))
+            if pending:
+                with st.spinner("Processing bills..."):
+                    status = pd.DataFrame({"Bill": [name for name, _, _ in pending], "Status": "extracting", "Detail": ""})
+                    status_table = st.empty()
+                    status_table.dataframe(status, hide_index=True)
+                    results = {}
+                    for index, state, result in st.session_state.finance_agent.process_bills([content for _, _, content in pending]):
+                        status.loc[index, "Status"] = state
+                        if state == "done":
+                            results[index] = result
+                            expense = result["expense"]
+                            status.loc[index, "Detail"] = f"{expense['category']} ${float(expense['amount']):,.2f} ({result['source']})"
+                        elif state == "failed":
+                            status.loc[index, "Detail"] = result
+                            st.session_state.failed_bills[pending[index][1]] = (pending[index][0], result)
+                            failed.append((pending[index][0], result))
+                        status_table.dataframe(status, hide_index=True)
+
+                    # One batched commit for every bill that succeeded
+                    done = sorted(results)
+                    st.session_state.finance_agent.add_expenses(
+                        [results[index]["expense"] for index in done], [pending[index][1] for index in done]
+                    )
+                    for index in done:
+                        name, source_hash, _ = pending[index]
+                        st.session_state.finance_agent.ledger.record_source(source_hash, name, 1)
+                        st.session_state.bill_analyses[source_hash] = (name, results[index])
+                    st.success(f"{len(done)} of {len(pending)} bill(s) processed!")
+            if skipped:
+                st.info(f"{skipped} bill(s) already imported were skipped.")
+            for name, error in failed:
+                st.warning(f"{name}: {error}")
+
+            for source_hash, (name, result) in st.session_state.bill_analyses.items():
+                insights = result["insights"]
+                with st.expander(f"📊 Bill Analysis: {name}"):
+                    if result["source"] == "llm" and st.button("✅ Extraction is correct, learn this layout", key=f"learn_{source_hash}"):
+                        if st.session_state.finance_agent.bill_templates.learn(result["text"], result["expense"]):
+                            st.success("Layout learned: bills like this one will be read without the LLM.")
+                        else:
+                            st.warning("Could not locate the amount and date in the bill text.")
+                    st.markdown(f"**Comparison:** {insights['comparison']}")
+                    st.markdown("**Savings Tips:**")
+                    for tip in insights['savings_tips']:
+                        st.markdown(f"- {tip}")
+                    if insights['warnings']:
+                        st.markdown("**⚠️ Warnings:**")
+                        for warning in insights['warnings']:
+                            st.markdown(f"- {warning}")
+
+        # Bulk Import
+        st.subheader("📥 Import Statements")
+        statement_files = st.file_uploader("Upload CSV/OFX statements", type=["csv", "ofx", "qfx"], accept_multiple_files=True)
+        if statement_files and st.button("📥 Import"):
+            with st.spinner("Importing statements..."):
+                imported, sources, files, errors, empty = [], [], [], [], []
+                for statement_file in statement_files:
+                    content = statement_file.getvalue()
+                    source_hash = file_hash(content)
+                    if st.session_state.finance_agent.ledger.has_source(source_hash):
+                        continue
+                    try:
+                        if statement_file.name.lower().endswith(".csv"):
+                            rows = st.session_state.finance_agent.parse_csv(content)
+                        else:
+                            rows = st.session_state.finance_agent.parse_ofx(content)
+                    except Exception as e:
+                        errors.append(f"{statement_file.name}: {e}")
+                        continue
+                    if not rows:
+                        # Not recorded as imported, so the file is not skipped as known next time
+                        empty.append(statement_file.name)
+                        continue
+                    # Row position keeps genuinely repeated rows of one statement apart
+                    imported.extend(rows)
+                    sources.extend(f"{source_hash}:{index}" for index in range(len(rows)))
+                    files.append((source_hash, statement_file.name, len(rows)))
+                count = st.session_state.finance_agent.add_expenses(imported, sources)
+                for source_hash, name, rows in files:
+                    st.session_state.finance_agent.ledger.record_source(source_hash, name, rows)
+            known = len(statement_files) - len(files) - len(errors) - len(empty)
+            st.success(f"{count} expense(s) imported, {known} known file(s) skipped.")
+            for error in errors:
+                st.error(f"Could not import {error}")
+            for name in empty:
+                st.warning(f"{name}: no debits found, nothing imported.")
+
+        # Manual Entry
+        st.subheader("✍️ Manual Entry")
+        category = st.selectbox("Category", list(st.session_state.finance_agent.categories.keys()))
+        subcategory = st.selectbox("Subcategory", st.session_state.finance_agent.categories[category])
+        amount = st.number_input("Amount", min_value=0.0, step=0.01)
+        date = st.date_input("Date")
+        description = st.text_area("Description")
+
+        if st.button("💾 Save Expense"):
+            expense = {
+                "category": category,
+                "subcategory": subcategory,
+                "amount": amount,
+                "date": date.isoformat(),
+                "description": description
+            }
+            if st.session_state.finance_agent.add_expense(expense):
+                st.success("Expense saved!")
+            else:
+                st.info("This expense is already recorded.")
+
+        with st.expander("🧹 Maintenance"):
+            if st.button("Deduplicate history"):
+                with st.spinner("Deduplicating..."):
+                    report = st.session_state.finance_agent.compact_history()
+                st.success(
+                    f"Removed {report['ledger_rows_removed']} duplicated expense(s) and {report['points_removed']} point(s); "
+                    f"re-keyed {report['points_rekeyed']} legacy point(s) and indexed {report['points_indexed']} missing one(s)."
+                )
+
+        embedding_stats = st.session_state.finance_agent.embedding_cache.stats
+        st.caption(
+            f"Embedding cache: {st.session_state.finance_agent.embedding_cache.hit_rate():.0%} hit rate "
+            f"({embedding_stats['memory_hits']} memory, {embedding_stats['disk_hits']} disk, {embedding_stats['misses']} computed)"
+        )
+
+    # Main interface - Monthly Overview
+    st.header("📊 Monthly Overview")
+    col1, col2 = st.columns(2)
+    with col1:
+        year = st.selectbox("Year", st.session_state.finance_agent.ledger.years() or [datetime.now().year])
+    with col2:
+        month = st.selectbox("Month", range(1, 13))
+
+    totals = st.session_state.finance_agent.get_month_totals(year, month)
+    if not totals.empty:
+        # Monthly summary
+        total = totals['total'].sum()
+        st.markdown(f"### Total Expenses: ${total:,.2f}")
+
+        # Category breakdown
+        fig = px.pie(totals, values='total', names='category', title="Expenses by Category")
         st.plotly_chart(fig)
 
-st.markdown("---")
-st.caption("🤖 Powered by DeepSeek-R1")
+        # Expense table
+        with st.expander("📋 Detailed Expenses"):
+            st.dataframe(pd.DataFrame(st.session_state.finance_agent.load_monthly_data(year, month)["expenses"]))
+
+    # Chat interface
+    st.header("💬 Financial Assistant")
+    with st.expander("ℹ️ Chat Help"):
+        st.markdown("""
+        Ask questions like:
+        - What are my highest expenses this month?
+        - Compare my spending between categories
+        - Show my savings progress
+        - Analyze my spending patterns
+        """)
+
+    query = st.text_input("Ask about your finances...")
+    if query:
+        with st.spinner("Analyzing..."):
+            response = st.session_state.finance_agent.query_expenses(query)
+            st.markdown(f"<div class='expense-block'>{response}</div>", unsafe_allow_html=True)
+
+    # AI Insights
+    st.header("🤖 AI Insights")
+    if st.button("Generate Spending Insights"):
+        with st.spinner("Analyzing your spending patterns..."):
+            insights = st.session_state.finance_agent.get_spending_insights()
+            st.markdown(f"<div class='insights'>{insights}</div>", unsafe_allow_html=True)
+
+    # Year Analysis
+    if st.checkbox("📈 Show Yearly Analysis"):
+        yearly_data = st.session_state.finance_agent.get_year_totals(year)
+        if not yearly_data.empty:
+            st.header("Year Overview")
+
+            # Monthly trend
+            monthly_trend = yearly_data.groupby('month')['total'].sum()
+            fig = px.line(x=monthly_trend.index, y=monthly_trend.values,
+                         title="Monthly Expense Trend",
+                         labels={'x': 'Month', 'y': 'Total Expenses'})
+            st.plotly_chart(fig)
+
+            # Category breakdown by month
+            pivot = pd.pivot_table(yearly_data, 
+                                 values='total',
+                                 index='month',
+                                 columns='category',
+                                 aggfunc='sum',
+                                 fill_value=0)
+            fig = px.bar(pivot, title="Monthly Expenses by Category", barmode='stack')
+            st.plotly_chart(fig)
+
+    st.markdown("---")
+    st.caption("🤖 Powered by DeepSeek-R1")
+
+
+if __name__ == "__main__":
+    main()
 
 # Install dependencies
 # cd /llm_apps/models/chat_with_deepseek/finance_agent_team/finance_tracker
 # pip install -r requirements.txt
 # Start Qdrant (if not running)
 # docker run -d -p 6333:6333 qdrant/qdrant
+# ...or use embedded Qdrant instead of Docker
+# export FINANCE_QDRANT_PATH=~/finance_history/qdrant
 # Run the app
 # streamlit run finance_tracker.py
\ No newline at end of file
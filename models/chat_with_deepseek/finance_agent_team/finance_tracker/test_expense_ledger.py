@@ -0,0 +1,69 @@
+"""ExpenseLedger: idempotent appends, totals, legacy upgrades and explicit deduplication."""
+import json
+import sqlite3
+
+import pytest
+
+# The app module needs its full runtime (streamlit, langchain, qdrant, PyMuPDF) to import
+finance_tracker = pytest.importorskip("finance_tracker")
+ExpenseLedger = finance_tracker.ExpenseLedger
+expense_id = finance_tracker.expense_id
+
+COFFEE = {"category": "Food", "subcategory": "Coffee", "amount": 3.5, "date": "2024-01-05", "description": "coffee"}
+
+
+def test_migrate_json_keeps_repeated_rows(tmp_path):
+    (tmp_path / "2024_01.json").write_text(json.dumps({"expenses": [COFFEE, COFFEE]}))
+    ledger = ExpenseLedger(tmp_path / "ledger.db")
+    assert ledger.migrate_json(tmp_path) == 2
+    assert len(ledger.month(2024, 1)) == 2
+    assert len(ledger.uids()) == 2
+    assert (tmp_path / "2024_01.json.migrated").exists()
+    # Only the explicit dedupe removes the repeat
+    assert ledger.dedupe() == 1
+    assert ledger.month_totals(2024, 1) == [{"category": "Food", "subcategory": "Coffee", "total": 3.5, "count": 1}]
+
+
+def test_append_is_idempotent_and_keeps_totals(tmp_path):
+    ledger = ExpenseLedger(tmp_path / "ledger.db")
+    lunch = dict(COFFEE, subcategory="Lunch", amount=12.0, description="lunch")
+    assert ledger.append([COFFEE, lunch]) == {expense_id(COFFEE), expense_id(lunch)}
+    # The same content without a source is the same expense
+    assert ledger.append([COFFEE]) == set()
+    assert sorted(ledger.month_totals(2024, 1), key=lambda row: row["subcategory"]) == [
+        {"category": "Food", "subcategory": "Coffee", "total": 3.5, "count": 1},
+        {"category": "Food", "subcategory": "Lunch", "total": 12.0, "count": 1},
+    ]
+    assert ledger.year_totals(2024) == [{"month": 1, "category": "Food", "total": 15.5, "count": 2}]
+    assert ledger.summarize({"min_amount": 10}) == {"total": 12.0, "count": 1}
+
+
+def test_rows_with_a_source_are_kept_by_dedupe(tmp_path):
+    ledger = ExpenseLedger(tmp_path / "ledger.db")
+    ledger.append([COFFEE, COFFEE], [expense_id(COFFEE, "manual:1"), expense_id(COFFEE, "manual:2")])
+    ledger.append([COFFEE])
+    assert ledger.dedupe() == 1
+    assert len(ledger.month(2024, 1)) == 2
+    assert ledger.month_totals(2024, 1)[0]["count"] == 2
+
+
+def test_legacy_ledger_upgrade_keeps_repeated_rows(tmp_path):
+    path = tmp_path / "ledger.db"
+    # Schema of ledgers created before expenses had ids and totals were kept
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, year INTEGER NOT NULL, month INTEGER NOT NULL, "
+        "date TEXT NOT NULL, category TEXT NOT NULL, subcategory TEXT, amount REAL NOT NULL, description TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO expenses (year, month, date, category, subcategory, amount, description) VALUES (2024, 1, ?, ?, ?, ?, ?)",
+        [(COFFEE["date"], COFFEE["category"], COFFEE["subcategory"], COFFEE["amount"], COFFEE["description"])] * 2
+    )
+    conn.commit()
+    conn.close()
+
+    ledger = ExpenseLedger(path)
+    assert len(ledger.uids()) == 2
+    assert ledger.month_totals(2024, 1) == [{"category": "Food", "subcategory": "Coffee", "total": 7.0, "count": 2}]
+    assert ledger.dedupe() == 1
+    assert ledger.month_totals(2024, 1)[0]["count"] == 1
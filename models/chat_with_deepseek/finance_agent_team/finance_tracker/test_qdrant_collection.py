@@ -0,0 +1,25 @@
+"""ensure_expenses_collection on new, existing and named-vector collections (embedded Qdrant)."""
+import pytest
+
+finance_tracker = pytest.importorskip("finance_tracker")
+from qdrant_client import QdrantClient, models  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return QdrantClient(location=":memory:")
+
+
+def test_creates_then_leaves_collection_alone(client):
+    finance_tracker.ensure_expenses_collection(client)
+    finance_tracker.ensure_expenses_collection(client)
+    params = client.get_collection(finance_tracker.EXPENSES_COLLECTION).config.params
+    assert params.vectors.size == finance_tracker.EMBEDDING_DIM
+
+
+def test_existing_collection_with_named_vectors(client):
+    client.create_collection(
+        finance_tracker.EXPENSES_COLLECTION,
+        vectors_config={"text": models.VectorParams(size=finance_tracker.EMBEDDING_DIM, distance=models.Distance.COSINE)},
+    )
+    finance_tracker.ensure_expenses_collection(client)
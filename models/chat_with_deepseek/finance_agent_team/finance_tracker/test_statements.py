@@ -0,0 +1,38 @@
+"""Statement parsing: only debits become expenses."""
+import pytest
+
+finance_tracker = pytest.importorskip("finance_tracker")
+# The parsers do not use the agent's models
+parse_csv = finance_tracker.FinanceAgent.parse_csv
+parse_ofx = finance_tracker.FinanceAgent.parse_ofx
+
+
+def test_csv_keeps_negative_amounts_with_thousands_separators():
+    rows = parse_csv(None, b'Date,Amount,Description\n2024-01-02,"-1,234.56",Rent\n2024-01-03,2500,Salary\n2024-01-04,(12.00),Fee\n')
+    assert [(row["description"], row["amount"]) for row in rows] == [("Rent", 1234.56), ("Fee", 12.0)]
+    assert rows[0]["date"] == "2024-01-02"
+
+
+def test_csv_type_column_selects_debits():
+    rows = parse_csv(None, b"date,amount,description,type\n2024-01-02,50,Shop,DEBIT\n2024-01-03,2500,Salary,credit\n")
+    assert [(row["description"], row["amount"]) for row in rows] == [("Shop", 50.0)]
+
+
+def test_csv_with_only_positive_amounts_is_rejected():
+    with pytest.raises(ValueError, match="debits from credits"):
+        parse_csv(None, b"date,amount,description\n2024-01-02,50,Shop\n")
+
+
+def test_csv_missing_columns():
+    with pytest.raises(ValueError, match="missing columns"):
+        parse_csv(None, b"date,amount\n2024-01-02,-5\n")
+
+
+def test_ofx_skips_credits():
+    ofx = (b"<OFX><BANKTRANLIST>"
+           b"<STMTTRN><TRNAMT>-20.50<DTPOSTED>20240105<NAME>Grocer</STMTTRN>"
+           b"<STMTTRN><TRNAMT>1000<DTPOSTED>20240106<NAME>Salary</STMTTRN>"
+           b"</BANKTRANLIST></OFX>")
+    assert parse_ofx(None, ofx) == [{
+        "category": "Others", "subcategory": "Miscellaneous", "amount": 20.5, "date": "2024-01-05", "description": "Grocer",
+    }]